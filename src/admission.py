@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Admission control for chat turns.
+
+Nothing used to bound how many turns called Grok at once: a traffic
+spike took every server thread, ran into upstream rate limits, and sent
+every interview down the fallback path at the same time. Now a turn
+needs one of ACE_ADMISSION_LIMIT slots while it talks to upstream. When
+they are all taken it waits in a bounded FIFO queue for up to
+ACE_ADMISSION_WAIT seconds; a full queue, or a wait that runs out, is
+answered right away with 429 and a Retry-After estimated from how long
+turns hold their slots.
+
+Interviews already in progress come first: a new interview (the
+/api/chat/init that starts it) is only admitted while a slot is free, so
+under load the capacity goes to candidates mid-interview and newcomers
+are asked to come back shortly. Slots are per process.
+"""
+
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, Dict
+
+from metrics import Counter, Histogram, register_gauge, registry
+
+ADMISSION_LIMIT = int(os.getenv('ACE_ADMISSION_LIMIT', '64'))  # turns talking to upstream at once (0 = unlimited)
+ADMISSION_QUEUE = int(os.getenv('ACE_ADMISSION_QUEUE', '128'))  # turns waiting for a slot before more are refused
+ADMISSION_WAIT = float(os.getenv('ACE_ADMISSION_WAIT', '10'))  # seconds a queued turn waits before it is refused
+MAX_RETRY_AFTER = 60  # seconds; upper bound of the Retry-After hint
+HOLD_SMOOTHING = 0.1  # weight of the latest turn in the average slot hold time
+
+admission_wait = registry.register(Histogram(
+    'ace_admission_wait_seconds', 'Time admitted chat turns waited for an upstream slot.'))
+admission_rejected = registry.register(Counter(
+    'ace_admission_rejected_total', 'Requests refused with 429, by kind (turn, interview) and reason.',
+    ('kind', 'reason')))
+
+
+class Overloaded(Exception):
+    """No upstream capacity for the request; retry after retry_after seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ('granted', 'wake')
+
+    def __init__(self, wake: Callable[[], None]):
+        self.granted = False  # set when a finishing turn hands its slot over
+        self.wake = wake
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdmissionControl:
+    """Upstream slots for chat turns, with a bounded queue of turns waiting for one."""
+
+    def __init__(self, limit: int = ADMISSION_LIMIT, queue_max: int = ADMISSION_QUEUE, wait: float = ADMISSION_WAIT):
+        self.limit = limit
+        self.queue_max = queue_max
+        self.wait = wait
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self._waiters: deque = deque()
+        self._hold_seconds = 0.0  # smoothed time a turn keeps its slot
+        self.admitted = 0
+        self.queued = 0
+        self.rejected: Dict[str, int] = {}
+
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to be free for a request arriving now."""
+        if self.limit <= 0:
+            return 1
+        rounds = (len(self._waiters) + self.limit) / self.limit
+        return max(1, min(MAX_RETRY_AFTER, math.ceil(rounds * self._hold_seconds)))
+
+    def _reject(self, kind: str, reason: str, message: str) -> Overloaded:
+        with self._lock:
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        admission_rejected.labels(kind, reason).inc()
+        return Overloaded(message, self.retry_after())
+
+    def admit_interview(self):
+        """Let a new interview start, or raise Overloaded while no slot is free."""
+        if self.limit > 0 and (self.in_flight >= self.limit or self._waiters):
+            raise self._reject('interview', 'saturated',
+                               "The interviewer is busy with other candidates right now; please try again shortly")
+
+    def check_room(self):
+        """Raise Overloaded if a turn arriving now would be refused outright.
+
+        For streamed replies, whose status is sent before the turn gets its slot.
+        """
+        if self.limit > 0 and self.in_flight >= self.limit and len(self._waiters) >= self.queue_max:
+            raise self._reject('turn', 'queue_full', "Too many messages are waiting to be answered; please retry shortly")
+
+    def _enter(self, waiter: _Waiter) -> bool:
+        """Take a free slot (True) or join the queue (False); raises Overloaded if the queue is full."""
+        with self._lock:
+            if self.limit <= 0 or (self.in_flight < self.limit and not self._waiters):
+                self.in_flight += 1
+                self.admitted += 1
+                return True
+            if len(self._waiters) >= self.queue_max:
+                full = True
+            else:
+                full = False
+                self._waiters.append(waiter)
+                self.queued += 1
+        if full:
+            raise self._reject('turn', 'queue_full', "Too many messages are waiting to be answered; please retry shortly")
+        return False
+
+    def _give_up(self, waiter: _Waiter) -> bool:
+        """Leave the queue after a timeout or cancellation; False if a slot was handed over meanwhile."""
+        with self._lock:
+            if waiter.granted:
+                return False
+            self._waiters.remove(waiter)
+            return True
+
+    def _release(self, held: float):
+        with self._lock:
+            self._hold_seconds += HOLD_SMOOTHING * (held - self._hold_seconds)
+            if self._waiters:
+                # Hand the slot straight to the longest waiting turn
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                self.admitted += 1
+                waiter.wake()
+            else:
+                self.in_flight -= 1
+
+    @contextmanager
+    def slot(self):
+        """Run the block with an upstream slot (raises Overloaded if none comes free in time)."""
+        started = time.perf_counter()
+        event = threading.Event()
+        waiter = _Waiter(event.set)
+        if not self._enter(waiter):
+            if not event.wait(self.wait) and self._give_up(waiter):
+                raise self._reject('turn', 'timeout', "No capacity to answer this message in time; please retry shortly")
+        admitted = time.perf_counter()
+        admission_wait.observe(admitted - started)
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - admitted)
+
+    @asynccontextmanager
+    async def slot_async(self):
+        """Non-blocking version of slot for the asyncio serving path."""
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = _Waiter(lambda: loop.call_soon_threadsafe(_resolve, future))
+        if not self._enter(waiter):
+            # Not wait_for: it swallows a cancellation that arrives just after the slot is handed over
+            try:
+                done, _ = await asyncio.wait((future,), timeout=self.wait)
+            except asyncio.CancelledError:
+                if not self._give_up(waiter):
+                    self._release(0.0)
+                raise
+            if not done and self._give_up(waiter):
+                raise self._reject('turn', 'timeout', "No capacity to answer this message in time; please retry shortly")
+        admitted = time.perf_counter()
+        admission_wait.observe(admitted - started)
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - admitted)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "queue_max": self.queue_max,
+                "wait_seconds": self.wait,
+                "in_flight": self.in_flight,
+                "queue_depth": len(self._waiters),
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "rejected": dict(self.rejected),
+                "avg_hold_seconds": round(self._hold_seconds, 3),
+                "retry_after": self.retry_after(),
+            }
+
+
+admission = AdmissionControl()
+
+register_gauge('ace_admission_in_flight', 'Chat turns holding an upstream slot.', lambda: admission.in_flight)
+register_gauge('ace_admission_queue_depth', 'Chat turns waiting for an upstream slot.', admission.queue_depth)
+
+
+def _reset_after_fork():
+    admission._lock = threading.Lock()
+    admission.in_flight = 0
+    admission._waiters = deque()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
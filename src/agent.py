@@ -4,12 +4,29 @@ Interview Agent for Anthropic AE Interview Simulation
 """
 
 import os
-import requests
-from typing import List, Dict, Optional
-
-# Grok API configuration
-GROK_API_KEY = os.getenv('GROK_API_KEY')
-GROK_API_URL = 'https://api.x.ai/v1/chat/completions'
+import time
+from typing import AsyncIterator, List, Dict, Iterator, Optional, Tuple
+
+from compaction import ConversationCompactor
+from message_buffer import MessageBuffer, Prefix, PreparedMessages
+from metrics import fallback_responses
+from profiling import span
+from providers import chunk_text, get_provider
+from response_cache import context_fingerprint, response_cache, scenario_id
+from retrieval import TranscriptIndex
+from router import UpstreamError
+from speculation import speculator
+from stages import STAGES_BY_NAME, StageMachine
+from usage import SALES_MANAGER, SOLUTION_ARCHITECT, add_to_totals, empty_totals, summarize_totals, turn_record, usage_tracker
+
+# Bump when the shape of InterviewAgent.to_dict() changes
+STATE_VERSION = 2
+
+# Solution Architect messages kept (older exchanges are reached through the transcript index)
+SA_HISTORY_MESSAGES = int(os.getenv('ACE_SA_HISTORY_MESSAGES', '12'))
+
+# First history entry of every interview; it only marks the start and is never sent upstream
+START_MESSAGE = "Start the interview simulation."
 
 SYSTEM_PROMPT = """Role & context
 You are Alex, Sales Manager for the Digital Native Business segment at Anthropic.
@@ -158,6 +175,31 @@ Before we proceed with the email exercise, I need you to do some research first.
 Take your time to research and provide the top 2 objectives, explain why you chose them in relation to Anthropic, and include your sources."""
 
 
+class Turn:
+    """One candidate message on its way to an upstream reply.
+    
+    Built by an agent's _start_turn (with reply already set when it is
+    answered without an upstream call), filled in by the transport call of
+    the get/stream variant, and closed by _finish_turn, which sets reply.
+    """
+    
+    __slots__ = ('user_message', 'streamed', 'parts', 'reply', 'messages', 'meta', 'started', 'cache_context', 'error')
+    
+    def __init__(self, user_message: str, streamed: bool = False):
+        self.user_message = user_message
+        self.streamed = streamed
+        self.parts: List[str] = []  # reply text received from upstream (streamed deltas, or the whole reply)
+        self.reply: Optional[str] = None  # the whole reply the candidate gets
+    
+    def begin(self, messages: PreparedMessages, cache_context: Optional[str] = None):
+        """Set the upstream request, just before it is sent (mock and cached turns never get here)."""
+        self.messages = messages
+        self.meta: Dict = {}  # filled in by the provider
+        self.started = time.monotonic()
+        self.cache_context = cache_context  # context_fingerprint to share a complete reply under (None = not shared)
+        self.error: Optional[Exception] = None  # why the upstream call failed
+
+
 class PartnerSolutionArchitect:
     """Agent that simulates a Partner Solution Architect at Anthropic."""
     
@@ -178,102 +220,189 @@ You are helpful, technical, and provide detailed but clear explanations. You und
 
 When an AE asks you questions, provide specific, actionable technical information that will help them strengthen their customer outreach."""
     
-    def __init__(self):
+    # The Solution Architect only ever answers in its own interview stage
+    STAGE = STAGES_BY_NAME['solution_architect']
+    
+    # Response cache key parts: answers are shared across candidates for the same scenario and stage
+    SCENARIO_ID = scenario_id(SOLUTION_ARCHITECT_PROMPT)
+    
+    # Sent first in every request, encoded once
+    PREFIX = Prefix([{"role": "system", "content": SOLUTION_ARCHITECT_PROMPT}])
+    
+    def __init__(self, session_id: Optional[str] = None):
         """Initialize the Solution Architect agent."""
-        self.api_key = GROK_API_KEY
-        self.api_url = GROK_API_URL
+        self.provider = get_provider()  # Where replies come from (mock replies while it is not available)
+        self.session_id = session_id  # Only used to label usage records
         self.conversation_history: List[Dict] = []
         self.initialized = False
+        self.compactor = ConversationCompactor()  # Keeps each request within the token budget
+        self.message_buffer = MessageBuffer(self.PREFIX)  # Encoded history, extended as it grows
+        self.usage = empty_totals()  # Upstream token/payload totals for this session
+    
+    def to_dict(self) -> Dict:
+        """Serialize the conversation state (for external session stores)."""
+        return {
+            "conversation_history": self.conversation_history,
+            "initialized": self.initialized,
+            "usage": self.usage
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict, session_id: Optional[str] = None) -> 'PartnerSolutionArchitect':
+        """Rebuild a Solution Architect from to_dict() output."""
+        agent = cls(session_id)
+        agent.conversation_history = list(data.get("conversation_history", []))
+        agent.initialized = bool(data.get("initialized", False))
+        agent.usage.update(data.get("usage", {}))
+        return agent
     
-    def get_response(self, user_message: str, context: str = "") -> str:
+    def get_response(self, user_message: str, context: str = "", use_cache: bool = True) -> str:
         """Get Solution Architect response to user message."""
-        # Add user message to history
+        turn = self._start_turn(user_message, context, use_cache)
+        if turn.reply is None:
+            try:
+                turn.parts.append(self.provider.complete(turn.messages, turn.meta, self.STAGE.generation(), SOLUTION_ARCHITECT))
+            except Exception as e:
+                self._upstream_failed(turn, e)
+            self._finish_turn(turn)
+        return turn.reply
+    
+    async def get_response_async(self, user_message: str, context: str = "", use_cache: bool = True) -> str:
+        """Non-blocking version of get_response for the asyncio serving path."""
+        turn = self._start_turn(user_message, context, use_cache)
+        if turn.reply is None:
+            try:
+                turn.parts.append(await self.provider.complete_async(turn.messages, turn.meta, self.STAGE.generation(), SOLUTION_ARCHITECT))
+            except Exception as e:
+                self._upstream_failed(turn, e)
+            self._finish_turn(turn)
+        return turn.reply
+    
+    def stream_response(self, user_message: str, context: str = "", use_cache: bool = True) -> Iterator[str]:
+        """Stream the Solution Architect response to user message in chunks."""
+        turn = self._start_turn(user_message, context, use_cache, streamed=True)
+        if turn.reply is None:
+            try:
+                for delta in self.provider.stream(turn.messages, turn.meta, self.STAGE.generation(), SOLUTION_ARCHITECT):
+                    turn.parts.append(delta)
+                    yield delta
+            except Exception as e:
+                self._upstream_failed(turn, e)
+            self._finish_turn(turn)
+        # Mock, cached and fallback replies were not streamed from upstream
+        if not turn.parts:
+            yield from chunk_text(turn.reply)
+    
+    async def stream_response_async(self, user_message: str, context: str = "", use_cache: bool = True) -> AsyncIterator[str]:
+        """Non-blocking version of stream_response for the asyncio serving path."""
+        turn = self._start_turn(user_message, context, use_cache, streamed=True)
+        if turn.reply is None:
+            try:
+                async for delta in self.provider.stream_async(turn.messages, turn.meta, self.STAGE.generation(), SOLUTION_ARCHITECT):
+                    turn.parts.append(delta)
+                    yield delta
+            except Exception as e:
+                self._upstream_failed(turn, e)
+            self._finish_turn(turn)
+        if not turn.parts:
+            for chunk in chunk_text(turn.reply):
+                yield chunk
+    
+    def _start_turn(self, user_message: str, context: str, use_cache: bool, streamed: bool = False) -> Turn:
+        """Add the user message to history, and answer it from the mock or the cache, or build its request."""
+        turn = Turn(user_message, streamed)
+        self._add_user_message(user_message)
+        
+        # Without a provider (no API key), return a mock response
+        if not self.provider.available:
+            turn.reply = self._get_mock_response(user_message)
+            return turn
+        
+        cache_context = None
+        if response_cache.cacheable(user_message, use_cache):
+            # The answer depends on the earlier turns and the retrieved context as well as the question
+            cache_context = context_fingerprint(self.conversation_history[:-1], context)
+            cached = self._cached_response(user_message, cache_context)
+            if cached is not None:
+                self._record_response(cached)
+                turn.reply = cached
+                return turn
+        
+        turn.begin(self._build_messages(context), cache_context)
+        return turn
+    
+    def _upstream_failed(self, turn: Turn, error: Exception):
+        """Log and count an upstream call that raised."""
+        turn.error = error
+        if isinstance(error, UpstreamError):
+            print(f"Solution Architect API Error: {str(error)}")
+            fallback_responses.labels(SOLUTION_ARCHITECT, 'upstream_error').inc()
+        else:
+            print(f"Exception in Solution Architect response: {str(error)}")
+            fallback_responses.labels(SOLUTION_ARCHITECT, 'exception').inc()
+    
+    def _finish_turn(self, turn: Turn):
+        """Record what came back from upstream, or fall back to a mock response if nothing did."""
+        if not turn.parts:
+            turn.reply = self._get_mock_response(turn.user_message)
+            # The upstream answered (with an error), so the request still counts
+            if isinstance(turn.error, UpstreamError):
+                self._record_usage(turn.messages, turn.reply, turn.meta, turn.started, turn.streamed)
+            return
+        
+        turn.reply = "".join(turn.parts)
+        self._record_response(turn.reply)
+        self._record_usage(turn.messages, turn.reply, turn.meta, turn.started, turn.streamed)
+        # A stream cut off mid-way, or a reply that ran into max_tokens, must not be served to later candidates
+        if turn.cache_context is not None and not turn.meta.get("truncated") and turn.meta.get("finish_reason") != "length":
+            self._cache_response(turn.user_message, turn.cache_context, turn.reply)
+    
+    def _add_user_message(self, user_message: str):
+        """Add user message to history (after dropping the oldest messages if it is full)."""
+        self._trim_history()
         self.conversation_history.append({
             "role": "user",
             "content": user_message
         })
-        
-        # If no API key, return a mock response
-        if not self.api_key:
-            return self._get_mock_response(user_message)
-        
-        try:
-            # Prepare messages for Grok API
-            messages = []
-            
-            # Add system prompt
-            messages.append({
-                "role": "system",
-                "content": self.SOLUTION_ARCHITECT_PROMPT
-            })
-            
-            # Add context if provided
-            if context:
-                messages.append({
-                    "role": "user",
-                    "content": f"Context: {context}"
-                })
-            
-            # Add conversation history
-            for msg in self.conversation_history:
-                messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
-            
-            # Call Grok API
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            models_to_try = ["grok-2-1212", "grok-2", "grok-beta"]
-            last_error = None
-            
-            for model in models_to_try:
-                try:
-                    payload = {
-                        "model": model,
-                        "messages": messages,
-                        "max_tokens": 2048,
-                        "temperature": 0.7
-                    }
-                    
-                    response = requests.post(
-                        self.api_url,
-                        headers=headers,
-                        json=payload,
-                        timeout=30
-                    )
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        response_text = data["choices"][0]["message"]["content"]
-                        
-                        # Add assistant response to history
-                        self.conversation_history.append({
-                            "role": "assistant",
-                            "content": response_text
-                        })
-                        
-                        return response_text
-                    else:
-                        error_text = response.text[:500]
-                        last_error = f"Status {response.status_code}: {error_text}"
-                        continue
-                            
-                except requests.exceptions.RequestException as e:
-                    last_error = str(e)
-                    continue
-            
-            # Fall back to mock response
-            if last_error:
-                print(f"Solution Architect API Error: {last_error}")
-            return self._get_mock_response(user_message)
-            
-        except Exception as e:
-            print(f"Exception in Solution Architect get_response: {str(e)}")
-            return self._get_mock_response(user_message)
+    
+    def _trim_history(self):
+        """Keep the history under SA_HISTORY_MESSAGES: once it is full, drop its older half."""
+        history = self.conversation_history
+        if SA_HISTORY_MESSAGES <= 0 or len(history) < SA_HISTORY_MESSAGES:
+            return
+        # Half at once rather than one message per turn, so the requests in between keep a stable prefix
+        start = len(history) - SA_HISTORY_MESSAGES // 2
+        while start < len(history) and history[start]["role"] != "user":
+            start += 1
+        del history[:start]
+    
+    def _record_response(self, response_text: str):
+        """Add assistant response to history."""
+        self.conversation_history.append({
+            "role": "assistant",
+            "content": response_text
+        })
+    
+    def _cached_response(self, user_message: str, cache_context: str) -> Optional[str]:
+        """Look up a shared answer to this question, asked in this context, in the response cache."""
+        return response_cache.get(self.SCENARIO_ID, self.STAGE.name, SOLUTION_ARCHITECT, cache_context, user_message)
+    
+    def _cache_response(self, user_message: str, cache_context: str, response_text: str):
+        """Share a successful upstream answer with later candidates asking the same question in the same context."""
+        response_cache.put(self.SCENARIO_ID, self.STAGE.name, SOLUTION_ARCHITECT, cache_context, user_message, response_text)
+    
+    def _record_usage(self, messages: PreparedMessages, response_text: str, meta: Dict, started: float, streamed: bool = False):
+        """Account one upstream turn in the session totals and the process-wide usage tracker."""
+        record = turn_record(self.session_id, SOLUTION_ARCHITECT, messages, response_text, meta, started, streamed, self.STAGE.name)
+        add_to_totals(self.usage, record)
+        usage_tracker.record(record)
+    
+    def _build_messages(self, context: str = "") -> PreparedMessages:
+        """Build the Grok message list: system prompt, (compacted) history, with the context just before the question."""
+        # The context changes every turn, so it goes at the end to keep the rest a stable prefix across turns
+        extra = {"role": "user", "content": f"Context: {context}"} if context else None
+        with span('history'):
+            return self.message_buffer.build(self.conversation_history, self.compactor, extra)
     
     def _get_mock_response(self, user_message: str) -> str:
         """Return a mock response for the Solution Architect."""
@@ -385,15 +514,73 @@ What would be most helpful?"""
 class InterviewAgent:
     """Agent that conducts the Anthropic AE interview simulation."""
     
-    def __init__(self):
+    # Sent first in every request, encoded once
+    PREFIX = Prefix([{"role": "system", "content": SYSTEM_PROMPT}])
+    
+    def __init__(self, session_id: Optional[str] = None):
         """Initialize the interview agent."""
-        self.api_key = GROK_API_KEY
-        self.api_url = GROK_API_URL
+        self.provider = get_provider()  # Where replies come from (mock replies while it is not available)
+        self.session_id = session_id  # Only used to label usage records
         self.conversation_history: List[Dict] = []
         self.initialized = False
-        self.solution_architect = PartnerSolutionArchitect()  # Initialize Solution Architect as part of the agent
-        self.using_solution_architect = False  # Track if currently using Solution Architect
+        self.solution_architect = PartnerSolutionArchitect(session_id)  # Initialize Solution Architect as part of the agent
+        self.stages = StageMachine()  # Where the candidate is in the simulation
+        self.compactor = ConversationCompactor()  # Keeps each request within the token budget
+        self.message_buffer = MessageBuffer(self.PREFIX, skip=START_MESSAGE)  # Encoded history, extended as it grows
+        self.usage = empty_totals()  # Upstream token/payload totals for this session (Sales Manager turns)
+        self.transcript_index = TranscriptIndex(skip=START_MESSAGE)  # Finds earlier turns relevant to Solution Architect questions
         
+    def to_dict(self) -> Dict:
+        """Serialize the interview state (for external session stores)."""
+        return {
+            "version": STATE_VERSION,
+            "session_id": self.session_id,
+            "conversation_history": self.conversation_history,
+            "initialized": self.initialized,
+            "stages": self.stages.to_dict(),
+            "solution_architect": self.solution_architect.to_dict(),
+            "usage": self.usage
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'InterviewAgent':
+        """Rebuild an interview agent from to_dict() output."""
+        agent = cls(data.get("session_id"))
+        agent.conversation_history = list(data.get("conversation_history", []))
+        agent.initialized = bool(data.get("initialized", False))
+        if "stages" in data:
+            agent.stages = StageMachine.from_dict(data["stages"])
+        elif data.get("using_solution_architect"):
+            # Version 1 state only recorded whether the Solution Architect had the conversation
+            agent.stages = StageMachine('solution_architect')
+        agent.solution_architect = PartnerSolutionArchitect.from_dict(data.get("solution_architect", {}), agent.session_id)
+        agent.usage.update(data.get("usage", {}))
+        return agent
+    
+    @property
+    def using_solution_architect(self) -> bool:
+        """Whether the Solution Architect currently has the conversation."""
+        return self.stages.current.agent == SOLUTION_ARCHITECT
+    
+    def answers_as_solution_architect(self, user_message: str) -> bool:
+        """Whether the Solution Architect will answer this message (checked before the turn runs)."""
+        if not self.initialized:
+            return False
+        return self.stages.peek(user_message).agent == SOLUTION_ARCHITECT
+    
+    def usage_summary(self) -> Dict:
+        """Upstream token and payload totals for this interview, per agent and combined."""
+        total = empty_totals()
+        for totals in (self.usage, self.solution_architect.usage):
+            for field in total:
+                total[field] += totals.get(field, 0)
+        return {
+            "session_id": self.session_id,
+            SALES_MANAGER: summarize_totals(self.usage),
+            SOLUTION_ARCHITECT: summarize_totals(self.solution_architect.usage),
+            "total": summarize_totals(total)
+        }
+    
     def initialize(self) -> str:
         """Initialize the interview and return the first message."""
         if self.initialized:
@@ -402,150 +589,223 @@ class InterviewAgent:
         self.conversation_history = [
             {
                 "role": "user",
-                "content": "Start the interview simulation."
+                "content": START_MESSAGE
             }
         ]
         self.initialized = True
+        self.stages = StageMachine()
+        self.stages.start()
         return FIRST_MESSAGE
     
-    def get_response(self, user_message: str) -> str:
+    def get_response(self, user_message: str, use_cache: bool = True) -> str:
         """Get agent response to user message."""
+        self._begin_turn(user_message)
+        
+        # Check if we should delegate to Solution Architect
+        # This happens after the agent has connected them
+        if self.using_solution_architect:
+            with span('delegation'):
+                response = self.solution_architect.get_response(user_message, self._solution_architect_context(user_message), use_cache)
+            self._record_solution_architect_response(response)
+            return response
+        
+        turn = self._start_turn(user_message)
+        if turn.reply is None:
+            try:
+                turn.parts.append(self.provider.complete(turn.messages, turn.meta, self.stages.current.generation()))
+            except Exception as e:
+                self._upstream_failed(turn, e)
+            self._finish_turn(turn)
+        return turn.reply
+    
+    async def get_response_async(self, user_message: str, use_cache: bool = True) -> str:
+        """Non-blocking version of get_response for the asyncio serving path."""
+        self._begin_turn(user_message)
+        
+        if self.using_solution_architect:
+            with span('delegation'):
+                response = await self.solution_architect.get_response_async(user_message, self._solution_architect_context(user_message), use_cache)
+            self._record_solution_architect_response(response)
+            return response
+        
+        turn = self._start_turn(user_message)
+        if turn.reply is None:
+            try:
+                turn.parts.append(await self.provider.complete_async(turn.messages, turn.meta, self.stages.current.generation()))
+            except Exception as e:
+                self._upstream_failed(turn, e)
+            self._finish_turn(turn)
+        return turn.reply
+    
+    def stream_response(self, user_message: str, use_cache: bool = True) -> Iterator[str]:
+        """Stream the agent response to user message in chunks as it is generated."""
+        self._begin_turn(user_message)
+        
+        if self.using_solution_architect:
+            parts = []
+            for delta in self.solution_architect.stream_response(user_message, self._solution_architect_context(user_message), use_cache):
+                parts.append(delta)
+                yield delta
+            self._record_solution_architect_response("".join(parts))
+            return
+        
+        turn = self._start_turn(user_message, streamed=True)
+        if turn.reply is None:
+            try:
+                for delta in self.provider.stream(turn.messages, turn.meta, self.stages.current.generation()):
+                    turn.parts.append(delta)
+                    yield delta
+            except Exception as e:
+                self._upstream_failed(turn, e)
+            self._finish_turn(turn)
+        # Mock and fallback replies were not streamed from upstream
+        if not turn.parts:
+            yield from chunk_text(turn.reply)
+    
+    async def stream_response_async(self, user_message: str, use_cache: bool = True) -> AsyncIterator[str]:
+        """Non-blocking version of stream_response for the asyncio serving path."""
+        self._begin_turn(user_message)
+        
+        if self.using_solution_architect:
+            parts = []
+            async for delta in self.solution_architect.stream_response_async(user_message, self._solution_architect_context(user_message), use_cache):
+                parts.append(delta)
+                yield delta
+            self._record_solution_architect_response("".join(parts))
+            return
+        
+        turn = self._start_turn(user_message, streamed=True)
+        if turn.reply is None:
+            try:
+                async for delta in self.provider.stream_async(turn.messages, turn.meta, self.stages.current.generation()):
+                    turn.parts.append(delta)
+                    yield delta
+            except Exception as e:
+                self._upstream_failed(turn, e)
+            self._finish_turn(turn)
+        if not turn.parts:
+            for chunk in chunk_text(turn.reply):
+                yield chunk
+    
+    def speculative_request(self, user_message: str) -> Tuple[str, PreparedMessages, Dict]:
+        """The upstream request the next turn would send for user_message: (agent, messages, generation).
+        
+        Only for a copy of the interview (see speculation.py): the message is
+        added to its history, but the stage is only peeked at, so the stage
+        statistics are left alone.
+        """
+        stage = self.stages.peek(user_message)
+        self.conversation_history.append({
+            "role": "user",
+            "content": user_message
+        })
+        if stage.agent == SOLUTION_ARCHITECT:
+            context = self._solution_architect_context(user_message)
+            self.solution_architect._add_user_message(user_message)
+            return SOLUTION_ARCHITECT, self.solution_architect._build_messages(context), self.solution_architect.STAGE.generation()
+        return SALES_MANAGER, self._build_messages(), stage.generation()
+    
+    def _begin_turn(self, user_message: str):
+        """Make sure the interview is started, add the user message to history and advance the stage."""
         if not self.initialized:
             self.initialize()
         
-        # Add user message to history
         self.conversation_history.append({
             "role": "user",
             "content": user_message
         })
+        speculator.observe(self.stages, user_message)
+        # May hand the conversation back from the Solution Architect before it is answered
+        self.stages.on_message(user_message)
+    
+    def _start_turn(self, user_message: str, streamed: bool = False) -> Turn:
+        """Answer a Sales Manager turn from the mock, or build its request."""
+        turn = Turn(user_message, streamed)
+        # Without a provider (no API key), return a mock response for development
+        if not self.provider.available:
+            turn.reply = self._get_mock_response(user_message)
+        else:
+            turn.begin(self._build_messages())
+        return turn
+    
+    def _upstream_failed(self, turn: Turn, error: Exception):
+        """Log and count an upstream call that raised."""
+        turn.error = error
+        if isinstance(error, UpstreamError):
+            print(f"Grok API Error: {str(error)}")
+            fallback_responses.labels(SALES_MANAGER, 'upstream_error').inc()
+        else:
+            print(f"Exception in Sales Manager response: {str(error)}")
+            fallback_responses.labels(SALES_MANAGER, 'exception').inc()
+    
+    def _finish_turn(self, turn: Turn):
+        """Record what came back from upstream, or fall back to a mock response so the interview can continue."""
+        if not turn.parts:
+            turn.reply = self._get_mock_response(turn.user_message)
+            # The upstream answered (with an error), so the request still counts, and the candidate is told
+            if isinstance(turn.error, UpstreamError):
+                turn.reply += self._fallback_note(str(turn.error))
+                self._record_usage(turn.messages, turn.reply, turn.meta, turn.started, turn.streamed)
+            return
         
-        # Check if we should delegate to Solution Architect
-        # This happens after the agent has connected them
-        if self.using_solution_architect:
-            # Get context from interview conversation
-            context = ""
-            if self.conversation_history:
-                recent_context = self.conversation_history[-5:] if len(self.conversation_history) >= 5 else self.conversation_history
-                context = "Interview context: " + " ".join([msg.get('content', '')[:200] for msg in recent_context if msg.get('content') and msg.get('role') != 'user'])
-            
-            # Get response from Solution Architect
-            response = self.solution_architect.get_response(user_message, context)
-            
-            # Add Solution Architect response to interview history
-            self.conversation_history.append({
-                "role": "assistant",
-                "content": f"[Solution Architect] {response}"
-            })
-            
-            return response
-        
-        # If no API key, return a mock response for development
-        if not self.api_key:
-            return self._get_mock_response(user_message)
-        
-        try:
-            # Prepare messages for Grok API
-            # Always include system prompt, then add conversation history
-            messages = []
-            
-            # Add system prompt as a system message (Grok API supports system role)
-            messages.append({
-                "role": "system",
-                "content": SYSTEM_PROMPT
-            })
-            
-            # Add all conversation history (excluding the initial "Start the interview simulation" message)
-            for msg in self.conversation_history:
-                # Skip the initial setup message
-                if msg["content"] == "Start the interview simulation.":
-                    continue
-                messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
-            
-            # Call Grok API
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            # Try different model names - Grok API might use different model identifiers
-            models_to_try = ["grok-2-1212", "grok-2", "grok-beta"]
-            
-            last_error = None
-            for model in models_to_try:
-                try:
-                    payload = {
-                        "model": model,
-                        "messages": messages,
-                        "max_tokens": 2048,
-                        "temperature": 0.7
-                    }
-                    
-                    response = requests.post(
-                        self.api_url,
-                        headers=headers,
-                        json=payload,
-                        timeout=30
-                    )
-                    
-                    # If successful, break out of loop
-                    if response.status_code == 200:
-                        data = response.json()
-                        response_text = data["choices"][0]["message"]["content"]
-                        
-                        # Check if response indicates connecting to Solution Architect
-                        response_lower = response_text.lower()
-                        if 'solution architect' in response_lower or 'alex chen' in response_lower or ('connected' in response_lower and 'architect' in response_lower):
-                            # Set flag to use Solution Architect for next messages
-                            self.using_solution_architect = True
-                        
-                        # Add assistant response to history
-                        self.conversation_history.append({
-                            "role": "assistant",
-                            "content": response_text
-                        })
-                        
-                        return response_text
-                    else:
-                        # Store detailed error for debugging
-                        try:
-                            error_json = response.json()
-                            error_detail = str(error_json)
-                        except:
-                            error_detail = response.text[:500]
-                        last_error = f"Status {response.status_code}: {error_detail}"
-                        # Try next model
-                        continue
-                            
-                except requests.exceptions.RequestException as e:
-                    last_error = str(e)
-                    # Try next model
-                    continue
-            
-            # If all models failed, fall back to mock response with error info
-            if last_error:
-                # Log the error but continue with mock response
-                print(f"Grok API Error: {last_error}")
-                # Fall back to mock response so the interview can continue
-                return self._get_mock_response(user_message) + f"\n\n[Note: Using fallback response due to API error: {last_error[:200]}]"
-            else:
-                # Fall back to mock response
-                return self._get_mock_response(user_message)
-            
-        except Exception as e:
-            # Fall back to mock response on any exception
-            print(f"Exception in get_response: {str(e)}")
-            return self._get_mock_response(user_message)
+        turn.reply = "".join(turn.parts)
+        self._record_response(turn.reply)
+        self._record_usage(turn.messages, turn.reply, turn.meta, turn.started, turn.streamed)
+    
+    def _record_usage(self, messages: PreparedMessages, response_text: str, meta: Dict, started: float, streamed: bool = False):
+        """Account one upstream turn in the session totals and the process-wide usage tracker."""
+        record = turn_record(self.session_id, SALES_MANAGER, messages, response_text, meta, started, streamed, self.stages.stage)
+        add_to_totals(self.usage, record)
+        usage_tracker.record(record)
+    
+    def _fallback_note(self, error: str) -> str:
+        """Note appended to mock responses served because the API failed."""
+        return f"\n\n[Note: Using fallback response due to API error: {error[:200]}]"
+    
+    def _build_messages(self) -> PreparedMessages:
+        """Build the Grok message list: system prompt followed by the (compacted) conversation history."""
+        # Messages are encoded once as they are added; the start marker is left out
+        with span('history'):
+            return self.message_buffer.build(self.conversation_history, self.compactor)
+    
+    def _record_response(self, response_text: str):
+        """Add a Sales Manager response to history and apply any stage hand-off it contains."""
+        self.conversation_history.append({
+            "role": "assistant",
+            "content": response_text
+        })
+        self.stages.on_reply(response_text)
+        speculator.after_turn(self)
+    
+    def _solution_architect_context(self, user_message: str) -> str:
+        """The interview passages most relevant to user_message, as context for the Solution Architect."""
+        if not self.conversation_history:
+            return ""
+        with span('retrieval'):
+            return self.transcript_index.context(self.conversation_history, user_message)
+    
+    def _record_solution_architect_response(self, response: str):
+        """Add a Solution Architect response to the interview history."""
+        self.conversation_history.append({
+            "role": "assistant",
+            "content": f"[Solution Architect] {response}"
+        })
+        speculator.after_turn(self)
     
     def _get_mock_response(self, user_message: str) -> str:
-        """Return a mock response when API key is not available."""
+        """Return a mock response when no provider is available."""
+        response = self._mock_response_for_stage(user_message)
+        self.stages.on_reply(response)
+        return response
+    
+    def _mock_response_for_stage(self, user_message: str) -> str:
+        """Pick the scripted Sales Manager reply for the current stage."""
         user_lower = user_message.lower()
-        history_length = len(self.conversation_history)
+        stage = self.stages.stage
+        first_turn_in_stage = self.stages.turns <= 1
         
-        # Stage 1: Research Objectives - wait for candidate to provide objectives
-        if history_length <= 2:  # Initial message + first user response
+        # Step 2: Research Objectives - wait for candidate to provide objectives
+        if stage == 'objectives':
             if "objective" in user_lower or "figma" in user_lower or len(user_message) > 100:
                 return """Great research! I can see you've done your homework on Figma. 
 
@@ -564,11 +824,9 @@ Where would you get that information if you were at Anthropic? How would you fin
 2. Why did you choose these 2 objectives in relation to Anthropic's value proposition?
 3. Where did you get this information? Please share your sources."""
         
-        # Stage 2: Show weaknesses - wait for their response about where to get info
-        elif history_length <= 4:
-            # This will trigger the Solution Architect connection
-            self.using_solution_architect = True
-            connection_message = """Good thinking! Let me connect you with Alex Chen, a Partner Solution Architect at Anthropic who can help you get that information.
+        # Step 3: Show weaknesses - their answer about where to get info triggers the Solution Architect connection
+        elif stage == 'information_sources':
+            return """Good thinking! Let me connect you with Alex Chen, a Partner Solution Architect at Anthropic who can help you get that information.
 
 ---
 
@@ -584,46 +842,10 @@ What specific information do you need? I can help you understand:
 - Integration patterns and best practices
 
 What would be most helpful for your outreach to Vijay?"""
-            
-            # Add connection message to history
-            self.conversation_history.append({
-                "role": "assistant",
-                "content": connection_message
-            })
-            
-            return connection_message
-        
-        # Stage 4: Partner Solution Architect conversation (handled by delegation logic in get_response)
-        elif history_length <= 8:
-            return """Great questions! Based on what you're asking about, here's what I can share as a Solution Architect:
-
-**Claude's Technical Capabilities:**
-- Sub-100ms latency for real-time applications when optimized
-- Deterministic outputs through careful prompt engineering and temperature control
-- Enterprise-grade data handling with zero data retention options
-- Superior safety features with Constitutional AI training
-- Strong performance on design and code-related tasks
-
-**For Figma specifically:**
-- Claude excels at design-to-code conversion and understanding design systems
-- Can handle complex multi-step workflows with high reliability
-- Better at following design specifications without hallucinations compared to other models
-- Strong at understanding context and maintaining consistency across design iterations
-
-**How Claude compares:**
-- More reliable outputs than GPT-4 for design-related tasks
-- Better safety guarantees and data privacy controls
-- More deterministic behavior for production use cases
-
-What other technical details would help strengthen your email to Vijay?"""
         
-        # Stage 4: Return from Solution Architect to guide to draft email
-        # Check if we've had enough Solution Architect exchanges
-        elif history_length > 8 and self.using_solution_architect:
-            # Count Solution Architect messages
-            sa_messages = sum(1 for msg in self.conversation_history if '[Solution Architect]' in msg.get('content', ''))
-            if sa_messages >= 2:  # After a few exchanges, return control
-                self.using_solution_architect = False
+        # Step 5: Back from the Solution Architect - guide them to draft the email
+        elif stage == 'draft_email':
+            if first_turn_in_stage:
                 return """Great! Now that you've gathered that information from our Solution Architect, you're ready to draft your email to Vijay. 
 
 Now that you've gathered all this information from the Solution Architect, please draft a ≤150-word outbound email you'd send directly to Vijay to spark interest in Anthropic's Claude platform. 
@@ -633,13 +855,17 @@ Make sure to:
 - Incorporate the technical information from the Solution Architect
 - Be highly personalized to Figma and Vijay
 - Include a lightweight CTA"""
-            else:
-                # Continue with Solution Architect - delegate to Solution Architect's mock response
-                return self.solution_architect._get_mock_response(user_message)
+            return """Now that you've gathered all this information from the Solution Architect, please draft a ≤150-word outbound email you'd send directly to Vijay to spark interest in Anthropic's Claude platform. 
+
+Make sure to:
+- Reference the objectives you provided
+- Incorporate the technical information from the Solution Architect
+- Be highly personalized to Figma and Vijay
+- Include a lightweight CTA"""
         
-        # Stage 4: Draft Email (after gathering all information)
-        elif history_length <= 12 and not self.using_solution_architect:
-            if "email" in user_lower or "subject:" in user_lower or "dear" in user_lower or "hi vijay" in user_lower:
+        # Step 6: Feedback on the draft, then wait for the updated email
+        elif stage == 'revise_email':
+            if first_turn_in_stage:
                 return """Thanks for sharing your email draft. Let me provide some feedback:
 
 **What's working well:**
@@ -652,19 +878,11 @@ Make sure to:
 - Strengthen the CTA to be more action-oriented
 
 Please update your email based on this feedback and send it to Vijay."""
-            else:
-                return """Now that you've gathered all this information from the Solution Architect, please draft a ≤150-word outbound email you'd send directly to Vijay to spark interest in Anthropic's Claude platform. 
-
-Make sure to:
-- Reference the objectives you provided
-- Incorporate the technical information from the Solution Architect
-- Be highly personalized to Figma and Vijay
-- Include a lightweight CTA"""
+            return """Please update your email incorporating the feedback, then send it to Vijay."""
         
-        # Stage 5: Update Email
-        elif history_length <= 14:
-            if "email" in user_lower or "update" in user_lower or "dear" in user_lower or "hi vijay" in user_lower:
-                return """Perfect! Now let's send that updated email to Vijay and see how he responds.
+        # Step 7: The updated email goes to Vijay
+        elif stage == 'cto_follow_up' and first_turn_in_stage:
+            return """Perfect! Now let's send that updated email to Vijay and see how he responds.
 
 ---
 
@@ -679,10 +897,7 @@ Make sure to:
 **From: Vijay Karunamurthy (CTO, Figma)**
 
 Thanks for the updated email. I have a few follow-up questions, and I'd like to bring my VP of Engineering into the conversation. Can we schedule a 30-minute call next week to discuss this further?"""
-            else:
-                return """Please update your email incorporating the feedback, then send it to Vijay."""
         
-        # Stage 7: Vijay Follow-up
+        # Step 7 onwards: Vijay Follow-up
         else:
             return """Vijay is interested and wants to involve his VP. How would you respond to coordinate this meeting? What would you prepare for this call?"""
-
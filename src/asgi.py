@@ -0,0 +1,638 @@
+#!/usr/bin/env python3
+"""
+ASGI entry point for the application.
+
+Serves the chat API natively on asyncio, so a single worker can hold
+hundreds of in-flight LLM calls instead of one per thread. Pages and
+static files are still rendered by the Flask app (main.py), which keeps
+working as the sync WSGI entry point. What each API route does is
+shared with it (handlers.py); this module supplies the asyncio I/O.
+
+The interview's WebSocket (/api/chat/ws, see channels.py) is only
+served here; under WSGI the page falls back to the POST API.
+
+Run with:
+    uvicorn asgi:app --app-dir src --host 0.0.0.0 --port 8080
+"""
+
+import asyncio
+import io
+import json
+import sys
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+from typing import Dict, List, Optional, Tuple
+
+from itsdangerous import BadSignature
+
+from admission import Overloaded, admission
+from assets import ASSET_URL_PREFIX, compress_body, should_compress
+from channels import HEARTBEAT, DeltaPacer, channels, origin_allowed, socket_frames
+from handlers import (API_ERRORS, API_ROUTES, ApiRequest, ChatTurn, Result, agents, assets, call_route, error_event,
+                      error_result, init_reply_body, require_session, sse, start_interview)
+from http_client import close_async_http_client
+from idempotency import IDEMPOTENCY_HEADER, MAX_KEY_LENGTH, REPLAYED_HEADER
+from lifecycle import readiness, warm_connections_async
+from main import app as flask_app
+from metrics import observe_request
+from profiling import PROFILE_MODE, RequestProfile, requested as profiling_requested, span
+from session_store import session_locks
+from transcripts import transcript_log
+from usage import usage_tracker
+
+
+def _header(scope: Dict, name: bytes) -> Optional[bytes]:
+    """Return the first value of a request header (name in lowercase)."""
+    for header, value in scope.get('headers', []):
+        if header == name:
+            return value
+    return None
+
+
+def _use_cache(scope: Dict) -> bool:
+    """Cache-Control: no-cache keeps a turn out of the shared response cache."""
+    return b'no-cache' not in (_header(scope, b'cache-control') or b'').lower()
+
+
+def _session_id(scope: Dict) -> Optional[str]:
+    """Read the session id from Flask's signed session cookie."""
+    cookie_header = _header(scope, b'cookie')
+    if not cookie_header:
+        return None
+
+    cookies = SimpleCookie()
+    cookies.load(cookie_header.decode('latin-1'))
+    morsel = cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+    if morsel is None:
+        return None
+
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+    try:
+        data = serializer.loads(morsel.value, max_age=max_age)
+    except BadSignature:
+        return None
+    return data.get('session_id')
+
+
+async def _read_body(receive) -> bytes:
+    """Read the full request body."""
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+    return body
+
+
+async def _read_json(receive) -> Optional[Dict]:
+    """Read the full request body and decode it as JSON."""
+    body = await _read_body(receive)
+    try:
+        data = json.loads(body) if body else None
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+async def _send_json(send, data: Dict, status: int = 200, headers: Optional[List] = None):
+    """Send a complete JSON response."""
+    with span('serialize'):
+        body = json.dumps(data).encode('utf-8')
+    await _send_json_body(send, body, status, headers)
+
+
+async def _send_json_body(send, body: bytes, status: int = 200, headers: Optional[List] = None):
+    """Send a complete response whose JSON body is already encoded."""
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode('ascii')),
+        ] + (headers or []),
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _send_result(send, result: Result):
+    """Send a shared handler's (body, status, headers)."""
+    body, status, headers = result
+    headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()]
+    if isinstance(body, dict):
+        return await _send_json(send, body, status, headers)
+    body = body.encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': headers + [(b'content-length', str(len(body)).encode('ascii'))],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _store_call(method, *args):
+    """Call a session-store method, off the event loop if the store does I/O."""
+    if agents.blocking:
+        return await asyncio.to_thread(method, *args)
+    return method(*args)
+
+
+_REPLAYED = REPLAYED_HEADER.lower().encode('ascii')
+
+
+def _idempotency_key(scope: Dict) -> Optional[str]:
+    """The request's Idempotency-Key header, if any."""
+    key = _header(scope, IDEMPOTENCY_HEADER.lower().encode('ascii'))
+    return key.decode('latin-1') if key else None
+
+
+def _api_request(scope: Dict, params: Optional[Dict[str, str]] = None) -> ApiRequest:
+    """The parts of the request the shared handlers read."""
+    args = {name: values[0] for name, values in parse_qs(scope.get('query_string', b'').decode('latin-1')).items()}
+    headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in scope.get('headers', [])}
+    return ApiRequest(_session_id(scope), args, headers, params)
+
+
+def _api_view(route, params: Dict[str, str]):
+    """An ASGI handler for one of the shared API_ROUTES (blocking ones run on the default thread pool)."""
+    async def view(scope, receive, send):
+        request = _api_request(scope, params)
+        if route.blocking:
+            result = await asyncio.to_thread(call_route, route, request)
+        else:
+            result = call_route(route, request)
+        await _send_result(send, result)
+    return view
+
+
+async def init_chat(scope, receive, send):
+    """Initialize the interview chat."""
+    try:
+        session_id = require_session(_session_id(scope))
+        async with session_locks.hold_async(session_id):
+            with span('session'):
+                agent = await _store_call(agents.get_or_create, session_id)
+            start_interview(session_id, agent)
+            with span('session_save'):
+                await _store_call(agents.save, session_id, agent)
+    except API_ERRORS as e:
+        return await _send_result(send, error_result(e))
+
+    await _send_json_body(send, init_reply_body(agent.stages.stage))
+
+
+async def _begin_turn(scope, receive, check_room: bool = False) -> ChatTurn:
+    """The ChatTurn for a chat request (raises one of API_ERRORS)."""
+    session_id = _session_id(scope)
+    data = await _read_json(receive) if session_id else None
+    return ChatTurn.begin(session_id, data, _idempotency_key(scope), _use_cache(scope), check_room)
+
+
+async def chat(scope, receive, send):
+    """Handle chat messages with the interview agent without blocking the event loop."""
+    try:
+        turn = await _begin_turn(scope, receive)
+        if not turn.owner:
+            # A duplicate of a turn that is running or finished: answer with its reply
+            turn.replayed(await turn.submission.wait_async())
+            return await _send_json(send, turn.reply(), headers=[(_REPLAYED, b'true')])
+        try:
+            async with session_locks.hold_async(turn.session_id):
+                with span('session'):
+                    agent = await _store_call(agents.get_or_create, turn.session_id, True)
+                turn.answering(agent)
+                async with admission.slot_async():
+                    reply = await agent.get_response_async(turn.user_message, turn.use_cache)
+                with span('session_save'):
+                    await _store_call(agents.save, turn.session_id, agent)
+                turn.answered(agent, reply)
+        finally:
+            turn.close()
+    except API_ERRORS as e:
+        return await _send_result(send, error_result(e))
+
+    await _send_json(send, turn.reply())
+
+
+async def chat_stream(scope, receive, send):
+    """Handle chat messages, streaming the reply back as Server-Sent Events."""
+    try:
+        # The status goes out before the turn gets a slot, so refuse now if it would be
+        turn = await _begin_turn(scope, receive, check_room=True)
+    except API_ERRORS as e:
+        return await _send_result(send, error_result(e))
+
+    headers = [
+        (b'content-type', b'text/event-stream; charset=utf-8'),
+        (b'cache-control', b'no-cache'),
+        (b'x-accel-buffering', b'no'),
+    ]
+    if not turn.owner:
+        headers.append((_REPLAYED, b'true'))
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+
+    async def emit(event: str, data: Dict):
+        await send({'type': 'http.response.body', 'body': sse(event, data).encode('utf-8'), 'more_body': True})
+
+    if not turn.owner:
+        try:
+            turn.replayed(await turn.submission.wait_async())
+        except API_ERRORS as e:
+            await emit('error', error_event(e))
+        else:
+            for event, data in turn.replay_events():
+                await emit(event, data)
+        return await send({'type': 'http.response.body', 'body': b''})
+
+    try:
+        async with session_locks.hold_async(turn.session_id):
+            agent = await _store_call(agents.get_or_create, turn.session_id, True)
+            turn.answering(agent)
+            await emit('start', turn.start_event())
+            parts = []
+            async with admission.slot_async():
+                async for chunk in agent.stream_response_async(turn.user_message, turn.use_cache):
+                    parts.append(chunk)
+                    await emit('delta', {'text': chunk})
+            await _store_call(agents.save, turn.session_id, agent)
+            turn.answered(agent, ''.join(parts))
+            await emit('done', turn.done_event())
+    except Exception as e:
+        if not isinstance(e, API_ERRORS):
+            print(f"Exception in chat_stream: {str(e)}")
+        await emit('error', error_event(e))
+    finally:
+        turn.close()
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+# WebSocket close codes (4000-4999 are free for applications)
+SOCKET_POLICY = 1008  # handshake from another site's page (cross-site WebSocket hijacking)
+SOCKET_NO_SESSION = 4400
+SOCKET_TIMEOUT = 4408  # the client stopped answering heartbeats
+SOCKET_TOO_SLOW = 4429  # the client stopped reading; it resumes after reconnecting
+
+# Turns started over a socket keep running when it closes, so their replies reach the resume buffer
+_socket_turns = set()
+
+
+def _socket_frame(frame: Dict) -> str:
+    """An unnumbered frame, for this socket only (not kept for resumes)."""
+    return json.dumps(frame)
+
+
+def _query_param(scope: Dict, name: str) -> Optional[str]:
+    values = parse_qs(scope.get('query_string', b'').decode('latin-1')).get(name)
+    return values[0] if values else None
+
+
+async def _socket_turn(session_id: str, channel, turn_id: str, user_message: str, use_cache: bool):
+    """Run one turn sent over the WebSocket, publishing its frames to the interview's channel.
+
+    The turn id doubles as its Idempotency-Key, so a turn sent again after
+    a reconnect that could not resume is answered without running twice.
+    """
+    def publish(event: str, data: Dict):
+        channel.publish({'type': event, 'turn': turn_id, **data})
+
+    try:
+        turn = ChatTurn.begin(session_id, {'message': user_message}, turn_id, use_cache)
+    except API_ERRORS as e:
+        return publish('error', error_event(e))
+    if not turn.owner:
+        try:
+            turn.replayed(await turn.submission.wait_async())
+        except API_ERRORS as e:
+            return publish('error', error_event(e))
+        for event, data in turn.replay_events():
+            publish(event, data)
+        return
+
+    pacer = DeltaPacer(channel, turn_id)
+    try:
+        async with session_locks.hold_async(session_id):
+            agent = await _store_call(agents.get_or_create, session_id, True)
+            turn.answering(agent)
+            publish('start', turn.start_event())
+            parts = []
+            async with admission.slot_async():
+                async for chunk in agent.stream_response_async(user_message, use_cache):
+                    parts.append(chunk)
+                    pacer.add(chunk)
+            pacer.flush()
+            await _store_call(agents.save, session_id, agent)
+            turn.answered(agent, ''.join(parts))
+            publish('done', turn.done_event())
+    except Exception as e:
+        pacer.flush()
+        if not isinstance(e, API_ERRORS):
+            print(f"Exception in chat_socket: {str(e)}")
+        publish('error', error_event(e))
+    finally:
+        turn.close()
+
+
+async def chat_socket(scope, receive, send):
+    """The interview's WebSocket: multiplexed turns, server pushes, heartbeats and resume.
+
+    Client frames are JSON: {"type": "chat", "id": <turn id>, "message": ...}
+    (plus "no_cache": true to skip the response cache), and "ping"/"pong".
+    Reconnect with ?channel=<id>&last_seq=<n> from the "ready" frame and
+    the numbered frames seen since to resume.
+    """
+    if (await receive())['type'] != 'websocket.connect':
+        return
+    origin, host = _header(scope, b'origin'), _header(scope, b'host')
+    if not origin_allowed(origin and origin.decode('latin-1'), host and host.decode('latin-1')):
+        return await send({'type': 'websocket.close', 'code': SOCKET_POLICY})
+    session_id = _session_id(scope)
+    if not session_id:
+        return await send({'type': 'websocket.close', 'code': SOCKET_NO_SESSION})
+
+    try:
+        last_seq = int(_query_param(scope, 'last_seq'))
+    except (TypeError, ValueError):
+        last_seq = None
+    await send({'type': 'websocket.accept'})
+    channel, subscriber, resumed = channels.attach(session_id, _query_param(scope, 'channel'), last_seq)
+    last_heard = time.monotonic()
+
+    async def send_text(text: str):
+        await send({'type': 'websocket.send', 'text': text})
+        socket_frames.labels('sent').inc()
+
+    async def writer():
+        # The only task that sends, so frames go out in the order they were queued
+        await send_text(_socket_frame({'type': 'ready', 'channel': channel.id, 'seq': channel.seq,
+                                       'resumed': resumed, 'heartbeat': HEARTBEAT}))
+        while True:
+            try:
+                text = await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT)
+            except asyncio.TimeoutError:
+                if time.monotonic() - last_heard > 2 * HEARTBEAT:
+                    return await send({'type': 'websocket.close', 'code': SOCKET_TIMEOUT})
+                text = _socket_frame({'type': 'ping'})
+            if subscriber.overflowed:
+                return await send({'type': 'websocket.close', 'code': SOCKET_TOO_SLOW})
+            await send_text(text)
+
+    def reply(frame: Dict):
+        try:
+            subscriber.queue.put_nowait(_socket_frame(frame))
+        except asyncio.QueueFull:
+            subscriber.overflowed = True
+
+    async def reader():
+        nonlocal last_heard
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+            last_heard = time.monotonic()
+            socket_frames.labels('received').inc()
+            try:
+                data = json.loads(message.get('text') or message.get('bytes') or b'')
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                reply({'type': 'error', 'turn': None, 'error': 'Frames must be JSON objects'})
+                continue
+            kind = data.get('type')
+            if kind == 'ping':
+                reply({'type': 'pong'})
+            elif kind == 'chat':
+                turn_id = str(data.get('id') or '')[:MAX_KEY_LENGTH]
+                user_message = str(data.get('message', '')).strip()
+                if not turn_id or not user_message:
+                    reply({'type': 'error', 'turn': turn_id or None, 'error': 'Message and turn id are required'})
+                    continue
+                try:
+                    admission.check_room()
+                except Overloaded as e:
+                    reply({'type': 'error', 'turn': turn_id, 'error': str(e), 'retry_after': e.retry_after})
+                    continue
+                task = asyncio.create_task(_socket_turn(session_id, channel, turn_id, user_message, not data.get('no_cache')))
+                _socket_turns.add(task)
+                task.add_done_callback(_socket_turns.discard)
+
+    tasks = [asyncio.create_task(reader()), asyncio.create_task(writer())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        channels.detach(channel, subscriber)
+
+
+def _build_environ(scope: Dict, body: bytes) -> Dict:
+    """Translate an ASGI HTTP scope into a WSGI environ."""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+            environ[name] = value
+            continue
+        key = f'HTTP_{name}'
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _call_wsgi(environ: Dict) -> Tuple[int, List, bytes]:
+    """Run the Flask app for one request and collect the whole response."""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = headers
+
+    result = flask_app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], body
+
+
+async def wsgi_fallback(scope, receive, send):
+    """Serve a page or static file through the Flask app on the default thread pool."""
+    body = await _read_body(receive)
+    loop = asyncio.get_running_loop()
+    status, headers, content = await loop.run_in_executor(None, _call_wsgi, _build_environ(scope, body))
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    })
+    await send({'type': 'http.response.body', 'body': content})
+
+
+async def static_asset(scope, receive, send):
+    """Serve a fingerprinted asset, precompressed for the client, cacheable forever."""
+    asset = assets.lookup(scope['path'][len(ASSET_URL_PREFIX):])
+    if asset is None:
+        return await _send_json(send, {'error': 'Not found'}, 404)
+    accept_encoding = (_header(scope, b'accept-encoding') or b'').decode('latin-1')
+    if_none_match = (_header(scope, b'if-none-match') or b'').decode('latin-1')
+    status, headers, body = asset.response(accept_encoding, if_none_match)
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def _profiled_send(send, profile: RequestProfile):
+    """Wrap send to add the request's span timings as a Server-Timing header."""
+    async def profiled_send(message):
+        if message['type'] == 'http.response.start':
+            message = dict(message, headers=list(message.get('headers', [])) + [
+                (b'server-timing', profile.server_timing().encode('ascii'))])
+        await send(message)
+    return profiled_send
+
+
+def _compressed_send(send, accept_encoding: Optional[str]):
+    """Wrap send to gzip single-message JSON/HTML/text responses when worthwhile (streams pass through)."""
+    held = None
+
+    async def compressed_send(message):
+        nonlocal held
+        if message['type'] == 'http.response.start':
+            headers = dict(message.get('headers', []))
+            if b'content-encoding' in headers or b'text/event-stream' in headers.get(b'content-type', b''):
+                return await send(message)
+            held = message
+            return
+        if held is not None:
+            start, held = held, None
+            body = message.get('body', b'')
+            headers = dict(start.get('headers', []))
+            content_type = headers.get(b'content-type', b'').decode('latin-1')
+            if not message.get('more_body') and should_compress(content_type, None, len(body), accept_encoding):
+                body = compress_body(body)
+                headers = [(name, value) for name, value in start['headers'] if name not in (b'content-length', b'vary')]
+                headers += [(b'content-encoding', b'gzip'), (b'content-length', str(len(body)).encode('ascii')),
+                            (b'vary', b'Accept-Encoding')]
+                await send(dict(start, headers=headers))
+                return await send(dict(message, body=body))
+            await send(start)
+        await send(message)
+    return compressed_send
+
+
+def _timed_send(send, route: str, method: str):
+    """Wrap send to record the route's latency (to response headers) when the response starts."""
+    started = time.perf_counter()
+
+    async def timed_send(message):
+        if message['type'] == 'http.response.start':
+            observe_request(route, method, message['status'], time.perf_counter() - started)
+        await send(message)
+    return timed_send
+
+
+ROUTES = {
+    ('POST', '/api/chat/init'): init_chat,
+    ('POST', '/api/chat'): chat,
+    ('POST', '/api/chat/stream'): chat_stream,
+}
+
+# The shared GET routes (handlers.API_ROUTES): exact paths, then the ones with <placeholders>
+_API_PATHS = {route.rule: route for route in API_ROUTES if route.pattern is None}
+_API_PATTERNS = [route for route in API_ROUTES if route.pattern is not None]
+
+
+def _api_route(path: str):
+    """The shared GET route serving path and its placeholder values, or (None, None)."""
+    route = _API_PATHS.get(path)
+    if route is not None:
+        return route, {}
+    for route in _API_PATTERNS:
+        match = route.pattern.match(path)
+        if match:
+            return route, match.groupdict()
+    return None, None
+
+
+async def _lifespan(receive, send):
+    """Handle server startup/shutdown: warm upstream connections first, close them on the way out."""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Upstream connections belong to this loop's client, so they are opened here
+            readiness.mark_ready(await warm_connections_async())
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            readiness.mark_draining()
+            # Let socket turns whose clients already left finish and be saved
+            if _socket_turns:
+                await asyncio.wait(list(_socket_turns))
+            await close_async_http_client()
+            usage_tracker.close()
+            # Write queued transcript messages before the process exits
+            await asyncio.to_thread(transcript_log.close)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI application: async chat API routes, everything else through Flask."""
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] == 'websocket':
+        if scope['path'] == '/api/chat/ws':
+            return await chat_socket(scope, receive, send)
+        return await send({'type': 'websocket.close', 'code': 1000})
+    if scope['type'] != 'http':
+        return
+
+    handler, rule = ROUTES.get((scope['method'], scope['path'])), scope['path']
+    if handler is None and scope['method'] == 'GET':
+        route, params = _api_route(scope['path'])
+        if route is not None:
+            handler, rule = _api_view(route, params), route.rule
+    if handler is None and scope['method'] == 'GET' and scope['path'].startswith(ASSET_URL_PREFIX):
+        return await static_asset(scope, receive, _timed_send(send, ASSET_URL_PREFIX + '<path:filename>', 'GET'))
+    if handler is None:
+        # Pages are timed (and compressed) by the Flask app's own request hooks
+        return await wsgi_fallback(scope, receive, send)
+    send = _timed_send(send, rule, scope['method'])
+    send = _compressed_send(send, (_header(scope, b'accept-encoding') or b'').decode('latin-1'))
+    # Opt-in span timings (ACE_PROFILE); a no-op lookup for unprofiled requests
+    mode = PROFILE_MODE != 'off' and profiling_requested(scope['path'], (_header(scope, b'x-ace-profile') or b'').decode('latin-1'))
+    if not mode:
+        return await handler(scope, receive, send)
+    profile = RequestProfile(scope['path'], cprofile=(mode == 'cprofile'))
+    token = profile.start()
+    try:
+        await handler(scope, receive, _profiled_send(send, profile))
+    finally:
+        profile.finish(token)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=8080)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Fingerprinted, precompressed static assets and response compression.
+
+The stylesheet and the interview page's script used to be served by
+Flask's default static handler: uncompressed, with a short cache
+lifetime, so every page view revalidated or refetched them. They are now
+built once at startup: minified, named after a hash of their content
+(/assets/style.<hash>.css) and compressed ahead of time with gzip and,
+if the brotli package is installed, brotli. Since a changed file gets a
+new URL, responses are cacheable forever (Cache-Control: immutable) and
+carry an ETag for clients that revalidate anyway. Templates link to the
+current URL through asset_url().
+
+Dynamic JSON, HTML and text responses are gzip-compressed on the fly
+when the client accepts it and they are at least ACE_COMPRESS_MIN_BYTES
+long. Server-Sent Event streams are left alone so tokens are not held
+back by the compressor.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import brotli  # Optional: brotli-encoded assets for clients that accept them
+except ImportError:
+    brotli = None
+
+COMPRESS_RESPONSES = os.getenv('ACE_COMPRESS_RESPONSES', 'true').lower() in ('1', 'true', 'yes')
+COMPRESS_MIN_BYTES = int(os.getenv('ACE_COMPRESS_MIN_BYTES', '1024'))  # smaller dynamic responses are sent as they are
+DYNAMIC_GZIP_LEVEL = 6  # on-the-fly compression trades ratio for CPU
+ASSET_URL_PREFIX = '/assets/'
+ASSET_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+HASH_LENGTH = 12
+
+# Content types worth compressing on the fly (event streams are excluded on purpose)
+COMPRESSIBLE_TYPES = ('application/json', 'text/html', 'text/plain', 'text/css', 'text/javascript', 'application/javascript')
+
+# Files under the static folder that go through the pipeline
+ASSET_EXTENSIONS = ('.css', '.js')
+
+
+def minify_css(text: str) -> str:
+    """Drop comments and the whitespace that does not affect CSS parsing."""
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    text = re.sub(r':\s+', ':', text)
+    return text.replace(';}', '}').strip()
+
+
+def minify_js(text: str) -> str:
+    """Drop indentation, blank lines and whole-line comments.
+
+    Line breaks are kept, so automatic semicolon insertion and string
+    contents are unaffected; no JavaScript parser is needed.
+    """
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//')) + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def accepted_encodings(accept_encoding: Optional[str]) -> List[str]:
+    """Content codings a client accepts (q=0 excluded), from its Accept-Encoding header."""
+    encodings = []
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            encodings.append(name.strip().lower())
+    return encodings
+
+
+class Asset:
+    """One built asset: its hashed URL and a body per content coding."""
+
+    __slots__ = ('name', 'filename', 'content_type', 'etag', 'bodies')
+
+    def __init__(self, name: str, content: bytes):
+        digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+        stem, ext = os.path.splitext(name)
+        self.name = name
+        self.filename = f'{stem}.{digest}{ext}'
+        self.content_type = (mimetypes.guess_type(name)[0] or 'application/octet-stream') + '; charset=utf-8'
+        self.etag = f'"{digest}"'
+        self.bodies: Dict[str, bytes] = {'identity': content, 'gzip': gzip.compress(content, 9, mtime=0)}
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(content, quality=11)
+
+    @property
+    def url(self) -> str:
+        return ASSET_URL_PREFIX + self.filename
+
+    def select(self, accept_encoding: Optional[str]) -> Tuple[str, bytes]:
+        """The smallest body the client accepts: (coding, body)."""
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in ('br', 'gzip'):
+            if encoding in self.bodies and (encoding in accepted or '*' in accepted):
+                return encoding, self.bodies[encoding]
+        return 'identity', self.bodies['identity']
+
+    def response(self, accept_encoding: Optional[str], if_none_match: Optional[str]) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        """Status, headers and body for a request for this asset."""
+        encoding, body = self.select(accept_encoding)
+        etag = self.etag if encoding == 'identity' else f'"{self.etag[1:-1]}-{encoding}"'
+        headers = [
+            ('Cache-Control', ASSET_CACHE_CONTROL),
+            ('ETag', etag),
+            ('Vary', 'Accept-Encoding'),
+        ]
+        if if_none_match and (if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]):
+            return 304, headers, b''
+        headers.append(('Content-Type', self.content_type))
+        headers.append(('Content-Length', str(len(body))))
+        if encoding != 'identity':
+            headers.append(('Content-Encoding', encoding))
+        return 200, headers, body
+
+
+class AssetManifest:
+    """The static folder's CSS and JS, built on first use (or explicitly at startup)."""
+
+    def __init__(self, static_dir: str):
+        self.static_dir = static_dir
+        self._lock = threading.Lock()
+        self._by_name: Optional[Dict[str, Asset]] = None
+        self._by_filename: Dict[str, Asset] = {}
+
+    def build(self) -> Dict[str, Asset]:
+        """Minify, hash and compress every asset; returns them by source name."""
+        if self._by_name is not None:
+            return self._by_name
+        with self._lock:
+            if self._by_name is None:
+                by_name = {}
+                for name in sorted(os.listdir(self.static_dir)):
+                    ext = os.path.splitext(name)[1]
+                    if ext not in ASSET_EXTENSIONS:
+                        continue
+                    with open(os.path.join(self.static_dir, name), encoding='utf-8') as f:
+                        content = MINIFIERS[ext](f.read()).encode('utf-8')
+                    by_name[name] = Asset(name, content)
+                self._by_filename = {asset.filename: asset for asset in by_name.values()}
+                self._by_name = by_name
+            return self._by_name
+
+    def url(self, name: str) -> str:
+        """The fingerprinted URL of a static file (its plain /static/ URL if it is not built)."""
+        asset = self.build().get(name)
+        return asset.url if asset is not None else '/static/' + name
+
+    def lookup(self, filename: str) -> Optional[Asset]:
+        """The asset served under ASSET_URL_PREFIX + filename, if any."""
+        self.build()
+        return self._by_filename.get(filename)
+
+    def stats(self) -> Dict:
+        return {
+            asset.name: {"url": asset.url, "bytes": {encoding: len(body) for encoding, body in asset.bodies.items()}}
+            for asset in self.build().values()
+        }
+
+
+def should_compress(content_type: Optional[str], content_encoding: Optional[str], size: int,
+                    accept_encoding: Optional[str]) -> bool:
+    """Whether a dynamic response body should be gzip-compressed for this client."""
+    if not COMPRESS_RESPONSES or content_encoding or size < COMPRESS_MIN_BYTES:
+        return False
+    if not content_type or content_type.split(';', 1)[0].strip() not in COMPRESSIBLE_TYPES:
+        return False
+    accepted = accepted_encodings(accept_encoding)
+    return 'gzip' in accepted or '*' in accepted
+
+
+def compress_body(body: bytes) -> bytes:
+    """gzip a dynamic response body."""
+    return gzip.compress(body, DYNAMIC_GZIP_LEVEL, mtime=0)
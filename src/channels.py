@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Per-interview push channels for the WebSocket transport.
+
+Each candidate message used to be its own POST: a new request, a
+session-cookie decode and a JSON envelope per turn, and no way for the
+server to tell the page anything it had not asked for. The interview
+page now keeps one WebSocket per interview (asgi.py, /api/chat/ws),
+and everything the server has to say about an interview is published
+to its Channel:
+- turn frames (start, delta, done, error), tagged with the turn id, so
+  several turns can be in flight on one socket
+- server-initiated pushes, such as a stage change or the Sales Manager
+  taking the conversation back from the Solution Architect, including
+  ones caused by a turn sent over the POST API from another tab
+
+Frames are numbered and the last ACE_WS_RESUME_FRAMES of them are kept
+for ACE_WS_RESUME_TTL seconds after the last socket went away. A client
+that reconnects with the channel id and the last number it saw gets the
+frames it missed, and turns keep running while it is away. When they
+are gone (expired, or the reconnect reached another process) the client
+is told it did not resume and sends its unanswered turns again under
+the same ids, which the Idempotency-Key registry answers without
+running them twice.
+
+Sockets are kept alive with a ping every ACE_WS_HEARTBEAT seconds of
+silence, and closed when the client has not been heard from for two of
+them. Reply tokens are paced: the first goes out at once, the rest are
+merged into one frame per ACE_WS_FLUSH_INTERVAL.
+
+Browsers send the session cookie with a WebSocket handshake from any
+page, so a handshake is only accepted from the app's own origin (the
+request's Host) or one listed in ACE_WS_ALLOWED_ORIGINS.
+
+Each socket has a bounded send queue. A client that stops reading is
+disconnected rather than buffered without limit, and resumes from the
+channel once it reconnects. Channels are per process and live on the
+event loop, so they take no locks.
+"""
+
+import asyncio
+import json
+import os
+from collections import deque
+from urllib.parse import urlsplit
+from typing import Dict, Optional, Set, Tuple
+
+from metrics import Counter, register_gauge, registry
+from stages import STAGES_BY_NAME
+
+RESUME_FRAMES = int(os.getenv('ACE_WS_RESUME_FRAMES', '512'))  # frames kept per interview for reconnecting clients
+RESUME_TTL = float(os.getenv('ACE_WS_RESUME_TTL', '120'))  # seconds a channel outlives its last socket
+SEND_QUEUE = int(os.getenv('ACE_WS_SEND_QUEUE', '1024'))  # frames queued for one socket before it is dropped as too slow
+HEARTBEAT = float(os.getenv('ACE_WS_HEARTBEAT', '20'))  # seconds of silence before the server pings
+FLUSH_INTERVAL = float(os.getenv('ACE_WS_FLUSH_INTERVAL', '0.05'))  # seconds of reply tokens merged into one frame (0 = every token)
+ALLOWED_ORIGINS = frozenset(o.strip().rstrip('/') for o in os.getenv('ACE_WS_ALLOWED_ORIGINS', '').split(',') if o.strip())  # besides the page's own host
+
+socket_frames = registry.register(Counter(
+    'ace_ws_frames_total', 'WebSocket frames, by direction (sent, received).', ('direction',)))
+socket_resumes = registry.register(Counter(
+    'ace_ws_resumes_total', 'WebSocket reconnects asking to resume, by result (resumed, missed).', ('result',)))
+
+
+class Subscriber:
+    """One socket's view of a channel: its queue of frames still to send."""
+
+    __slots__ = ('queue', 'overflowed')
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue(SEND_QUEUE)
+        self.overflowed = False  # set when the client fell too far behind; the socket is closed
+
+
+class Channel:
+    """Numbered frames for one interview, fanned out to its open sockets."""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.id = os.urandom(8).hex()  # a reconnect can only resume the channel instance it saw
+        self.seq = 0
+        self.frames: deque = deque(maxlen=RESUME_FRAMES)  # (seq, text), oldest first
+        self.subscribers: Set[Subscriber] = set()
+        self.expiry: Optional[asyncio.TimerHandle] = None
+
+    def publish(self, frame: Dict) -> int:
+        """Number a frame, keep it for resumes and queue it for every open socket; returns its number."""
+        self.seq += 1
+        text = json.dumps(dict(frame, seq=self.seq))
+        self.frames.append((self.seq, text))
+        for subscriber in self.subscribers:
+            if subscriber.overflowed:
+                continue
+            try:
+                subscriber.queue.put_nowait(text)
+            except asyncio.QueueFull:
+                subscriber.overflowed = True
+        return self.seq
+
+    def attach(self, channel_id: Optional[str], last_seq: Optional[int]) -> Tuple[Subscriber, bool]:
+        """Add a socket; returns its subscriber and whether the frames after last_seq were replayed to it."""
+        subscriber = Subscriber()
+        resumed = False
+        if channel_id is not None and last_seq is not None:
+            oldest = self.frames[0][0] if self.frames else self.seq + 1
+            resumed = channel_id == self.id and oldest - 1 <= last_seq <= self.seq
+            socket_resumes.labels('resumed' if resumed else 'missed').inc()
+            if resumed:
+                for seq, text in self.frames:
+                    if seq > last_seq:
+                        subscriber.queue.put_nowait(text)
+        self.subscribers.add(subscriber)
+        if self.expiry is not None:
+            self.expiry.cancel()
+            self.expiry = None
+        return subscriber, resumed
+
+
+class ChannelHub:
+    """The channels of this process, by session id."""
+
+    def __init__(self):
+        self._channels: Dict[str, Channel] = {}
+        self.connections = 0
+
+    def get(self, session_id: str) -> Channel:
+        channel = self._channels.get(session_id)
+        if channel is None:
+            channel = self._channels[session_id] = Channel(session_id)
+        return channel
+
+    def attach(self, session_id: str, channel_id: Optional[str], last_seq: Optional[int]) -> Tuple[Channel, Subscriber, bool]:
+        channel = self.get(session_id)
+        subscriber, resumed = channel.attach(channel_id, last_seq)
+        self.connections += 1
+        return channel, subscriber, resumed
+
+    def detach(self, channel: Channel, subscriber: Subscriber):
+        """Remove a closed socket; the channel is dropped RESUME_TTL seconds after its last one."""
+        channel.subscribers.discard(subscriber)
+        self.connections -= 1
+        if not channel.subscribers and channel.expiry is None:
+            channel.expiry = asyncio.get_running_loop().call_later(RESUME_TTL, self._expire, channel)
+
+    def _expire(self, channel: Channel):
+        if not channel.subscribers and self._channels.get(channel.session_id) is channel:
+            del self._channels[channel.session_id]
+
+    def push(self, session_id: str, frame: Dict):
+        """Publish a frame to an interview's channel if it has one (nobody listening otherwise)."""
+        channel = self._channels.get(session_id)
+        if channel is not None:
+            channel.publish(frame)
+
+    def push_stage(self, session_id: str, before: str, after: str):
+        """Announce a stage change (and any hand-off between the interviewers) to the interview's sockets."""
+        frame = stage_frame(before, after)
+        if frame is not None:
+            self.push(session_id, frame)
+
+    def stats(self) -> Dict:
+        return {
+            "channels": len(self._channels),
+            "connections": self.connections,
+            "buffered_frames": sum(len(channel.frames) for channel in list(self._channels.values())),
+            "resume_frames": RESUME_FRAMES,
+            "resume_ttl_seconds": RESUME_TTL,
+        }
+
+
+class DeltaPacer:
+    """Publishes a turn's reply tokens: the first at once, then one merged frame per FLUSH_INTERVAL."""
+
+    def __init__(self, channel: Channel, turn_id: str):
+        self.channel = channel
+        self.turn_id = turn_id
+        self.pending = []
+        self.sent = False
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+    def add(self, text: str):
+        self.pending.append(text)
+        if not self.sent or FLUSH_INTERVAL <= 0:
+            self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(FLUSH_INTERVAL, self.flush)
+
+    def flush(self):
+        """Publish whatever is pending (call once more when the reply ends)."""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.pending:
+            self.channel.publish({'type': 'delta', 'turn': self.turn_id, 'text': ''.join(self.pending)})
+            self.pending = []
+            self.sent = True
+
+
+def origin_allowed(origin: Optional[str], host: Optional[str]) -> bool:
+    """Whether a handshake's Origin may open a socket: the request's own host or an allowed origin."""
+    if origin is None:
+        # Browsers always send one; other clients do not carry a candidate's cookie by accident
+        return True
+    origin = origin.rstrip('/')
+    if origin in ALLOWED_ORIGINS:
+        return True
+    return host is not None and urlsplit(origin).netloc.lower() == host.lower()
+
+
+def stage_frame(before: str, after: str) -> Optional[Dict]:
+    """The push announcing a stage change (None if the stage did not change)."""
+    if before == after:
+        return None
+    previous, stage = STAGES_BY_NAME[before], STAGES_BY_NAME[after]
+    return {
+        'type': 'stage',
+        'stage': stage.name,
+        'label': stage.label,
+        'agent': stage.agent,
+        'handoff': stage.agent != previous.agent,  # the other interviewer takes over the conversation
+    }
+
+
+channels = ChannelHub()
+
+register_gauge('ace_ws_connections', 'Open WebSocket connections.', lambda: channels.connections)
+
+
+def _reset_after_fork():
+    channels._channels = {}
+    channels.connections = 0
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
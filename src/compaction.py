@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Token-budgeted compaction of conversation history.
+
+Both agents resend their whole history every turn, so the tokens sent
+over an interview grow quadratically with its length. With a budget set
+(ACE_TOKEN_BUDGET), the oldest turns past it are folded into a rolling
+extractive summary while stage-critical artifacts - the candidate's
+objectives and email drafts - are pinned verbatim. The most recent turns
+are always sent as-is.
+
+The summary is maintained incrementally: each message is summarized once,
+when it first falls out of the recent window.
+"""
+
+import os
+import threading
+from typing import Dict, List, Optional
+
+TOKEN_BUDGET = int(os.getenv('ACE_TOKEN_BUDGET', '0'))  # estimated prompt tokens per request (0 = no compaction)
+MIN_RECENT_MESSAGES = int(os.getenv('ACE_MIN_RECENT_MESSAGES', '4'))  # always sent verbatim
+CHARS_PER_TOKEN = 4  # rough average for English text
+MESSAGE_TOKEN_OVERHEAD = 4  # role and framing tokens per message
+SUMMARY_LINE_CHARS = 160  # characters of each condensed message kept in the summary
+SUMMARY_SHARE = 0.25  # largest share of the budget the rolling summary may take
+PINNED_SHARE = 0.35  # largest share of the budget pinned artifacts may take
+
+# Candidate messages containing these are stage-critical (objectives, email drafts)
+PIN_MARKERS = ('objective', 'subject:', 'dear vijay', 'hi vijay')
+
+SUMMARY_HEADER = "Summary of earlier conversation (older turns condensed to stay within the context budget):"
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate for budgeting (no tokenizer dependency)."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def message_tokens(msg: Dict) -> int:
+    """Estimated tokens one chat message costs in a request."""
+    return MESSAGE_TOKEN_OVERHEAD + estimate_tokens(msg.get("content", ""))
+
+
+def is_pinned(msg: Dict) -> bool:
+    """Whether a message is a stage-critical artifact that must survive compaction."""
+    if msg.get("role") != "user":
+        return False
+    content = msg.get("content", "").lower()
+    return any(marker in content for marker in PIN_MARKERS)
+
+
+def summarize_message(msg: Dict) -> str:
+    """Condense one message into a single summary line."""
+    content = msg.get("content", "")
+    if msg.get("role") == "user":
+        label = "Candidate"
+    elif content.startswith("[Solution Architect]"):
+        label = "Solution Architect"
+        content = content[len("[Solution Architect]"):]
+    else:
+        label = "Assistant"
+    text = " ".join(content.split())
+    if len(text) > SUMMARY_LINE_CHARS:
+        text = text[:SUMMARY_LINE_CHARS].rstrip() + "..."
+    return f"- {label}: {text}"
+
+
+class CompactionStats:
+    """Process-wide totals so the saving can be measured per turn."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.compacted_requests = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    def record(self, tokens_before: int, tokens_after: int):
+        with self._lock:
+            self.requests += 1
+            if tokens_after < tokens_before:
+                self.compacted_requests += 1
+            self.tokens_before += tokens_before
+            self.tokens_after += tokens_after
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            saved = self.tokens_before - self.tokens_after
+            return {
+                "token_budget": TOKEN_BUDGET,
+                "requests": self.requests,
+                "compacted_requests": self.compacted_requests,
+                "tokens_before": self.tokens_before,
+                "tokens_after": self.tokens_after,
+                "tokens_saved": saved,
+                "tokens_saved_per_request": (saved / self.requests) if self.requests else 0.0,
+            }
+
+
+compaction_stats = CompactionStats()
+
+
+class ConversationCompactor:
+    """Decides which messages of one conversation a request carries within a token budget.
+
+    history must only ever grow by appending between calls (a shorter
+    history resets the compactor).
+    """
+
+    def __init__(self, budget: int = TOKEN_BUDGET):
+        self.budget = budget
+        self._boundary = 0  # history[:_boundary] is covered by the summary or pins
+        self._summary_lines: List[str] = []
+        self._summary_tokens = 0
+        self._pinned: List[int] = []  # indices into history, oldest first
+        self._pinned_tokens = 0
+        self._covered_tokens = 0  # cost of history[:_boundary] sent verbatim
+        self.last: Dict = {}  # numbers for the most recent request (see record())
+
+    def reset(self):
+        self._boundary = 0
+        self._summary_lines = []
+        self._summary_tokens = 0
+        self._pinned = []
+        self._pinned_tokens = 0
+        self._covered_tokens = 0
+
+    @property
+    def boundary(self) -> int:
+        """Index of the first history message sent verbatim after the summary and pins."""
+        return self._boundary
+
+    @property
+    def pinned(self) -> List[int]:
+        """Indices of pinned history messages, oldest first."""
+        return self._pinned
+
+    def layout(self, prefix_tokens: int, history: List[Dict], full_tokens: int) -> bool:
+        """Bring the summary and pins up to date for this request.
+
+        Returns False when the whole history is to be sent as it is;
+        otherwise the request is the prefix, summary_message(), the pinned
+        messages and history[boundary:].
+        """
+        if self.budget <= 0:
+            return False
+        if len(history) < self._boundary:
+            self.reset()
+        if full_tokens <= self.budget and self._boundary == 0:
+            return False
+        self._advance(history, prefix_tokens, full_tokens)
+        return True
+
+    def summary_message(self) -> Optional[Dict]:
+        """The rolling summary of condensed messages (None while nothing is condensed)."""
+        if not self._summary_lines:
+            return None
+        return {"role": "system", "content": SUMMARY_HEADER + "\n" + "\n".join(self._summary_lines)}
+
+    def _advance(self, history: List[Dict], prefix_tokens: int, full_tokens: int):
+        """Move the oldest recent messages into the summary/pins until the request fits."""
+        summary_cap = int(self.budget * SUMMARY_SHARE)
+        pinned_cap = int(self.budget * PINNED_SHARE)
+        tail_tokens = full_tokens - prefix_tokens - self._covered_tokens
+
+        def total() -> int:
+            summary = MESSAGE_TOKEN_OVERHEAD + estimate_tokens(SUMMARY_HEADER) + self._summary_tokens if self._summary_lines else 0
+            return prefix_tokens + summary + self._pinned_tokens + tail_tokens
+
+        while total() > self.budget and len(history) - self._boundary > MIN_RECENT_MESSAGES:
+            msg = history[self._boundary]
+            cost = message_tokens(msg)
+            tail_tokens -= cost
+            self._covered_tokens += cost
+            if is_pinned(msg):
+                self._pinned.append(self._boundary)
+                self._pinned_tokens += cost
+            else:
+                self._add_summary_line(summarize_message(msg))
+            self._boundary += 1
+
+            # Too many pins: the oldest one gets summarized like any other message
+            while self._pinned_tokens > pinned_cap and len(self._pinned) > 1:
+                index = self._pinned.pop(0)
+                self._pinned_tokens -= message_tokens(history[index])
+                self._add_summary_line(summarize_message(history[index]))
+
+            # Rolling summary: forget the oldest lines once it outgrows its share
+            while self._summary_tokens > summary_cap and len(self._summary_lines) > 1:
+                self._summary_tokens -= estimate_tokens(self._summary_lines.pop(0)) + 1
+
+    def _add_summary_line(self, line: str):
+        self._summary_lines.append(line)
+        self._summary_tokens += estimate_tokens(line) + 1
+
+    def record(self, tokens_before: int, tokens_after: int, history_length: int):
+        """Note the figures of one request (last, and the process-wide stats)."""
+        self.last = {
+            "tokens_before": tokens_before,
+            "tokens_after": tokens_after,
+            "tokens_saved": tokens_before - tokens_after,
+            "history_messages": history_length,
+            "summarized_messages": self._boundary - len(self._pinned),
+            "pinned_messages": len(self._pinned),
+        }
+        compaction_stats.record(tokens_before, tokens_after)
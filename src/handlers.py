@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+API request handling shared by both entry points.
+
+The Flask app (main.py) and the asyncio app (asgi.py) used to implement
+every API route separately, and the copies drifted apart (/api/stats/http
+answered differently, /api/stats/ws only existed under ASGI). What each
+route does now lives here once, and the entry points only adapt it to
+their framework:
+- API_ROUTES: the GET routes (the interview's usage and stage,
+  transcripts, readiness, metrics and every /api/stats/*), as functions
+  of an ApiRequest; both entry points register the whole table
+- ChatTurn: one candidate message, whether it came in over /api/chat,
+  /api/chat/stream or the WebSocket: validation, Idempotency-Key
+  coalescing, who answers, and everything done once it is answered
+  (transcript, stage push, the result kept for replays, the reply body
+  and stream events). The entry points supply the I/O in their own
+  blocking or asyncio form: the session lock, loading the agent, the
+  agent call and the save
+- start_interview and init_reply_body for /api/chat/init
+
+Errors are raised as exceptions (ApiError, or the admission, session
+lock and idempotency ones) and turned into a response by error_result,
+so both entry points answer them with the same status and body.
+"""
+
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from admission import Overloaded, admission
+from agent import FIRST_MESSAGE
+from assets import AssetManifest
+from channels import channels
+from compaction import compaction_stats
+from http_client import async_http_client_stats, get_http_client
+from idempotency import IdempotencyConflict, submissions
+from lifecycle import readiness
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, register_gauge, registry
+from profiling import profile_stats
+from response_cache import response_cache
+from router import get_model_router
+from session_store import SessionBusy, create_session_store, session_locks
+from speculation import speculator
+from stages import stage_stats
+from transcripts import TRANSCRIPT_TOKEN, read_authorized, transcript_log
+from usage import usage_tracker
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Interview agents (one per session), kept in the store selected by ACE_SESSION_STORE
+agents = create_session_store()
+# A shared store also serializes each interview's turns and holds its idempotency keys across workers
+session_locks.share(agents)
+submissions.share(agents)
+register_gauge('ace_sessions', 'Interviews held by the session store (live agents for the memory store).', lambda: len(agents))
+
+# Minified, fingerprinted and precompressed CSS/JS, built once per process
+assets = AssetManifest(os.path.join(project_root, 'static'))
+
+SOLUTION_ARCHITECT_SPEAKER = 'Alex Chen (Solution Architect)'
+
+# Duplicate requests get this when the original turn failed, so they retry it
+DUPLICATE_FAILED = 'The original request with this Idempotency-Key did not complete; please retry'
+
+# (body, status, headers): a dict body is sent as JSON, a str one as it is
+Result = Tuple[object, int, Dict[str, str]]
+
+
+class ApiError(Exception):
+    """A request refused with an HTTP status and a JSON error body."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+# Exceptions error_result() turns into a response
+API_ERRORS = (ApiError, Overloaded, SessionBusy, IdempotencyConflict)
+
+
+def error_result(e: Exception) -> Result:
+    """The response for one of API_ERRORS."""
+    if isinstance(e, Overloaded):
+        return {'error': str(e), 'retry_after': e.retry_after}, 429, {'Retry-After': str(e.retry_after)}
+    if isinstance(e, IdempotencyConflict):
+        return {'error': str(e)}, 422, {}
+    if isinstance(e, SessionBusy):
+        return {'error': str(e)}, 409, {}
+    return {'error': str(e)}, getattr(e, 'status', 500), {}
+
+
+def error_event(e: Exception) -> Dict:
+    """The stream error event for an exception raised while answering."""
+    if isinstance(e, Overloaded):
+        return {'error': str(e), 'retry_after': e.retry_after}
+    if isinstance(e, API_ERRORS):
+        return {'error': str(e)}
+    return {'error': 'Error generating response'}
+
+
+def sse(event: str, data: Dict) -> str:
+    """Format a Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class ApiRequest:
+    """What a shared handler reads from a request, whichever entry point received it."""
+
+    __slots__ = ('session_id', 'args', 'headers', 'params')
+
+    def __init__(self, session_id: Optional[str], args: Optional[Dict[str, str]] = None,
+                 headers: Optional[Dict[str, str]] = None, params: Optional[Dict[str, str]] = None):
+        self.session_id = session_id
+        self.args = args or {}  # query string
+        self.headers = headers or {}  # lowercase names
+        self.params = params or {}  # from the route's <placeholders>
+
+    def int_arg(self, name: str, default: int) -> int:
+        try:
+            return int(self.args.get(name, default))
+        except ValueError:
+            return default
+
+    def require_session(self) -> str:
+        return require_session(self.session_id)
+
+
+def require_session(session_id: Optional[str]) -> str:
+    """The request's session id (raises ApiError without one)."""
+    if not session_id:
+        raise ApiError('No session', 400)
+    return session_id
+
+
+@lru_cache(maxsize=None)
+def init_reply_body(stage: str) -> bytes:
+    """The /api/chat/init response for an interview at stage, serialized once (the message never changes)."""
+    return json.dumps({'message': FIRST_MESSAGE, 'role': 'assistant', 'stage': stage}).encode('utf-8')
+
+
+def start_interview(session_id: str, agent):
+    """Start a loaded interview if it has not started yet (the caller holds the session lock and saves it)."""
+    if agent.initialized:
+        return
+    # Candidates already mid-interview get the capacity first
+    admission.admit_interview()
+    transcript_log.record(session_id, 'assistant', agent.initialize(), agent.stages.stage)
+
+
+class ChatTurn:
+    """One candidate message on its way to a reply.
+
+    begin() validates it and registers its Idempotency-Key. A duplicate
+    (owner False) waits for the original's result and replays it;
+    otherwise the entry point, holding the session lock, loads the agent,
+    calls answering(), runs the agent, saves it and calls answered().
+    close() must run on the way out whatever happened.
+    """
+
+    def __init__(self, session_id: str, user_message: str, key: Optional[str] = None, use_cache: bool = True):
+        self.session_id = session_id
+        self.user_message = user_message
+        self.key = key
+        self.use_cache = use_cache
+        self.submission = None
+        self.owner = True  # False for a duplicate of a turn that is running or finished
+        self.speaker: Optional[str] = None
+        self.stage: Optional[str] = None  # the stage answering the message
+        self.result: Optional[Dict] = None
+
+    @classmethod
+    def begin(cls, session_id: Optional[str], data: Optional[Dict], key: Optional[str] = None,
+              use_cache: bool = True, check_room: bool = False) -> 'ChatTurn':
+        """Validate a chat request and register its key (raises one of API_ERRORS).
+
+        check_room refuses the turn now if it would not get an upstream slot,
+        for transports that send their status before the turn gets one.
+        """
+        require_session(session_id)
+        user_message = str((data or {}).get('message', '')).strip()
+        if not user_message:
+            raise ApiError('Message is required', 400)
+        if check_room:
+            admission.check_room()
+        turn = cls(session_id, user_message, key, use_cache)
+        if key:
+            turn.submission, turn.owner = submissions.begin(session_id, key, user_message)
+        return turn
+
+    def replayed(self, result: Optional[Dict]) -> Dict:
+        """The original turn's result for a duplicate (raises ApiError if it failed)."""
+        if result is None:
+            raise ApiError(DUPLICATE_FAILED, 409)
+        self.result = result
+        return result
+
+    def answering(self, agent) -> Optional[str]:
+        """Note who answers the message, before the agent runs; returns the speaker."""
+        if agent.answers_as_solution_architect(self.user_message):
+            self.speaker = SOLUTION_ARCHITECT_SPEAKER
+        # A message that moves the interview on (such as the Sales Manager taking
+        # back over from the Solution Architect) is announced before the reply
+        self.stage = agent.stages.peek(self.user_message).name
+        channels.push_stage(self.session_id, agent.stages.stage, self.stage)
+        return self.speaker
+
+    def answered(self, agent, reply: str) -> Dict:
+        """Record a turn whose agent has been saved; returns its result."""
+        transcript_log.record_turn(self.session_id, self.user_message, reply, agent.stages.stage, self.speaker)
+        self.result = {
+            'message': reply,
+            'role': 'assistant',
+            'speaker': self.speaker,
+            'stage': agent.stages.stage,
+            'using_solution_architect': agent.using_solution_architect
+        }
+        if self.submission is not None:
+            submissions.finish(self.submission, self.result)
+        channels.push_stage(self.session_id, self.stage, agent.stages.stage)
+        return self.result
+
+    def close(self):
+        """Let a retry run the turn again if it did not finish (does nothing if it did, or for a duplicate)."""
+        if self.submission is not None and self.owner:
+            submissions.abandon(self.session_id, self.key, self.submission)
+
+    def reply(self) -> Dict:
+        """The /api/chat response body."""
+        return {key: self.result[key] for key in ('message', 'role', 'speaker', 'stage')}
+
+    def start_event(self) -> Dict:
+        return {'role': 'assistant', 'speaker': self.speaker}
+
+    def done_event(self) -> Dict:
+        return {key: self.result[key] for key in ('speaker', 'using_solution_architect', 'stage')}
+
+    def replay_events(self) -> List[Tuple[str, Dict]]:
+        """A finished turn as the (event, data) pairs a stream would have sent."""
+        start = {'role': 'assistant', 'speaker': self.result['speaker']}
+        return [('start', start), ('delta', {'text': self.result['message']}), ('done', self.done_event())]
+
+
+def _session_agent(req: ApiRequest):
+    agent = agents.get(req.require_session())
+    if agent is None:
+        raise ApiError('No interview for this session', 404)
+    return agent
+
+
+def session_usage(req: ApiRequest):
+    """Report upstream token and payload totals for the current interview."""
+    return _session_agent(req).usage_summary()
+
+
+def session_stage(req: ApiRequest):
+    """Report the current interview's stage and the time spent in each stage so far."""
+    return _session_agent(req).stages.summary()
+
+
+def _check_transcript_access(req: ApiRequest):
+    if not TRANSCRIPT_TOKEN:
+        # Transcripts hold candidates' messages and session ids: not served at all without a token
+        raise ApiError('Not found', 404)
+    if not read_authorized(req.headers.get('authorization')):
+        raise ApiError('Unauthorized', 401)
+
+
+def finished_transcripts(req: ApiRequest):
+    """List finished interviews (reached the scoring step), most recent first."""
+    _check_transcript_access(req)
+    limit = min(max(req.int_arg('limit', 50), 1), 500)
+    offset = max(req.int_arg('offset', 0), 0)
+    return {'interviews': transcript_log.finished(limit, offset), 'limit': limit, 'offset': offset}
+
+
+def interview_transcript(req: ApiRequest):
+    """Return the recorded transcript of one interview."""
+    _check_transcript_access(req)
+    transcript = transcript_log.transcript(req.params['session_id'])
+    if transcript is None:
+        raise ApiError('No transcript for this session', 404)
+    return transcript
+
+
+def readyz(req: ApiRequest):
+    """Readiness probe: 200 once this process is warmed up, 503 while starting or draining."""
+    return readiness.snapshot(), 200 if readiness.ready else 503, {}
+
+
+def metrics(req: ApiRequest):
+    """Export metrics in the Prometheus text format."""
+    return registry.render(), 200, {'Content-Type': METRICS_CONTENT_TYPE}
+
+
+def http_stats(req: ApiRequest):
+    """Report connection pool usage for upstream LLM calls (the async pool is only used under ASGI)."""
+    return {'sync': get_http_client().stats(), 'async': async_http_client_stats()}
+
+
+def admission_stats(req: ApiRequest):
+    """Report upstream slots in use, queued turns and requests refused with 429."""
+    return admission.stats()
+
+
+def speculation_stats(req: ApiRequest):
+    """Report speculative generations: hit rate, tokens served and wasted, budget left."""
+    return speculator.stats()
+
+
+def asset_stats(req: ApiRequest):
+    """Report the built assets: fingerprinted URLs and size per encoding."""
+    return assets.stats()
+
+
+def transcript_stats(req: ApiRequest):
+    """Report the transcript write queue: depth, batches written and drops."""
+    return transcript_log.stats()
+
+
+def stage_stats_route(req: ApiRequest):
+    """Report how many interviews reached each stage and the average time spent there."""
+    return stage_stats.snapshot()
+
+
+def usage_stats(req: ApiRequest):
+    """Report upstream token and payload totals per agent and per model."""
+    return usage_tracker.snapshot()
+
+
+def profile_stats_route(req: ApiRequest):
+    """Report span timings aggregated over profiled requests."""
+    return profile_stats.snapshot()
+
+
+def session_stats(req: ApiRequest):
+    """Report session store size, memory estimate and eviction counters."""
+    return agents.stats()
+
+
+def cache_stats(req: ApiRequest):
+    """Report response cache size and hit rate."""
+    return response_cache.stats()
+
+
+def compaction_stats_route(req: ApiRequest):
+    """Report prompt tokens saved by history compaction."""
+    return compaction_stats.snapshot()
+
+
+def model_stats(req: ApiRequest):
+    """Report per-model health, circuit-breaker state and hedging counters."""
+    return get_model_router().stats()
+
+
+def socket_stats(req: ApiRequest):
+    """Report WebSocket channels, open connections and frames kept for resumes (none under WSGI)."""
+    return channels.stats()
+
+
+class ApiRoute:
+    """A GET route both entry points serve: a Flask-style rule and its handler."""
+
+    __slots__ = ('rule', 'handler', 'blocking', 'pattern')
+
+    def __init__(self, rule: str, handler: Callable[[ApiRequest], object], blocking: bool = False):
+        self.rule = rule
+        self.handler = handler
+        self.blocking = blocking  # does I/O, so the asyncio path runs it in a thread
+        self.pattern = re.compile('^' + re.sub(r'<(\w+)>', r'(?P<\1>[^/]+)', rule) + '$') if '<' in rule else None
+
+
+API_ROUTES: List[ApiRoute] = [
+    ApiRoute('/api/usage', session_usage, agents.blocking),
+    ApiRoute('/api/stage', session_stage, agents.blocking),
+    ApiRoute('/api/transcripts', finished_transcripts, True),
+    ApiRoute('/api/transcripts/<session_id>', interview_transcript, True),
+    ApiRoute('/readyz', readyz),
+    # Rendering asks the session store for its size, which may mean I/O
+    ApiRoute('/metrics', metrics, agents.blocking),
+    ApiRoute('/api/stats/admission', admission_stats),
+    ApiRoute('/api/stats/speculation', speculation_stats),
+    ApiRoute('/api/stats/assets', asset_stats),
+    ApiRoute('/api/stats/transcripts', transcript_stats),
+    ApiRoute('/api/stats/stages', stage_stats_route),
+    ApiRoute('/api/stats/usage', usage_stats),
+    ApiRoute('/api/stats/profile', profile_stats_route),
+    ApiRoute('/api/stats/http', http_stats),
+    ApiRoute('/api/stats/sessions', session_stats, agents.blocking),
+    ApiRoute('/api/stats/cache', cache_stats),
+    ApiRoute('/api/stats/compaction', compaction_stats_route),
+    ApiRoute('/api/stats/models', model_stats),
+    ApiRoute('/api/stats/ws', socket_stats),
+]
+
+
+def call_route(route: ApiRoute, req: ApiRequest) -> Result:
+    """Run a route's handler, as (body, status, headers) whatever it returned or raised."""
+    try:
+        result = route.handler(req)
+    except API_ERRORS as e:
+        return error_result(e)
+    if isinstance(result, tuple):
+        return result
+    return result, 200, {}
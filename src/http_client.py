@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Shared, pooled HTTP client for upstream LLM calls.
+
+Every agent in the process goes through one keep-alive session so that
+turns reuse TCP+TLS connections to the Grok API instead of paying for a
+fresh handshake on every message and every fallback model.
+
+The asyncio serving path gets an equivalent non-blocking client (httpx),
+one per event loop.
+"""
+
+import asyncio
+import os
+import threading
+import time
+import weakref
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from profiling import span
+
+# Pool configuration (overridable through the environment)
+POOL_CONNECTIONS = int(os.getenv('GROK_POOL_CONNECTIONS', '4'))  # number of distinct hosts to keep pools for
+POOL_MAXSIZE = int(os.getenv('GROK_POOL_MAXSIZE', '32'))  # keep-alive connections per host
+POOL_BLOCK = os.getenv('GROK_POOL_BLOCK', 'false').lower() in ('1', 'true', 'yes')
+ASYNC_MAX_CONNECTIONS = int(os.getenv('GROK_ASYNC_MAX_CONNECTIONS', '256'))  # in-flight calls per event loop
+KEEPALIVE_EXPIRY = float(os.getenv('GROK_KEEPALIVE_EXPIRY', '60'))  # seconds an idle async connection is kept
+
+
+class PoolStats:
+    """Thread-safe counters describing how the connection pool is being used."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Zero all counters."""
+        with self._lock:
+            self.requests = 0
+            self.new_connections = 0
+            self.reused_connections = 0
+            self.in_use = 0
+            self.wait_time_total = 0.0
+            self.wait_time_max = 0.0
+
+    def record_checkout(self, wait_time: float, reused: bool):
+        """Record a connection being taken out of the pool."""
+        with self._lock:
+            self.requests += 1
+            self.in_use += 1
+            if reused:
+                self.reused_connections += 1
+            else:
+                self.new_connections += 1
+            self.wait_time_total += wait_time
+            if wait_time > self.wait_time_max:
+                self.wait_time_max = wait_time
+
+    def record_checkin(self):
+        """Record a connection being returned to (or discarded from) the pool."""
+        with self._lock:
+            if self.in_use > 0:
+                self.in_use -= 1
+
+    def snapshot(self) -> Dict:
+        """Return a point-in-time copy of the counters."""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": self.reused_connections,
+                "reuse_ratio": (self.reused_connections / self.requests) if self.requests else 0.0,
+                "in_use": self.in_use,
+                "wait_time_total_ms": round(self.wait_time_total * 1000, 3),
+                "wait_time_avg_ms": round((self.wait_time_total / self.requests) * 1000, 3) if self.requests else 0.0,
+                "wait_time_max_ms": round(self.wait_time_max * 1000, 3),
+            }
+
+
+# Process-wide counters; the pool classes below report into this object
+_pool_stats = PoolStats()
+
+
+class _TimedConnectMixin:
+    """Records new-connection setup (TCP, plus TLS for https) in the request profile, if any."""
+
+    def connect(self):
+        with span('upstream_connect'):
+            super().connect()
+
+
+class TimedHTTPConnection(_TimedConnectMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectMixin, HTTPSConnection):
+    pass
+
+
+class _InstrumentedPoolMixin:
+    """Times connection checkout and tracks whether a live connection was reused."""
+
+    def _get_conn(self, timeout=None):
+        start = time.perf_counter()
+        conn = super()._get_conn(timeout=timeout)
+        # A pooled connection that is still open keeps its socket; a fresh
+        # (or reset) one only gets a socket once the request is sent.
+        reused = getattr(conn, 'sock', None) is not None
+        _pool_stats.record_checkout(time.perf_counter() - start, reused)
+        return conn
+
+    def _put_conn(self, conn):
+        _pool_stats.record_checkin()
+        super()._put_conn(conn)
+
+
+class InstrumentedHTTPConnectionPool(_InstrumentedPoolMixin, HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class InstrumentedHTTPSConnectionPool(_InstrumentedPoolMixin, HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose pool manager builds instrumented connection pools."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': InstrumentedHTTPConnectionPool,
+            'https': InstrumentedHTTPSConnectionPool,
+        }
+
+
+class HTTPClient:
+    """Keep-alive HTTP client shared by every agent in the process."""
+
+    def __init__(self, pool_connections: int = POOL_CONNECTIONS, pool_maxsize: int = POOL_MAXSIZE,
+                 pool_block: bool = POOL_BLOCK):
+        """Create a session with a sized, instrumented connection pool."""
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.adapter = PooledHTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+            max_retries=0  # Fallback across models is handled by the agents
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """POST through the shared session (same signature as requests.post)."""
+        return self.session.post(url, **kwargs)
+
+    def warm(self, url: str, count: int, timeout: float) -> int:
+        """Open up to count idle connections (TCP, plus TLS for https) to url's host; returns how many."""
+        pool = self.adapter.get_connection(url)
+        conns = []
+        opened = 0
+        try:
+            for _ in range(min(count, self.pool_maxsize)):
+                conn = pool._get_conn()
+                conns.append(conn)
+                if getattr(conn, 'sock', None) is not None:
+                    continue
+                conn.timeout = timeout
+                try:
+                    conn.connect()
+                except OSError:
+                    break
+                opened += 1
+        finally:
+            for conn in conns:
+                pool._put_conn(conn)
+        return opened
+
+    def open_connections(self) -> int:
+        """Count connections currently open: idle sockets in the pools plus those checked out."""
+        idle = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None or pool.pool is None:
+                continue
+            idle += sum(1 for conn in list(pool.pool.queue) if conn is not None and getattr(conn, 'sock', None) is not None)
+        return idle + _pool_stats.snapshot()["in_use"]
+
+    def stats(self) -> Dict:
+        """Return pool configuration and usage counters."""
+        stats = _pool_stats.snapshot()
+        stats.update({
+            "pool_connections": self.pool_connections,
+            "pool_maxsize": self.pool_maxsize,
+            "pool_block": self.pool_block,
+            "open_connections": self.open_connections(),
+        })
+        return stats
+
+    def close(self):
+        """Close every pooled connection."""
+        self.session.close()
+
+
+_client: Optional[HTTPClient] = None
+_client_lock = threading.Lock()
+
+
+def get_http_client() -> HTTPClient:
+    """Return the process-wide HTTP client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HTTPClient()
+    return _client
+
+
+# One non-blocking client per event loop (httpx clients cannot be shared across loops)
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_http_client():
+    """Return the httpx.AsyncClient for the running event loop, creating it on first use."""
+    try:
+        import httpx
+    except ImportError:
+        raise RuntimeError("The asyncio serving path requires httpx (pip install httpx)")
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=POOL_MAXSIZE,
+                keepalive_expiry=KEEPALIVE_EXPIRY
+            )
+        )
+        _async_clients[loop] = client
+    return client
+
+
+def async_http_client_stats() -> Dict:
+    """Return connection counts for the running loop's async client (empty if none yet)."""
+    try:
+        client = _async_clients.get(asyncio.get_running_loop())
+    except RuntimeError:
+        return {}
+    if client is None:
+        return {}
+    stats = {"max_connections": ASYNC_MAX_CONNECTIONS}
+    # httpx does not expose pool state publicly; read httpcore's pool defensively
+    pool = getattr(getattr(client, '_transport', None), '_pool', None)
+    if pool is not None:
+        connections = list(getattr(pool, 'connections', []))
+        stats["open_connections"] = len(connections)
+        stats["idle_connections"] = sum(1 for conn in connections if conn.is_idle())
+        stats["queued_requests"] = sum(1 for req in getattr(pool, '_requests', []) if req.connection is None)
+    return stats
+
+
+async def close_async_http_client():
+    """Close the running loop's async client (call from the ASGI shutdown hook)."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _reset_after_fork():
+    """Forked workers must not share sockets with their parent."""
+    global _client, _client_lock, _pool_stats
+    _client = None
+    _client_lock = threading.Lock()
+    _pool_stats = PoolStats()
+    _async_clients.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
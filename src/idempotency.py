@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Idempotency keys for chat turns.
+
+A double-clicked send or a client retry used to run the same message
+twice: two upstream calls, and the candidate's message twice in the
+history. Clients now send an Idempotency-Key header with each message
+(the interview page does). The first request with a key runs the turn;
+a duplicate that arrives while it is in flight waits for it and gets the
+same reply, and one that arrives later is answered from the stored
+reply, for ACE_IDEMPOTENCY_TTL seconds. Either way only one upstream
+call is made. Reusing a key for a different message is an error.
+
+Keys are scoped to the session. With the in-memory session store they
+are held in this process, which is the only one serving the interview.
+With a shared store (SQLite or Redis, see SubmissionRegistry.share) each
+key's record lives in the store, since a duplicate can reach any worker:
+the first request claims it, and duplicates poll it for the reply.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from metrics import Counter, registry
+
+IDEMPOTENCY_TTL = float(os.getenv('ACE_IDEMPOTENCY_TTL', '600'))  # seconds a finished turn's reply is replayed
+IDEMPOTENCY_MAX = int(os.getenv('ACE_IDEMPOTENCY_MAX', '10000'))  # keys remembered per process
+IDEMPOTENCY_WAIT = float(os.getenv('ACE_IDEMPOTENCY_WAIT', '120'))  # seconds a duplicate waits for the original
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+# Polling interval for asyncio waiters (the original turn takes seconds)
+_ASYNC_POLL_SECONDS = 0.02
+# Polling interval for waiters on a shared-store record (each poll is a store round trip)
+_SHARED_POLL_SECONDS = 0.05
+
+idempotent_requests = registry.register(Counter(
+    'ace_idempotent_requests_total',
+    'Chat requests carrying an Idempotency-Key, by outcome (executed, coalesced, replayed, conflict).', ('outcome',)))
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different message."""
+
+
+class Submission:
+    """One keyed chat turn: in flight until finish(), then its reply is kept for replays."""
+
+    __slots__ = ('fingerprint', 'event', 'result', 'expires')
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.event = threading.Event()
+        self.result: Optional[Dict] = None  # the JSON reply; stays None if the turn failed
+        self.expires: Optional[float] = None  # set once finished
+
+    def wait(self, timeout: float = IDEMPOTENCY_WAIT) -> Optional[Dict]:
+        """The original turn's reply, or None if it failed or did not finish in time."""
+        self.event.wait(timeout)
+        return self.result
+
+    async def wait_async(self, timeout: float = IDEMPOTENCY_WAIT) -> Optional[Dict]:
+        """Non-blocking version of wait for the asyncio serving path."""
+        deadline = time.monotonic() + timeout
+        while not self.event.is_set() and time.monotonic() < deadline:
+            await asyncio.sleep(_ASYNC_POLL_SECONDS)
+        return self.result
+
+
+class SharedSubmission(Submission):
+    """A keyed turn whose record lives in a shared session store, so any worker can wait on it.
+
+    The record is JSON: {"fingerprint", "owner"} while the turn runs (it
+    expires after IDEMPOTENCY_WAIT if its worker dies), then
+    {"fingerprint", "result"} for the TTL. An abandoned turn's record is
+    deleted, which waiters read as a failure.
+    """
+
+    __slots__ = ('store', 'record_key', 'pending')
+
+    def __init__(self, fingerprint: str, store, record_key: str, pending: Optional[str] = None):
+        super().__init__(fingerprint)
+        self.store = store
+        self.record_key = record_key
+        self.pending = pending  # the in-flight record this worker claimed (None for a duplicate)
+
+    def _poll(self) -> bool:
+        """Read the record once; returns True once the turn finished or failed."""
+        data = self.store.read_key(self.record_key)
+        record = json.loads(data) if data is not None else None
+        if record is not None and 'result' not in record:
+            return False
+        self.result = record['result'] if record is not None else None
+        self.event.set()
+        return True
+
+    def wait(self, timeout: float = IDEMPOTENCY_WAIT) -> Optional[Dict]:
+        deadline = time.monotonic() + timeout
+        while not self.event.is_set() and not self._poll() and time.monotonic() < deadline:
+            time.sleep(_SHARED_POLL_SECONDS)
+        return self.result
+
+    async def wait_async(self, timeout: float = IDEMPOTENCY_WAIT) -> Optional[Dict]:
+        deadline = time.monotonic() + timeout
+        while not self.event.is_set() and not await asyncio.to_thread(self._poll) and time.monotonic() < deadline:
+            await asyncio.sleep(_SHARED_POLL_SECONDS)
+        return self.result
+
+
+def _fingerprint(message: str) -> str:
+    return hashlib.sha256(message.encode('utf-8')).hexdigest()
+
+
+class SubmissionRegistry:
+    """In-flight and recently finished keyed turns, bounded by count and TTL."""
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL, max_entries: int = IDEMPOTENCY_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.store = None  # a shared session store holding the records (None = this process)
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()  # (session_id, key) -> Submission, oldest first
+
+    def share(self, store):
+        """Keep the records in store if every worker sees it (a SessionStore's *_key methods)."""
+        self.store = store if store.shared else None
+
+    def begin(self, session_id: str, key: str, message: str) -> Tuple[Submission, bool]:
+        """Register a keyed turn; returns (submission, True) if this request should run it.
+
+        A False second value means the same turn is in flight or finished:
+        wait on the submission for its reply. Raises IdempotencyConflict
+        if the key was used for a different message.
+        """
+        fingerprint = _fingerprint(message)
+        if self.store is not None:
+            return self._begin_shared(session_id, key, fingerprint)
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry_key = (session_id, key[:MAX_KEY_LENGTH])
+            submission = self._entries.get(entry_key)
+            if submission is not None and submission.expires is not None and submission.expires < now:
+                del self._entries[entry_key]
+                submission = None
+            if submission is not None:
+                if submission.fingerprint != fingerprint:
+                    idempotent_requests.labels('conflict').inc()
+                    raise IdempotencyConflict("Idempotency-Key was already used for a different message")
+                idempotent_requests.labels('replayed' if submission.event.is_set() else 'coalesced').inc()
+                return submission, False
+            submission = Submission(fingerprint)
+            self._entries[entry_key] = submission
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        idempotent_requests.labels('executed').inc()
+        return submission, True
+
+    def _begin_shared(self, session_id: str, key: str, fingerprint: str) -> Tuple[Submission, bool]:
+        record_key = f"idempotency:{session_id}:{key[:MAX_KEY_LENGTH]}"
+        pending = json.dumps({'fingerprint': fingerprint, 'owner': os.urandom(8).hex()})
+        while True:
+            if self.store.claim_key(record_key, pending, IDEMPOTENCY_WAIT):
+                idempotent_requests.labels('executed').inc()
+                return SharedSubmission(fingerprint, self.store, record_key, pending), True
+            data = self.store.read_key(record_key)
+            if data is None:
+                continue  # expired or abandoned since the claim: claim it again
+            record = json.loads(data)
+            if record['fingerprint'] != fingerprint:
+                idempotent_requests.labels('conflict').inc()
+                raise IdempotencyConflict("Idempotency-Key was already used for a different message")
+            idempotent_requests.labels('replayed' if 'result' in record else 'coalesced').inc()
+            return SharedSubmission(fingerprint, self.store, record_key), False
+
+    def finish(self, submission: Submission, result: Dict):
+        """Record the turn's reply and release everyone waiting on it."""
+        if isinstance(submission, SharedSubmission):
+            submission.store.write_key(submission.record_key,
+                                       json.dumps({'fingerprint': submission.fingerprint, 'result': result}), self.ttl)
+        submission.result = result
+        submission.expires = time.monotonic() + self.ttl
+        submission.event.set()
+
+    def abandon(self, session_id: str, key: str, submission: Submission):
+        """Forget a turn that failed so a retry runs it again (waiters get None).
+
+        Does nothing once the turn finished, so callers can abandon
+        unconditionally on the way out.
+        """
+        if submission.event.is_set():
+            return
+        if isinstance(submission, SharedSubmission):
+            submission.store.release_key(submission.record_key, submission.pending)
+            submission.event.set()
+            return
+        with self._lock:
+            entry_key = (session_id, key[:MAX_KEY_LENGTH])
+            if self._entries.get(entry_key) is submission:
+                del self._entries[entry_key]
+        submission.event.set()
+
+    def _expire(self, now: float):
+        """Drop expired entries from the oldest end (caller holds the lock).
+
+        Turns mostly finish in the order they started, so this only looks at
+        as many entries as it drops; an expired entry behind one still in
+        flight is caught when it is looked up, and the count cap bounds the rest.
+        """
+        while self._entries:
+            submission = next(iter(self._entries.values()))
+            if submission.expires is None or submission.expires >= now:
+                break
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+submissions = SubmissionRegistry()
+
+
+def _reset_after_fork():
+    submissions._lock = threading.Lock()
+    submissions._entries = OrderedDict()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
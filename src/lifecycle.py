@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Process lifecycle: preloading, warmup, readiness and draining.
+
+The first requests a fresh process served used to pay for everything
+done lazily: compiling the Jinja templates, building the static assets,
+and opening (TLS) connections to Grok, all while a load balancer was
+already routing candidates to it. Now:
+- preload() does the process-independent work once, in the launcher's
+  master process before it forks, so workers share it copy-on-write
+  (gc.freeze() keeps the collector from touching, and so copying, those
+  pages)
+- warm_connections() / warm_connections_async() open upstream
+  connections in each worker, after the fork
+- readiness reports "ready" on /readyz only once warmup is done, and
+  "draining" once shutdown has begun, so traffic is only routed to
+  workers that can serve it at full speed
+"""
+
+import asyncio
+import gc
+import os
+import threading
+import time
+from typing import Dict
+from urllib.parse import urlparse
+
+WARM_CONNECTIONS = int(os.getenv('ACE_WARM_CONNECTIONS', '2'))  # upstream connections opened per worker at boot
+WARM_TIMEOUT = 5.0  # seconds allowed for each warmup connection
+
+
+class Readiness:
+    """Whether this process should receive traffic: starting, ready or draining."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.state = 'starting'
+        self.started_at = time.time()
+        self.ready_at = None
+        self.warm_connections = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.state == 'ready'
+
+    def mark_ready(self, warm_connections: int = 0):
+        with self._lock:
+            if self.state == 'starting':
+                self.state = 'ready'
+                self.ready_at = time.time()
+                self.warm_connections = warm_connections
+
+    def mark_draining(self):
+        with self._lock:
+            self.state = 'draining'
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "status": self.state,
+                "pid": os.getpid(),
+                "warmup_seconds": round(self.ready_at - self.started_at, 3) if self.ready_at else None,
+                "warm_connections": self.warm_connections,
+            }
+
+
+readiness = Readiness()
+
+
+def preload(app):
+    """Do the per-process setup that workers can share: templates, assets, serialized payloads, a replay cassette."""
+    from handlers import assets, init_reply_body
+    from providers import get_provider
+    from stages import FIRST_STAGE
+
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    assets.build()
+    init_reply_body(FIRST_STAGE)
+    get_provider().preload()
+    # Everything loaded so far lives as long as the process: keep the
+    # collector's bookkeeping writes off those pages after the fork
+    gc.collect()
+    gc.freeze()
+
+
+def warm_connections(count: int = WARM_CONNECTIONS) -> int:
+    """Open keep-alive connections to the upstream host in the shared pool; returns how many."""
+    from http_client import get_http_client
+    from providers import get_provider
+
+    provider = get_provider()
+    if count <= 0 or not provider.available or not provider.upstream_url:
+        return 0
+    return get_http_client().warm(provider.upstream_url, count, WARM_TIMEOUT)
+
+
+async def warm_connections_async(count: int = WARM_CONNECTIONS) -> int:
+    """Open connections to the upstream host in the running loop's client; returns how many."""
+    from http_client import get_async_http_client
+    from providers import get_provider
+
+    provider = get_provider()
+    if count <= 0 or not provider.available or not provider.upstream_url:
+        return 0
+    parsed = urlparse(provider.upstream_url)
+    origin = f'{parsed.scheme}://{parsed.netloc}/'
+    client = get_async_http_client()
+
+    async def probe() -> bool:
+        # httpx cannot open a connection without a request; a HEAD of the host is the cheapest one
+        try:
+            await client.head(origin, timeout=WARM_TIMEOUT)
+            return True
+        except Exception:
+            return False
+
+    results = await asyncio.gather(*(probe() for _ in range(count)))
+    return sum(results)
+
+
+def _reset_after_fork():
+    readiness._lock = threading.Lock()
+    readiness.state = 'starting'
+    readiness.started_at = time.time()
+    readiness.ready_at = None
+    readiness.warm_connections = 0
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -5,15 +5,23 @@ Main entry point for the application.
 
 import os
 import sys
-import json
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
+import time
+from flask import Flask, Response, g, render_template, request, redirect, url_for, session, jsonify, stream_with_context
 from dotenv import load_dotenv
 
 # Add src directory to path
 basedir = os.path.abspath(os.path.dirname(__file__))
 sys.path.insert(0, basedir)
 
-from agent import InterviewAgent
+from admission import admission
+from assets import ASSET_URL_PREFIX, compress_body, should_compress
+from handlers import (API_ERRORS, API_ROUTES, ApiRequest, ChatTurn, Result, agents, assets, call_route, error_event,
+                      error_result, init_reply_body, require_session, sse, start_interview)
+from lifecycle import readiness
+from idempotency import IDEMPOTENCY_HEADER, REPLAYED_HEADER
+from profiling import PROFILE_HEADER, PROFILE_MODE, RequestProfile, requested as profiling_requested, span
+from session_store import session_locks
+from metrics import observe_request
 
 # Load environment variables
 load_dotenv()
@@ -28,8 +36,53 @@ app = Flask(__name__,
             static_folder=os.path.join(project_root, 'static'))
 app.secret_key = 'your-secret-key-here'  # Needed for session
 
-# Initialize interview agent (one per session)
-agents = {}
+# Minified, fingerprinted and precompressed CSS/JS, built once per process
+assets.build()
+app.jinja_env.globals['asset_url'] = assets.url
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    # Opt-in span timings (ACE_PROFILE); a no-op lookup for unprofiled requests
+    mode = PROFILE_MODE != 'off' and profiling_requested(request.path, request.headers.get(PROFILE_HEADER))
+    if mode:
+        g.profile = RequestProfile(request.path, cprofile=(mode == 'cprofile'))
+        g.profile_token = g.profile.start()
+
+@app.after_request
+def observe_request_latency(response):
+    """Record route latency (to response headers, for streams) in the /metrics histograms."""
+    profile = g.pop('profile', None)
+    if profile is not None:
+        response.headers['Server-Timing'] = profile.server_timing()
+        profile.finish(g.pop('profile_token'))
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        observe_request(route, request.method, response.status_code, time.perf_counter() - started)
+    return response
+
+@app.after_request
+def compress_response(response):
+    """gzip larger JSON/HTML/text responses for clients that accept it (streams are left alone)."""
+    if response.is_streamed or response.direct_passthrough:
+        return response
+    body = response.get_data()
+    if should_compress(response.content_type, response.headers.get('Content-Encoding'), len(body),
+                       request.headers.get('Accept-Encoding')):
+        response.set_data(compress_body(body))
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+    return response
+
+@app.route(ASSET_URL_PREFIX + '<path:filename>', methods=['GET'])
+def static_asset(filename):
+    """Serve a fingerprinted asset, precompressed for the client, cacheable forever."""
+    asset = assets.lookup(filename)
+    if asset is None:
+        return jsonify({'error': 'Not found'}), 404
+    status, headers, body = asset.response(request.headers.get('Accept-Encoding'), request.headers.get('If-None-Match'))
+    return Response(body, status=status, headers=headers)
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
@@ -55,63 +108,140 @@ def interview():
         session_id = os.urandom(16).hex()
         session['session_id'] = session_id
     
-    if session_id not in agents:
-        agents[session_id] = InterviewAgent()
+    agents.get_or_create(session_id)
     
     return render_template('interview.html', name=name)
 
+def respond(result: Result):
+    """A Flask response for a shared handler's (body, status, headers)."""
+    body, status, headers = result
+    if isinstance(body, dict):
+        return jsonify(body), status, headers
+    return Response(body, status=status, headers=headers)
+
+def api_request(**params) -> ApiRequest:
+    """The parts of the current request the shared handlers read."""
+    headers = {name.lower(): value for name, value in request.headers.items()}
+    return ApiRequest(session.get('session_id'), request.args.to_dict(), headers, params)
+
+def api_view(route):
+    """A Flask view for one of the shared API_ROUTES."""
+    def view(**params):
+        return respond(call_route(route, api_request(**params)))
+    view.__doc__ = route.handler.__doc__
+    return view
+
+for api_route in API_ROUTES:
+    app.add_url_rule(api_route.rule, api_route.handler.__name__, api_view(api_route), methods=['GET'])
+
 @app.route('/api/chat/init', methods=['POST'])
 def init_chat():
     """Initialize the interview chat."""
-    session_id = session.get('session_id')
-    if not session_id:
-        return jsonify({'error': 'No session'}), 400
+    try:
+        session_id = require_session(session.get('session_id'))
+        with session_locks.hold(session_id):
+            with span('session'):
+                agent = agents.get_or_create(session_id)
+            start_interview(session_id, agent)
+            with span('session_save'):
+                agents.save(session_id, agent)
+    except API_ERRORS as e:
+        return respond(error_result(e))
     
-    if session_id not in agents:
-        agents[session_id] = InterviewAgent()
-    
-    agent = agents[session_id]
-    first_message = agent.initialize()
-    
-    return jsonify({
-        'message': first_message,
-        'role': 'assistant'
-    })
+    with span('serialize'):
+        return Response(init_reply_body(agent.stages.stage), mimetype='application/json')
+
+def begin_turn(check_room: bool = False) -> ChatTurn:
+    """The ChatTurn for the current chat request (raises one of API_ERRORS)."""
+    # Cache-Control: no-cache keeps the turn out of the shared response cache
+    return ChatTurn.begin(session.get('session_id'), request.get_json(silent=True), request.headers.get(IDEMPOTENCY_HEADER),
+                          not request.cache_control.no_cache, check_room)
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
     """Handle chat messages with the interview agent."""
-    session_id = session.get('session_id')
-    if not session_id:
-        return jsonify({'error': 'No session'}), 400
+    try:
+        turn = begin_turn()
+        if not turn.owner:
+            # A duplicate of a turn that is running or finished: answer with its reply
+            turn.replayed(turn.submission.wait())
+            return jsonify(turn.reply()), 200, {REPLAYED_HEADER: 'true'}
+        try:
+            with session_locks.hold(turn.session_id):
+                with span('session'):
+                    agent = agents.get_or_create(turn.session_id, initialize=True)
+                # Who answers (the Solution Architect or the Sales Manager) sets the speaker
+                turn.answering(agent)
+                # The agent delegates to the Solution Architect itself when it has the conversation
+                with admission.slot():
+                    reply = agent.get_response(turn.user_message, use_cache=turn.use_cache)
+                with span('session_save'):
+                    agents.save(turn.session_id, agent)
+                turn.answered(agent, reply)
+        finally:
+            turn.close()
+    except API_ERRORS as e:
+        return respond(error_result(e))
     
-    if session_id not in agents:
-        agents[session_id] = InterviewAgent()
-        agents[session_id].initialize()
-    
-    data = request.get_json()
-    user_message = data.get('message', '').strip()
-    
-    if not user_message:
-        return jsonify({'error': 'Message is required'}), 400
-    
-    agent = agents[session_id]
+    with span('serialize'):
+        return jsonify(turn.reply())
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Handle chat messages, streaming the reply back as Server-Sent Events."""
+    try:
+        # The status goes out before the turn gets a slot, so refuse now if it would be
+        turn = begin_turn(check_room=True)
+    except API_ERRORS as e:
+        return respond(error_result(e))
+    headers = {
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Stop reverse proxies from buffering the stream
+    }
     
-    # Get response from agent - it will automatically delegate to Solution Architect if needed
-    agent_response = agent.get_response(user_message)
+    def replay():
+        try:
+            turn.replayed(turn.submission.wait())
+        except API_ERRORS as e:
+            yield sse('error', error_event(e))
+            return
+        for event, data in turn.replay_events():
+            yield sse(event, data)
     
-    # Check if we're currently using Solution Architect to set the speaker
-    speaker = None
-    if agent.using_solution_architect:
-        speaker = 'Alex Chen (Solution Architect)'
+    # The lock is taken inside the generator so a response that is never
+    # iterated cannot leave the session locked
+    def generate():
+        try:
+            with session_locks.hold(turn.session_id):
+                agent = agents.get_or_create(turn.session_id, initialize=True)
+                turn.answering(agent)
+                yield sse('start', turn.start_event())
+                parts = []
+                with admission.slot():
+                    for chunk in agent.stream_response(turn.user_message, use_cache=turn.use_cache):
+                        parts.append(chunk)
+                        yield sse('delta', {'text': chunk})
+                agents.save(turn.session_id, agent)
+                turn.answered(agent, ''.join(parts))
+                yield sse('done', turn.done_event())
+        except Exception as e:
+            if not isinstance(e, API_ERRORS):
+                print(f"Exception in chat_stream: {str(e)}")
+            yield sse('error', error_event(e))
+        finally:
+            turn.close()
     
-    return jsonify({
-        'message': agent_response,
-        'role': 'assistant',
-        'speaker': speaker
-    })
+    if not turn.owner:
+        headers[REPLAYED_HEADER] = 'true'
+    return Response(
+        stream_with_context(generate() if turn.owner else replay()),
+        mimetype='text/event-stream',
+        headers=headers
+    )
 
 
 if __name__ == "__main__":
+    # Development server (reloader and debugger on); src/serve.py runs the app in production
+    readiness.mark_ready()
     app.run(debug=True, host='0.0.0.0', port=8080)
 
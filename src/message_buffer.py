@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Append-only, pre-serialized upstream message lists.
+
+Both agents used to rebuild their request's message list on every turn:
+copy every history dict, re-encode all of it as JSON, and (for the Sales
+Manager) string-compare each message against the start marker. The
+Solution Architect also put a "Context:" message, different every turn,
+right after its system prompt, so no two requests shared a prefix beyond
+the system prompt.
+
+A MessageBuffer mirrors one conversation history instead. Each message
+is JSON-encoded once, when it is appended, together with its token and
+character counts, and the shared system prompt is encoded once per
+process (Prefix). Assembling a request is then a list of ready-made
+fragments joined into the body in one C-level pass; the Python-level work
+per turn is proportional to the messages added since the last request.
+Per-turn extras such as the Solution Architect context go next to the
+newest message, so every request starts with the previous request's
+messages in the same order and byte-for-byte identical, which keeps
+provider-side prefix caching effective across turns.
+
+The buffer follows the history by appends only; a history that was
+replaced or shortened is re-encoded from scratch on the next request.
+With a token budget the ConversationCompactor decides which messages to
+send (summary, pins, recent tail) and the buffer reuses their fragments.
+"""
+
+import json
+from typing import Dict, Iterator, List, Optional
+
+from compaction import ConversationCompactor, message_tokens
+
+
+def encode_message(msg: Dict) -> bytes:
+    """One message as it appears in the request body's messages array."""
+    return json.dumps({"role": msg["role"], "content": msg["content"]}).encode('utf-8')
+
+
+class Prefix:
+    """Leading messages sent with every request (the system prompt), encoded once and shared."""
+
+    def __init__(self, messages: List[Dict]):
+        self.messages = messages
+        self.fragments = [encode_message(msg) for msg in messages]
+        self.tokens = sum(message_tokens(msg) for msg in messages)
+        self.chars = sum(len(msg["content"]) for msg in messages)
+
+
+class PreparedMessages:
+    """A request's message list as encoded fragments, with its size figures for usage records."""
+
+    __slots__ = ('fragments', 'tokens', 'chars')
+
+    def __init__(self, fragments: List[bytes], tokens: int, chars: int):
+        self.fragments = fragments
+        self.tokens = tokens
+        self.chars = chars
+
+    def encoded(self) -> bytes:
+        """The JSON messages array."""
+        return b'[' + b', '.join(self.fragments) + b']'
+
+    def __len__(self) -> int:
+        return len(self.fragments)
+
+    def __iter__(self) -> Iterator[Dict]:
+        """Decoded messages (for inspection; requests use encoded())."""
+        return (json.loads(fragment) for fragment in self.fragments)
+
+
+class MessageBuffer:
+    """Encoded mirror of one agent's conversation history."""
+
+    def __init__(self, prefix: Prefix, skip: Optional[str] = None):
+        self.prefix = prefix
+        self.skip = skip  # history messages with exactly this content are never sent
+        self.reset()
+
+    def reset(self):
+        self._source: Optional[List[Dict]] = None  # the history list being mirrored
+        self._synced = 0  # history[:_synced] has been taken in
+        self._last: Optional[Dict] = None  # history[_synced - 1], to notice a rewritten history
+        self.messages: List[Dict] = []  # history messages that are sent (not copies)
+        self._fragments: List[bytes] = []
+        self._tokens = [0]  # cumulative: _tokens[i] is the cost of messages[:i]
+        self._chars = [0]
+
+    def sync(self, history: List[Dict]) -> bool:
+        """Take in messages appended to history since the last call; True if it had to start over."""
+        restarted = (history is not self._source or len(history) < self._synced
+                     or (self._synced and history[self._synced - 1] is not self._last))
+        if restarted:
+            self.reset()
+            self._source = history
+        for msg in history[self._synced:]:
+            if msg["content"] == self.skip:
+                continue
+            self.messages.append(msg)
+            self._fragments.append(encode_message(msg))
+            self._tokens.append(self._tokens[-1] + message_tokens(msg))
+            self._chars.append(self._chars[-1] + len(msg["content"]))
+        self._synced = len(history)
+        self._last = history[-1] if history else None
+        return restarted
+
+    def build(self, history: List[Dict], compactor: ConversationCompactor,
+              before_last: Optional[Dict] = None) -> PreparedMessages:
+        """The request for history: prefix, (compacted) messages, and before_last ahead of the newest message."""
+        if self.sync(history):
+            # Summary and pins refer to positions in the history that was replaced
+            compactor.reset()
+        prefix = self.prefix
+        total = len(self.messages)
+        # before_last is not part of the prefix, but it counts against the budget like one
+        extra = encode_message(before_last) if before_last is not None else None
+        extra_tokens = message_tokens(before_last) if before_last is not None else 0
+        extra_chars = len(before_last["content"]) if before_last is not None else 0
+        fixed_tokens = prefix.tokens + extra_tokens
+        full_tokens = fixed_tokens + self._tokens[total]
+
+        if compactor.layout(fixed_tokens, self.messages, full_tokens):
+            fragments = list(prefix.fragments)
+            tokens, chars = fixed_tokens, prefix.chars + extra_chars
+            summary = compactor.summary_message()
+            if summary is not None:
+                fragments.append(encode_message(summary))
+                tokens += message_tokens(summary)
+                chars += len(summary["content"])
+            for i in compactor.pinned:
+                fragments.append(self._fragments[i])
+                tokens += self._tokens[i + 1] - self._tokens[i]
+                chars += self._chars[i + 1] - self._chars[i]
+            boundary = compactor.boundary
+            fragments.extend(self._fragments[boundary:])
+            tokens += self._tokens[total] - self._tokens[boundary]
+            chars += self._chars[total] - self._chars[boundary]
+            compactor.record(full_tokens, tokens, total)
+        else:
+            fragments = prefix.fragments + self._fragments
+            tokens, chars = full_tokens, prefix.chars + extra_chars + self._chars[total]
+            if compactor.budget > 0:
+                compactor.record(full_tokens, full_tokens, total)
+
+        if extra is not None:
+            fragments.insert(len(fragments) - 1 if total else len(fragments), extra)
+        return PreparedMessages(fragments, tokens, chars)
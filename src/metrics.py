@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Prometheus metrics in the text exposition format (GET /metrics).
+
+Under load the only signal used to be stdout prints. This module keeps
+counters, gauges and histograms for:
+- HTTP request latency per route (time to response headers) and status
+- upstream latency and errors per Grok model and agent role, per attempt
+  (time to first content for streams)
+- turns answered with a fallback (mock) response after an upstream failure
+- upstream calls in flight
+- interviews in the session store and recently active ones
+
+Updating a series is a dict lookup plus a short lock, so the hot path
+stays cheap; gauges that need I/O (session store size) are only evaluated
+when /metrics is scraped. No client library is needed.
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+ACTIVE_SESSION_WINDOW = float(os.getenv('ACE_ACTIVE_SESSION_WINDOW', '300'))  # seconds since the last turn
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; upstream calls take from a few hundred ms to the turn deadline
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_string(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    """A named metric family with a fixed set of label names."""
+
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values) -> object:
+        """The series for these label values (created on first use)."""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _series(self) -> List[Tuple[Tuple[str, ...], object]]:
+        with self._lock:
+            return sorted(self._children.items())
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class _Value:
+    __slots__ = ('_lock', 'value')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        """Increment the unlabelled series."""
+        self.labels().inc(amount)
+
+    def samples(self) -> List[str]:
+        return [f'{self.name}{_label_string(self.labelnames, key)} {_format_value(child.value)}'
+                for key, child in self._series()]
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class CallbackGauge(Metric):
+    """Gauge whose value is computed when metrics are scraped."""
+
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float]):
+        super().__init__(name, documentation)
+        self.callback = callback
+
+    def samples(self) -> List[str]:
+        try:
+            value = float(self.callback())
+        except Exception as e:
+            print(f"Metrics callback error ({self.name}): {str(e)}")
+            return []
+        return [f'{self.name} {_format_value(value)}']
+
+
+class _HistogramValue:
+    __slots__ = ('_lock', 'bounds', 'counts', 'sum')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._lock = threading.Lock()
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # per bucket (not cumulative), last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, child in self._series():
+            with child._lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f'{self.name}_bucket{_label_string(self.labelnames, key, le)} {cumulative}')
+            labels = _label_string(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+    """The metric families exported by this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    'ace_http_request_duration_seconds', 'Time to response headers per route.', ('route', 'method')))
+http_requests = registry.register(Counter(
+    'ace_http_requests_total', 'HTTP requests per route and status.', ('route', 'method', 'status')))
+upstream_duration = registry.register(Histogram(
+    'ace_upstream_request_duration_seconds',
+    'Upstream LLM attempt latency per model and agent (time to first content for streams).', ('model', 'agent', 'mode')))
+upstream_errors = registry.register(Counter(
+    'ace_upstream_errors_total', 'Failed upstream LLM attempts per model and agent.', ('model', 'agent')))
+upstream_in_flight = registry.register(Gauge(
+    'ace_upstream_in_flight', 'Upstream LLM calls in progress.', ('agent',)))
+fallback_responses = registry.register(Counter(
+    'ace_fallback_responses_total', 'Turns answered with a mock response because the upstream call failed.',
+    ('agent', 'reason')))
+
+
+class SessionActivity:
+    """Interviews with a chat turn in the last ACTIVE_SESSION_WINDOW seconds."""
+
+    def __init__(self, window: float = ACTIVE_SESSION_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._last_seen: Dict[str, float] = {}
+        self._prune_at = 1024
+
+    def touch(self, session_id: str):
+        now = time.monotonic()
+        with self._lock:
+            self._last_seen[session_id] = now
+            if len(self._last_seen) >= self._prune_at:
+                self._prune(now)
+
+    def _prune(self, now: float):
+        cutoff = now - self.window
+        self._last_seen = {sid: seen for sid, seen in self._last_seen.items() if seen >= cutoff}
+        self._prune_at = max(1024, 2 * len(self._last_seen))
+
+    def count(self) -> int:
+        with self._lock:
+            self._prune(time.monotonic())
+            return len(self._last_seen)
+
+
+session_activity = SessionActivity()
+registry.register(CallbackGauge(
+    'ace_sessions_active', f'Interviews with a chat turn in the last {ACTIVE_SESSION_WINDOW:g} seconds.',
+    session_activity.count))
+
+
+def register_gauge(name: str, documentation: str, callback: Callable[[], float]):
+    """Export a value computed at scrape time (e.g. the session store size)."""
+    registry.register(CallbackGauge(name, documentation, callback))
+
+
+class UpstreamCall:
+    """Tracks one upstream attempt: in flight until it ends, then timed or counted as an error.
+
+    Usable as a context manager for single requests; streams call
+    first_content(), succeeded(), failed() or abandoned() themselves.
+    Cancellation (a lost hedge, a client going away) counts as neither.
+    """
+
+    __slots__ = ('model', 'agent', 'mode', 'start', 'first_content_at', '_open')
+
+    def __init__(self, model: str, agent: str, streamed: bool = False):
+        self.model = model
+        self.agent = agent
+        self.mode = 'stream' if streamed else 'complete'
+        self.first_content_at: Optional[float] = None
+        self._open = True
+        upstream_in_flight.labels(agent).inc()
+        self.start = time.perf_counter()
+
+    def first_content(self):
+        if self.first_content_at is None:
+            self.first_content_at = time.perf_counter()
+
+    def succeeded(self):
+        end = self.first_content_at or time.perf_counter()
+        upstream_duration.labels(self.model, self.agent, self.mode).observe(end - self.start)
+        self._close()
+
+    def failed(self):
+        upstream_errors.labels(self.model, self.agent).inc()
+        self._close()
+
+    def abandoned(self):
+        self._close()
+
+    def _close(self):
+        if self._open:
+            self._open = False
+            upstream_in_flight.labels(self.agent).dec()
+
+    def __enter__(self) -> 'UpstreamCall':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.succeeded()
+        elif issubclass(exc_type, Exception):
+            self.failed()
+        else:
+            self.abandoned()
+        return False
+
+
+def observe_request(route: str, method: str, status: int, seconds: float):
+    """Record one served HTTP request."""
+    http_request_duration.labels(route, method).observe(seconds)
+    http_requests.labels(route, method, status).inc()
+
+
+def _reset_after_fork():
+    """Each worker exports its own series (Prometheus sums them across targets)."""
+    registry._lock = threading.Lock()
+    for metric in list(registry._metrics.values()):
+        metric._lock = threading.Lock()
+        metric._children = {}
+    session_activity._lock = threading.Lock()
+    session_activity._last_seen = {}
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Opt-in per-request profiling: span timings and sampled cProfile dumps.
+
+With ACE_PROFILE=header a chat request sent with `X-Ace-Profile: 1` gets
+span timings for where its non-upstream time goes:
+- session: loading (or creating) the interview from the session store
+- history: assembling the message list (compaction included)
+- upstream_connect / upstream_ttfb / upstream_body: opening a connection,
+  waiting for response headers, reading the response body
+- json_decode: decoding the upstream response
+- delegation: the turn handed to the Solution Architect (its upstream
+  call included)
+- retrieval: finding the transcript passages put into the Solution
+  Architect's context (part of delegation)
+- serialize / session_save: building the response, saving the interview
+
+Timings are returned in a Server-Timing header and aggregated per route
+(GET /api/stats/profile). `X-Ace-Profile: cprofile` (or sampling with
+ACE_PROFILE_SAMPLE) also records a cProfile of the request into
+ACE_PROFILE_DIR. ACE_PROFILE=all profiles every chat request.
+
+When a request is not profiled, span() is a context-variable lookup that
+returns a shared no-op object.
+"""
+
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+PROFILE_MODE = os.getenv('ACE_PROFILE', 'off').lower()  # off | header | all
+PROFILE_SAMPLE_RATE = float(os.getenv('ACE_PROFILE_SAMPLE', '0'))  # fraction of profiled requests that also get a cProfile
+PROFILE_DIR = os.getenv('ACE_PROFILE_DIR', 'profiles')
+
+PROFILE_HEADER = 'X-Ace-Profile'
+# Routes that can be profiled (responses that carry a Server-Timing header)
+PROFILED_ROUTES = ('/api/chat', '/api/chat/init')
+
+_current: ContextVar[Optional['RequestProfile']] = ContextVar('ace_request_profile', default=None)
+
+# One cProfile at a time: concurrent profilers would also see each other's threads on newer Pythons
+_cprofile_lock = threading.Lock()
+
+_UNSAFE_FILENAME = re.compile(r'[^A-Za-z0-9]+')
+
+
+class _NoSpan:
+    """Stand-in returned by span() when the request is not being profiled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span:
+    __slots__ = ('profile', 'name', 'exclude', 'start', 'excluded_before')
+
+    def __init__(self, profile: 'RequestProfile', name: str, exclude: Optional[str]):
+        self.profile = profile
+        self.name = name
+        self.exclude = exclude
+
+    def __enter__(self):
+        if self.exclude:
+            self.excluded_before = self.profile.spans.get(self.exclude, 0.0)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        if self.exclude:
+            elapsed -= self.profile.spans.get(self.exclude, 0.0) - self.excluded_before
+        self.profile.add(self.name, max(0.0, elapsed))
+        return False
+
+
+def span(name: str, exclude: Optional[str] = None):
+    """Time a block into the current request's profile (no-op if none).
+
+    exclude names a span whose time recorded inside this block is
+    subtracted, e.g. connecting while waiting for response headers.
+    """
+    profile = _current.get()
+    if profile is None:
+        return _NO_SPAN
+    return _Span(profile, name, exclude)
+
+
+def httpx_extensions() -> Optional[Dict]:
+    """httpx request extensions timing connection setup into the current profile (None if not profiling)."""
+    profile = _current.get()
+    if profile is None:
+        return None
+    return {'trace': profile.httpx_trace}
+
+
+class ProfileStats:
+    """Span timings aggregated per route over profiled requests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self.spans: Dict[str, Dict[str, Dict]] = {}
+        self.cprofiles_written = 0
+
+    def record(self, route: str, spans: Dict[str, float], cprofile_written: bool):
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            route_spans = self.spans.setdefault(route, {})
+            for name, seconds in spans.items():
+                totals = route_spans.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+                ms = seconds * 1000
+                totals["count"] += 1
+                totals["total_ms"] += ms
+                totals["max_ms"] = max(totals["max_ms"], ms)
+            if cprofile_written:
+                self.cprofiles_written += 1
+
+    def snapshot(self) -> Dict:
+        """Per route: profiled requests and average/max time per span."""
+        with self._lock:
+            routes = {}
+            for route, spans in self.spans.items():
+                routes[route] = {
+                    "requests": self.requests[route],
+                    "spans": {
+                        name: {
+                            "count": totals["count"],
+                            "avg_ms": round(totals["total_ms"] / totals["count"], 3),
+                            "max_ms": round(totals["max_ms"], 3),
+                        }
+                        for name, totals in spans.items()
+                    },
+                }
+            return {
+                "mode": PROFILE_MODE,
+                "sample_rate": PROFILE_SAMPLE_RATE,
+                "profile_dir": PROFILE_DIR,
+                "cprofiles_written": self.cprofiles_written,
+                "routes": routes,
+            }
+
+
+profile_stats = ProfileStats()
+
+
+def requested(route: str, header_value: Optional[str]) -> Optional[str]:
+    """How a request should be profiled: None, 'spans' or 'cprofile'."""
+    if PROFILE_MODE == 'off' or route not in PROFILED_ROUTES:
+        return None
+    header_value = (header_value or '').strip().lower()
+    if header_value == 'cprofile':
+        return 'cprofile'
+    if PROFILE_MODE != 'all' and header_value not in ('1', 'true', 'spans'):
+        return None
+    if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        return 'cprofile'
+    return 'spans'
+
+
+class RequestProfile:
+    """Span timings (and optionally a cProfile) for one request."""
+
+    def __init__(self, route: str, cprofile: bool = False):
+        self.route = route
+        self.spans: Dict[str, float] = {}  # seconds, in the order first recorded
+        self.started = time.perf_counter()
+        self.want_cprofile = cprofile
+        self._profiler: Optional[cProfile.Profile] = None
+        self._trace_started: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    async def httpx_trace(self, event_name: str, info: Dict):
+        """httpcore trace hook: records TCP connect and TLS handshake as upstream_connect."""
+        if not event_name.startswith(('connection.connect_tcp.', 'connection.start_tls.')):
+            return
+        step, _, phase = event_name.rpartition('.')
+        if phase == 'started':
+            self._trace_started[step] = time.perf_counter()
+        elif step in self._trace_started:
+            self.add('upstream_connect', time.perf_counter() - self._trace_started.pop(step))
+
+    def start(self):
+        """Make this the current profile; returns a token for finish()."""
+        if self.want_cprofile and _cprofile_lock.acquire(blocking=False):
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return _current.set(self)
+
+    def server_timing(self) -> str:
+        """Server-Timing header value (durations in milliseconds)."""
+        entries = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.spans.items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.3f}")
+        return ', '.join(entries)
+
+    def finish(self, token):
+        """Stop profiling, restore the previous context and record the spans."""
+        _current.reset(token)
+        written = False
+        if self._profiler is not None:
+            self._profiler.disable()
+            try:
+                written = self._dump()
+            finally:
+                self._profiler = None
+                _cprofile_lock.release()
+        self.add('total', time.perf_counter() - self.started)
+        profile_stats.record(self.route, self.spans, written)
+
+    def _dump(self) -> bool:
+        route = _UNSAFE_FILENAME.sub('_', self.route).strip('_')
+        path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{route}-{os.urandom(3).hex()}.prof")
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            self._profiler.dump_stats(path)
+        except OSError as e:
+            print(f"Profile dump error: {str(e)}")
+            return False
+        return True
+
+
+def _reset_after_fork():
+    global _cprofile_lock
+    _cprofile_lock = threading.Lock()
+    profile_stats._lock = threading.Lock()
+    profile_stats.requests = {}
+    profile_stats.spans = {}
+    profile_stats.cprofiles_written = 0
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
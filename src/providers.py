@@ -0,0 +1,656 @@
+#!/usr/bin/env python3
+"""
+LLM providers: where the agents' chat completions come from.
+
+Both agents used to call the Grok API directly, and the only way to run
+without it was the mock mode (no GROK_API_KEY), whose keyword replies
+skip the real prompts, stage hand-offs and payloads. The agents now ask
+a Provider instead, chosen with ACE_PROVIDER:
+- grok (default): the Grok chat/completions API, through the shared
+  connection pool and model router
+- record: the same, and every complete reply is also appended to the
+  ACE_CASSETTE file (JSONL: request hash, agent, model, messages,
+  generation settings, reply, token usage and finish reason)
+- replay: replies from the cassette, without any network access, after
+  ACE_REPLAY_LATENCY seconds of artificial latency (a number, or a
+  spec such as uniform:0.2,0.8 as for tools/grok_stub.py). A request
+  that was never recorded fails like an upstream error, so the agent
+  falls back to its mock reply
+- mock: no provider; the agents always use their mock replies
+
+Cassette entries are matched by a hash of the agent, the messages (with
+whitespace runs collapsed) and the generation settings. The model is
+left out, so a reply recorded from a fallback model still replays, and
+so is streaming: a streamed reply replays as a completion and the other
+way round. When an entry was recorded more than once, the last one wins.
+
+A provider that is not available (grok or record without an API key)
+leaves the agents on their mock replies. Speculative replies
+(speculation.py) are claimed in front of every backend.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+import requests
+
+try:
+    import httpx  # Only needed for the asyncio (ASGI) serving path
+except ImportError:
+    httpx = None
+
+from http_client import get_async_http_client, get_http_client
+from message_buffer import PreparedMessages
+from metrics import Counter, UpstreamCall, registry
+from profiling import httpx_extensions, span
+from router import UpstreamError, get_model_router
+from speculation import speculator
+from usage import SALES_MANAGER
+
+# Grok API configuration
+GROK_API_KEY = os.getenv('GROK_API_KEY')
+GROK_API_URL = os.getenv('GROK_API_URL', 'https://api.x.ai/v1/chat/completions')  # Overridable to point at a local stand-in (tools/grok_stub.py)
+
+PROVIDER = os.getenv('ACE_PROVIDER', 'grok').lower()  # grok | record | replay | mock
+CASSETTE = os.getenv('ACE_CASSETTE', 'cassettes/grok.jsonl')  # written by record, read by replay
+REPLAY_LATENCY = os.getenv('ACE_REPLAY_LATENCY', '0')  # seconds before a replayed reply (number or latency spec)
+
+# Size (in words) of the chunks mock and replayed responses are streamed in
+MOCK_STREAM_CHUNK_WORDS = 3
+
+replay_requests = registry.register(Counter(
+    'ace_replay_requests_total', 'Completions asked of the replay provider, by result (hit, miss).', ('result',)))
+cassette_records = registry.register(Counter(
+    'ace_cassette_records_total', 'Replies written to the cassette by the record provider.'))
+
+
+def _grok_headers(api_key: str, stream: bool = False) -> Dict:
+    """Build request headers for the Grok API."""
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    if stream:
+        headers["Accept"] = "text/event-stream"
+    return headers
+
+
+def _grok_payload(model: str, messages: List[Dict], stream: bool = False, generation: Optional[Dict] = None) -> Dict:
+    """Build a chat/completions request body (generation overrides max_tokens/temperature)."""
+    payload = {
+        "model": model,
+        "messages": messages,
+        "max_tokens": 2048,
+        "temperature": 0.7
+    }
+    if generation:
+        payload.update(generation)
+    if stream:
+        payload["stream"] = True
+        # Ask for token counts in the final chunk (they are not sent otherwise when streaming)
+        payload["stream_options"] = {"include_usage": True}
+    return payload
+
+
+def _grok_body(model: str, messages: List[Dict], stream: bool = False, generation: Optional[Dict] = None) -> bytes:
+    """Serialize a chat/completions request body (its size is recorded per turn).
+
+    Pre-encoded messages (PreparedMessages) are spliced in as they are.
+    """
+    if not isinstance(messages, PreparedMessages):
+        return json.dumps(_grok_payload(model, messages, stream, generation)).encode('utf-8')
+    head, tail = json.dumps(_grok_payload(model, [], stream, generation)).split('"messages": []', 1)
+    return b''.join((head.encode('utf-8'), b'"messages": ', messages.encoded(), tail.encode('utf-8')))
+
+
+def _parse_stream_line(line: str, usage: Optional[Dict] = None, ending: Optional[Dict] = None) -> Optional[str]:
+    """Extract the content delta from one SSE line of a streamed completion.
+
+    If the chunk carries token counts they are copied into usage, and its
+    finish_reason into ending.
+    """
+    if not line or not line.startswith('data:'):
+        return None
+    data = line[len('data:'):].strip()
+    if data == '[DONE]':
+        return None
+    event = json.loads(data)
+    if usage is not None and event.get("usage"):
+        usage.update(event["usage"])
+    choices = event.get("choices") or [{}]
+    if ending is not None and choices[0].get("finish_reason"):
+        ending["finish_reason"] = choices[0]["finish_reason"]
+    return (choices[0].get("delta") or {}).get("content") or None
+
+
+def chunk_text(text: str, words_per_chunk: int = MOCK_STREAM_CHUNK_WORDS) -> Iterator[str]:
+    """Split text into small chunks (preserving whitespace) to simulate token streaming."""
+    words = text.split(' ')
+    for i in range(0, len(words), words_per_chunk):
+        chunk = ' '.join(words[i:i + words_per_chunk])
+        if i + words_per_chunk < len(words):
+            chunk += ' '
+        yield chunk
+
+
+def _error_detail(response) -> str:
+    """Describe a non-200 upstream response for logs and fallback notes."""
+    try:
+        detail = str(response.json())
+    except ValueError:
+        detail = response.text[:500]
+    return f"Status {response.status_code}: {detail}"
+
+
+def _complete_grok(api_url: str, api_key: str, messages: List[Dict], meta: Optional[Dict] = None,
+                   generation: Optional[Dict] = None, agent: str = SALES_MANAGER) -> str:
+    """Get a chat completion from Grok through the shared model router.
+
+    If meta is given it receives the model that answered, the request body
+    size, the API-reported token usage and the finish reason ("length" when
+    the reply was cut off at max_tokens); generation carries the stage's
+    request settings and agent labels the call in metrics. Raises
+    UpstreamError with the last error if every attempt fails.
+    """
+    def attempt(model: str, timeout: float):
+        body = _grok_body(model, messages, generation=generation)
+        with UpstreamCall(model, agent):
+            # Headers and body are read separately so a request profile can tell them apart
+            with span('upstream_ttfb', exclude='upstream_connect'):
+                response = get_http_client().post(
+                    api_url,
+                    headers=_grok_headers(api_key),
+                    data=body,
+                    timeout=timeout,
+                    stream=True
+                )
+            with span('upstream_body'):
+                response.content
+            if response.status_code != 200:
+                raise UpstreamError(_error_detail(response))
+            with span('json_decode'):
+                data = response.json()
+            choice = data["choices"][0]
+            return choice["message"]["content"], {"model": model, "payload_bytes": len(body), "usage": data.get("usage"),
+                                                  "finish_reason": choice.get("finish_reason")}
+    
+    content, info = get_model_router().complete(attempt)
+    if meta is not None:
+        meta.update(info)
+    return content
+
+
+def _stream_grok(api_url: str, api_key: str, messages: List[Dict], meta: Optional[Dict] = None,
+                 generation: Optional[Dict] = None, agent: str = SALES_MANAGER) -> Iterator[str]:
+    """Stream a chat completion from Grok, yielding content deltas as they arrive.
+
+    Models come from the shared router (healthy first, open breakers skipped).
+    Once any content has been yielded the stream is committed to that model;
+    errors before that point move on to the next model. meta is filled in as
+    for _complete_grok. Raises UpstreamError if every attempt fails.
+    """
+    router = get_model_router()
+    last_error = None
+    for model, timeout in router.plan():
+        yielded = False
+        usage = {}
+        ending = {}
+        body = _grok_body(model, messages, stream=True, generation=generation)
+        call = UpstreamCall(model, agent, streamed=True)
+        try:
+            with span('upstream_ttfb', exclude='upstream_connect'):
+                response = get_http_client().post(
+                    api_url,
+                    headers=_grok_headers(api_key, stream=True),
+                    data=body,
+                    timeout=timeout,
+                    stream=True
+                )
+            with response:
+                if response.status_code != 200:
+                    raise UpstreamError(f"Status {response.status_code}: {response.text[:500]}")
+                
+                # SSE is UTF-8 by definition; requests would otherwise assume ISO-8859-1 for text/*
+                response.encoding = 'utf-8'
+                # Read to the end of the body (past [DONE]) so the connection goes back to the pool
+                for line in response.iter_lines(decode_unicode=True):
+                    delta = _parse_stream_line(line, usage, ending)
+                    if delta:
+                        if not yielded:
+                            call.first_content()
+                            if meta is not None:
+                                meta.update({"model": model, "payload_bytes": len(body), "usage": usage})
+                        yielded = True
+                        yield delta
+            router.record_success(model)
+            call.succeeded()
+            if meta is not None and ending:
+                meta.update(ending)
+            return
+        except (UpstreamError, requests.exceptions.RequestException, ValueError) as e:
+            router.record_failure(model, str(e))
+            call.failed()
+            if yielded:
+                # Part of the answer is already with the client - stop here
+                print(f"Grok stream interrupted: {str(e)}")
+                if meta is not None:
+                    meta["truncated"] = True
+                return
+            last_error = f"{model}: {str(e)}"
+        except BaseException:
+            # The client went away mid-stream - that says nothing about the model
+            router.release(model)
+            call.abandoned()
+            raise
+    
+    raise UpstreamError(last_error or "No models available")
+
+
+async def _complete_grok_async(api_url: str, api_key: str, messages: List[Dict], meta: Optional[Dict] = None,
+                               generation: Optional[Dict] = None, agent: str = SALES_MANAGER) -> str:
+    """Non-blocking version of _complete_grok for the asyncio serving path."""
+    client = get_async_http_client()
+    
+    async def attempt(model: str, timeout: float):
+        body = _grok_body(model, messages, generation=generation)
+        with UpstreamCall(model, agent):
+            request = client.build_request(
+                'POST',
+                api_url,
+                headers=_grok_headers(api_key),
+                content=body,
+                timeout=timeout,
+                extensions=httpx_extensions()
+            )
+            with span('upstream_ttfb', exclude='upstream_connect'):
+                response = await client.send(request, stream=True)
+            try:
+                with span('upstream_body'):
+                    await response.aread()
+            finally:
+                await response.aclose()
+            if response.status_code != 200:
+                raise UpstreamError(_error_detail(response))
+            with span('json_decode'):
+                data = response.json()
+            choice = data["choices"][0]
+            return choice["message"]["content"], {"model": model, "payload_bytes": len(body), "usage": data.get("usage"),
+                                                  "finish_reason": choice.get("finish_reason")}
+    
+    content, info = await get_model_router().complete_async(attempt)
+    if meta is not None:
+        meta.update(info)
+    return content
+
+
+async def _stream_grok_async(api_url: str, api_key: str, messages: List[Dict], meta: Optional[Dict] = None,
+                             generation: Optional[Dict] = None, agent: str = SALES_MANAGER) -> AsyncIterator[str]:
+    """Non-blocking version of _stream_grok for the asyncio serving path."""
+    client = get_async_http_client()
+    router = get_model_router()
+    last_error = None
+    for model, timeout in router.plan():
+        yielded = False
+        usage = {}
+        ending = {}
+        body = _grok_body(model, messages, stream=True, generation=generation)
+        call = UpstreamCall(model, agent, streamed=True)
+        try:
+            async with client.stream(
+                'POST',
+                api_url,
+                headers=_grok_headers(api_key, stream=True),
+                content=body,
+                timeout=timeout,
+                extensions=httpx_extensions()
+            ) as response:
+                if response.status_code != 200:
+                    error_body = await response.aread()
+                    raise UpstreamError(f"Status {response.status_code}: {error_body[:500].decode('utf-8', 'replace')}")
+                
+                async for line in response.aiter_lines():
+                    delta = _parse_stream_line(line, usage, ending)
+                    if delta:
+                        if not yielded:
+                            call.first_content()
+                            if meta is not None:
+                                meta.update({"model": model, "payload_bytes": len(body), "usage": usage})
+                        yielded = True
+                        yield delta
+            router.record_success(model)
+            call.succeeded()
+            if meta is not None and ending:
+                meta.update(ending)
+            return
+        except (UpstreamError, httpx.HTTPError, ValueError) as e:
+            error = str(e) or type(e).__name__
+            router.record_failure(model, error)
+            call.failed()
+            if yielded:
+                print(f"Grok stream interrupted: {error}")
+                if meta is not None:
+                    meta["truncated"] = True
+                return
+            last_error = f"{model}: {error}"
+        except BaseException:
+            router.release(model)
+            call.abandoned()
+            raise
+    
+    raise UpstreamError(last_error or "No models available")
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """Build an artificial latency sampler (seconds) from a number or a spec.
+
+    S | fixed:S | uniform:LOW,HIGH | normal:MEAN,STDDEV | lognormal:MEDIAN,SIGMA | exponential:MEAN
+    """
+    kind, _, args = spec.partition(':')
+    if not args:
+        kind, args = 'fixed', kind
+    values = [float(v) for v in args.split(',') if v]
+    if kind == 'fixed':
+        return lambda: values[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(values[0], values[1])
+    if kind == 'normal':
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == 'lognormal':
+        mu = math.log(values[0])
+        return lambda: random.lognormvariate(mu, values[1])
+    if kind == 'exponential':
+        return lambda: random.expovariate(1.0 / values[0])
+    raise ValueError(f"Unknown latency spec: {spec}")
+
+
+def request_hash(agent: str, messages: List[Dict], generation: Optional[Dict] = None) -> str:
+    """Cassette key of a request: agent, messages (whitespace runs collapsed) and generation settings."""
+    normalized = [[msg["role"], " ".join(msg["content"].split())] for msg in messages]
+    key = json.dumps([agent, normalized, generation or {}], sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class Provider:
+    """Source of chat completions for the agents.
+
+    complete() and stream() fill meta with the model that answered, the
+    request body size and the token usage, and raise UpstreamError when
+    no reply can be had; generation carries the stage's request settings
+    and agent labels the call. Backends implement the underscored methods.
+    """
+
+    name = 'mock'
+    upstream_url: Optional[str] = None  # host whose connections are warmed at boot (None = no network calls)
+
+    @property
+    def available(self) -> bool:
+        """Whether the agents should ask this provider at all (otherwise they use their mock replies)."""
+        return False
+
+    def preload(self):
+        """Load what can be shared by forked workers (called once, before the fork)."""
+
+    def complete(self, messages: List[Dict], meta: Optional[Dict] = None, generation: Optional[Dict] = None,
+                 agent: str = SALES_MANAGER) -> str:
+        """One reply to messages."""
+        # The same request may already have been answered speculatively
+        speculation = speculator.claim(messages, generation)
+        if speculation is not None:
+            if meta is not None:
+                meta.update(speculation.meta)
+            return speculation.text
+        return self._complete(messages, meta, generation, agent)
+
+    def stream(self, messages: List[Dict], meta: Optional[Dict] = None, generation: Optional[Dict] = None,
+               agent: str = SALES_MANAGER) -> Iterator[str]:
+        """One reply to messages, as content deltas."""
+        speculation = speculator.claim(messages, generation)
+        if speculation is not None:
+            if meta is not None:
+                meta.update(speculation.meta)
+            yield from chunk_text(speculation.text)
+            return
+        yield from self._stream(messages, meta, generation, agent)
+
+    async def complete_async(self, messages: List[Dict], meta: Optional[Dict] = None, generation: Optional[Dict] = None,
+                             agent: str = SALES_MANAGER) -> str:
+        """Non-blocking version of complete for the asyncio serving path."""
+        speculation = await speculator.claim_async(messages, generation)
+        if speculation is not None:
+            if meta is not None:
+                meta.update(speculation.meta)
+            return speculation.text
+        return await self._complete_async(messages, meta, generation, agent)
+
+    async def stream_async(self, messages: List[Dict], meta: Optional[Dict] = None, generation: Optional[Dict] = None,
+                           agent: str = SALES_MANAGER) -> AsyncIterator[str]:
+        """Non-blocking version of stream for the asyncio serving path."""
+        speculation = await speculator.claim_async(messages, generation)
+        if speculation is not None:
+            if meta is not None:
+                meta.update(speculation.meta)
+            for chunk in chunk_text(speculation.text):
+                yield chunk
+            return
+        async for delta in self._stream_async(messages, meta, generation, agent):
+            yield delta
+
+    def _complete(self, messages, meta, generation, agent) -> str:
+        raise UpstreamError("No LLM provider configured")
+
+    def _stream(self, messages, meta, generation, agent) -> Iterator[str]:
+        yield self._complete(messages, meta, generation, agent)
+
+    async def _complete_async(self, messages, meta, generation, agent) -> str:
+        return self._complete(messages, meta, generation, agent)
+
+    async def _stream_async(self, messages, meta, generation, agent) -> AsyncIterator[str]:
+        yield await self._complete_async(messages, meta, generation, agent)
+
+
+class GrokProvider(Provider):
+    """The live Grok API."""
+
+    name = 'grok'
+
+    def __init__(self, api_url: str = GROK_API_URL, api_key: Optional[str] = GROK_API_KEY):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.upstream_url = api_url
+
+    @property
+    def available(self) -> bool:
+        return bool(self.api_key)
+
+    def _complete(self, messages, meta, generation, agent) -> str:
+        return _complete_grok(self.api_url, self.api_key, messages, meta, generation, agent)
+
+    def _stream(self, messages, meta, generation, agent) -> Iterator[str]:
+        return _stream_grok(self.api_url, self.api_key, messages, meta, generation, agent)
+
+    async def _complete_async(self, messages, meta, generation, agent) -> str:
+        return await _complete_grok_async(self.api_url, self.api_key, messages, meta, generation, agent)
+
+    def _stream_async(self, messages, meta, generation, agent) -> AsyncIterator[str]:
+        return _stream_grok_async(self.api_url, self.api_key, messages, meta, generation, agent)
+
+
+class RecordingProvider(GrokProvider):
+    """The live Grok API, with every complete reply appended to a cassette."""
+
+    name = 'record'
+
+    def __init__(self, api_url: str = GROK_API_URL, api_key: Optional[str] = GROK_API_KEY, path: str = CASSETTE):
+        super().__init__(api_url, api_key)
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _complete(self, messages, meta, generation, agent) -> str:
+        meta = {} if meta is None else meta
+        text = super()._complete(messages, meta, generation, agent)
+        self._record(agent, messages, generation, text, meta)
+        return text
+
+    def _stream(self, messages, meta, generation, agent) -> Iterator[str]:
+        meta = {} if meta is None else meta
+        parts = []
+        for delta in super()._stream(messages, meta, generation, agent):
+            parts.append(delta)
+            yield delta
+        if not meta.get("truncated"):
+            self._record(agent, messages, generation, "".join(parts), meta)
+
+    async def _complete_async(self, messages, meta, generation, agent) -> str:
+        meta = {} if meta is None else meta
+        text = await super()._complete_async(messages, meta, generation, agent)
+        await asyncio.to_thread(self._record, agent, messages, generation, text, meta)
+        return text
+
+    async def _stream_async(self, messages, meta, generation, agent) -> AsyncIterator[str]:
+        meta = {} if meta is None else meta
+        parts = []
+        async for delta in super()._stream_async(messages, meta, generation, agent):
+            parts.append(delta)
+            yield delta
+        if not meta.get("truncated"):
+            await asyncio.to_thread(self._record, agent, messages, generation, "".join(parts), meta)
+
+    def _record(self, agent: str, messages: List[Dict], generation: Optional[Dict], text: str, meta: Dict):
+        decoded = [{"role": msg["role"], "content": msg["content"]} for msg in messages]
+        entry = {
+            "key": request_hash(agent, decoded, generation),
+            "agent": agent,
+            "model": meta.get("model"),
+            "messages": decoded,
+            "generation": generation,
+            "response": text,
+            "usage": meta.get("usage") or None,
+            "finish_reason": meta.get("finish_reason"),
+            "recorded_at": round(time.time(), 3),
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+        cassette_records.inc()
+
+
+class ReplayProvider(Provider):
+    """Recorded replies from a cassette, after artificial latency; no network access."""
+
+    name = 'replay'
+
+    def __init__(self, path: str = CASSETTE, latency: Optional[Callable[[], float]] = None):
+        self.path = path
+        self.latency = latency or parse_latency(REPLAY_LATENCY)
+        self._entries: Optional[Dict[str, Dict]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    def preload(self):
+        self._load()
+
+    def _load(self) -> Dict[str, Dict]:
+        """The cassette's entries by request hash (read on first use)."""
+        if self._entries is None:
+            with self._lock:
+                if self._entries is None:
+                    self._entries = self._read()
+        return self._entries
+
+    def _read(self) -> Dict[str, Dict]:
+        entries = {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for line_number, line in enumerate(f, 1):
+                    try:
+                        entry = json.loads(line)
+                        entries[entry["key"]] = entry
+                    except (ValueError, KeyError, TypeError):
+                        print(f"{self.path}:{line_number}: skipping invalid cassette entry")
+        except FileNotFoundError:
+            print(f"Cassette {self.path} not found; every request will miss")
+        return entries
+
+    def _lookup(self, messages, meta: Optional[Dict], generation: Optional[Dict], agent: str) -> str:
+        entry = self._load().get(request_hash(agent, list(messages), generation))
+        if entry is None:
+            replay_requests.labels('miss').inc()
+            raise UpstreamError(f"No recorded reply for this request in {self.path}")
+        replay_requests.labels('hit').inc()
+        if meta is not None:
+            model = entry.get("model") or self.name
+            meta.update({"model": model, "payload_bytes": len(_grok_body(model, messages, generation=generation)),
+                         "usage": entry.get("usage"), "finish_reason": entry.get("finish_reason")})
+        return entry["response"]
+
+    def _complete(self, messages, meta, generation, agent) -> str:
+        text = self._lookup(messages, meta, generation, agent)
+        time.sleep(self.latency())
+        return text
+
+    def _stream(self, messages, meta, generation, agent) -> Iterator[str]:
+        text = self._complete(messages, meta, generation, agent)
+        yield from chunk_text(text)
+
+    async def _complete_async(self, messages, meta, generation, agent) -> str:
+        text = self._lookup(messages, meta, generation, agent)
+        await asyncio.sleep(self.latency())
+        return text
+
+    async def _stream_async(self, messages, meta, generation, agent) -> AsyncIterator[str]:
+        text = await self._complete_async(messages, meta, generation, agent)
+        for chunk in chunk_text(text):
+            yield chunk
+
+
+def make_provider(name: str) -> Provider:
+    """Build the provider named by ACE_PROVIDER."""
+    if name == 'grok':
+        return GrokProvider()
+    if name == 'record':
+        return RecordingProvider()
+    if name == 'replay':
+        return ReplayProvider()
+    if name in ('mock', 'none'):
+        return Provider()
+    raise ValueError(f"Unknown ACE_PROVIDER {name!r} (expected grok, record, replay or mock)")
+
+
+_provider: Optional[Provider] = None
+_provider_lock = threading.Lock()
+
+
+def get_provider() -> Provider:
+    """Return the process-wide provider, creating it on first use."""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = make_provider(PROVIDER)
+    return _provider
+
+
+def _reset_after_fork():
+    """Workers keep the provider (and a replayed cassette, shared copy-on-write) but not its locks."""
+    global _provider_lock
+    _provider_lock = threading.Lock()
+    if _provider is not None and hasattr(_provider, '_lock'):
+        _provider._lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Opt-in cache of upstream responses for turns that do not depend on the
+individual candidate.
+
+Many Solution Architect questions are the same across interviews ("how
+does Claude compare to GPT-4", latency, safety). With ACE_RESPONSE_CACHE
+enabled, a successful upstream answer is cached under (scenario, stage,
+agent, context, normalized message) and served to the next candidate who
+asks the same thing, optionally also for near-duplicate wording. Entries
+expire after a TTL and the cache is bounded with LRU eviction.
+
+An answer also depends on what the agent was shown besides the question:
+its earlier turns with this candidate and any transcript excerpts
+retrieved for it. The context part of the key is a fingerprint of both
+(context_fingerprint), so an answer is only shared between interviews
+where they match; in practice, a first question asked with nothing
+retrieved.
+
+Turns that must stay adaptive are never cached: long messages (drafts,
+candidate-specific detail) and any request sent with
+`Cache-Control: no-cache`.
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+RESPONSE_CACHE = os.getenv('ACE_RESPONSE_CACHE', 'false').lower() in ('1', 'true', 'yes')
+CACHE_TTL = float(os.getenv('ACE_RESPONSE_CACHE_TTL', '3600'))  # seconds an answer is served for
+CACHE_MAX_ENTRIES = int(os.getenv('ACE_RESPONSE_CACHE_MAX', '512'))
+# Word-set (Jaccard) similarity at which a differently worded message counts as the same question (0 = exact only)
+SIMILARITY_THRESHOLD = float(os.getenv('ACE_RESPONSE_CACHE_SIMILARITY', '0'))
+MAX_MESSAGE_CHARS = int(os.getenv('ACE_RESPONSE_CACHE_MAX_MESSAGE', '300'))  # longer messages are candidate-specific
+
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+
+# (scenario, stage, agent, context fingerprint, normalized message)
+CacheKey = Tuple[str, str, str, str, str]
+
+
+def normalize_message(message: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return ' '.join(_NON_WORD.sub(' ', message.lower()).split())
+
+
+def scenario_id(prompt: str) -> str:
+    """Short fingerprint of a system prompt, so editing the scenario invalidates its answers."""
+    return hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:12]
+
+
+def context_fingerprint(history: List[Dict], context: str = '') -> str:
+    """Short fingerprint of what an answer depends on besides the question: earlier turns and retrieved context."""
+    digest = hashlib.sha1()
+    for message in history:
+        digest.update(message['role'].encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(message['content'].encode('utf-8'))
+        digest.update(b'\0')
+    digest.update(context.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def _similarity(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class ResponseCache:
+    """TTL + LRU cache of responses keyed by (scenario, stage, agent, context, normalized message)."""
+
+    def __init__(self, enabled: bool = RESPONSE_CACHE, ttl: float = CACHE_TTL, max_entries: int = CACHE_MAX_ENTRIES,
+                 similarity: float = SIMILARITY_THRESHOLD, max_message_chars: int = MAX_MESSAGE_CHARS):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.max_message_chars = max_message_chars
+        self._lock = threading.Lock()
+        # key -> (response, expires_at, word set), least recently used first
+        self._entries: 'OrderedDict[CacheKey, Tuple[str, float, FrozenSet[str]]]' = OrderedDict()
+        # key without its message -> keys, so a near-duplicate lookup only compares questions asked in the same context
+        self._groups: Dict[Tuple[str, str, str, str], Set[CacheKey]] = {}
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def cacheable(self, message: str, use_cache: bool = True) -> bool:
+        """Whether a turn may be answered from (and stored in) the cache."""
+        if not self.enabled:
+            return False
+        if not use_cache or len(message) > self.max_message_chars or not normalize_message(message):
+            with self._lock:
+                self.bypassed += 1
+            return False
+        return True
+
+    def get(self, scenario: str, stage: str, agent: str, context: str, message: str) -> Optional[str]:
+        """Return a cached response for this question in this context (see context_fingerprint), or None."""
+        normalized = normalize_message(message)
+        key = (scenario, stage, agent, context, normalized)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= now:
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+            if self.similarity > 0:
+                words = frozenset(normalized.split())
+                best_key, best_score = None, self.similarity
+                for other_key in self._groups.get(key[:4], ()):
+                    _, expires_at, other_words = self._entries[other_key]
+                    if expires_at <= now:
+                        continue
+                    score = _similarity(words, other_words)
+                    if score >= best_score:
+                        best_key, best_score = other_key, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.hits += 1
+                    self.near_hits += 1
+                    return self._entries[best_key][0]
+
+            self.misses += 1
+            return None
+
+    def put(self, scenario: str, stage: str, agent: str, context: str, message: str, response: str):
+        """Cache a successful upstream response."""
+        normalized = normalize_message(message)
+        key = (scenario, stage, agent, context, normalized)
+        with self._lock:
+            self._entries[key] = (response, time.monotonic() + self.ttl, frozenset(normalized.split()))
+            self._entries.move_to_end(key)
+            self._groups.setdefault(key[:4], set()).add(key)
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key: CacheKey):
+        """Remove an entry and its index entry (caller holds the lock)."""
+        del self._entries[key]
+        group = self._groups[key[:4]]
+        group.discard(key)
+        if not group:
+            del self._groups[key[:4]]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+
+    def stats(self) -> Dict:
+        """Hit rate, size and eviction counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "similarity_threshold": self.similarity,
+                "hits": self.hits,
+                "near_duplicate_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "bypassed": self.bypassed,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Per-interview lexical retrieval for the Solution Architect's context.
+
+When the Sales Manager hands the conversation to the Solution Architect,
+the Architect only has its own exchanges plus a "Context:" message. That
+context used to be the last five interview messages, 200 characters each,
+with the candidate's own messages left out, so the Architect never saw
+the objectives the candidate set out at the start of the interview.
+
+A TranscriptIndex instead keeps a BM25 index over the whole interview
+transcript. It is built incrementally: messages are split into passages
+of up to PASSAGE_WORDS words and indexed once, when they are appended to
+the history (a replaced or shortened history is indexed again from
+scratch). Each Solution Architect turn queries it with the candidate's
+message, and the best-scoring passages go into the context, in
+transcript order, until ACE_SA_CONTEXT_TOKENS is reached. The context
+therefore stays the same size however long the interview gets, and it
+is built from what is relevant to the question rather than from what
+happened to be said last.
+
+The index is derived from the conversation history, so it is not part of
+the serialized session state; an agent loaded from a session store
+rebuilds it on its first query.
+"""
+
+import heapq
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from compaction import estimate_tokens
+
+CONTEXT_TOKENS = int(os.getenv('ACE_SA_CONTEXT_TOKENS', '400'))  # estimated tokens of transcript excerpts per Solution Architect turn
+CONTEXT_PASSAGES = int(os.getenv('ACE_SA_CONTEXT_PASSAGES', '4'))  # most passages put into the context
+PASSAGE_WORDS = 60  # words per indexed passage; long messages (email drafts) become several
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+CONTEXT_HEADER = "Relevant excerpts from the interview so far:"
+
+_WORD = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+STOPWORDS = frozenset("""
+a about after all also am an and any are as at be been before being but by can could did do does doing
+for from had has have having he her here hers him his how i if in into is it its just me more most my
+no not now of on or our ours out over so some such than that the their them then there these they this
+those to too under up very was we were what when where which while who whom why will with would you
+your yours
+""".split())
+
+
+def terms(text: str) -> List[str]:
+    """Lowercased words of text, without stopwords and one-letter words."""
+    return [word for word in _WORD.findall(text.lower()) if len(word) > 1 and word not in STOPWORDS]
+
+
+def speaker(msg: Dict) -> Tuple[str, str]:
+    """(label, text) of an interview history message."""
+    content = msg.get("content", "")
+    if msg.get("role") == "user":
+        return "Candidate", content
+    if content.startswith("[Solution Architect]"):
+        return "Solution Architect", content[len("[Solution Architect]"):].strip()
+    return "Sales Manager", content
+
+
+class Passage:
+    """One indexed stretch of a history message."""
+
+    __slots__ = ('number', 'message', 'label', 'text', 'tokens')
+
+    def __init__(self, number: int, message: int, label: str, text: str):
+        self.number = number  # position in the index, in transcript order
+        self.message = message  # index into the history
+        self.label = label
+        self.text = text
+        self.tokens = estimate_tokens(text) + 2  # its line in the context, with the label
+
+
+class TranscriptIndex:
+    """Incremental BM25 index over one interview's conversation history."""
+
+    def __init__(self, skip: Optional[str] = None):
+        self.skip = skip  # history messages with exactly this content are not indexed
+        self.reset()
+
+    def reset(self):
+        self._source: Optional[List[Dict]] = None  # the history list being indexed
+        self._synced = 0  # history[:_synced] has been indexed
+        self._last: Optional[Dict] = None  # history[_synced - 1], to notice a rewritten history
+        self.passages: List[Passage] = []
+        self._lengths: List[int] = []  # passage lengths in terms, for BM25's length normalization
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}  # term -> [(passage, term frequency)]
+        self._total_length = 0
+
+    def sync(self, history: List[Dict]):
+        """Index messages appended to history since the last call."""
+        if (history is not self._source or len(history) < self._synced
+                or (self._synced and history[self._synced - 1] is not self._last)):
+            self.reset()
+            self._source = history
+        for index in range(self._synced, len(history)):
+            msg = history[index]
+            if msg.get("content") and msg["content"] != self.skip:
+                self._add_message(index, msg)
+        self._synced = len(history)
+        self._last = history[-1] if history else None
+
+    def _add_message(self, index: int, msg: Dict):
+        label, content = speaker(msg)
+        words = content.split()
+        for start in range(0, len(words), PASSAGE_WORDS):
+            text = " ".join(words[start:start + PASSAGE_WORDS])
+            counts = Counter(terms(text))
+            if not counts:
+                continue
+            number = len(self.passages)
+            length = sum(counts.values())
+            self.passages.append(Passage(number, index, label, text))
+            self._lengths.append(length)
+            self._total_length += length
+            for term, frequency in counts.items():
+                self._postings.setdefault(term, []).append((number, frequency))
+
+    def search(self, query: str, limit: int, before: Optional[int] = None) -> List[Tuple[float, Passage]]:
+        """The best limit passages for query, best first, from history[:before] only if given."""
+        passages = self.passages
+        end = len(passages)
+        if before is not None:
+            while end and passages[end - 1].message >= before:
+                end -= 1
+        if not end:
+            return []
+        lengths = self._lengths
+        # BM25 term weight: idf * f * (k1 + 1) / (f + k1 * (1 - b + b * length / average length))
+        base = BM25_K1 * (1 - BM25_B)
+        per_term = BM25_K1 * BM25_B * len(passages) / self._total_length
+        scores: Dict[int, float] = {}
+        for term in set(terms(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(passages) - len(postings) + 0.5) / (len(postings) + 0.5)) * (BM25_K1 + 1)
+            for number, frequency in postings:
+                if number < end:
+                    scores[number] = scores.get(number, 0.0) + idf * frequency / (frequency + base + per_term * lengths[number])
+        # Ties go to the more recent passage
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+        return [(score, passages[number]) for number, score in best]
+
+    def context(self, history: List[Dict], query: str, max_tokens: int = CONTEXT_TOKENS,
+                limit: int = CONTEXT_PASSAGES) -> str:
+        """Transcript excerpts relevant to query, within max_tokens, for the Solution Architect.
+
+        The newest message is the question being answered, which the
+        Architect gets anyway, so it is not searched. With nothing
+        relevant, the most recent passages are used instead.
+        """
+        self.sync(history)
+        before = len(history) - 1
+        hits = [passage for _, passage in self.search(query, limit, before)]
+        if not hits:
+            hits = [passage for passage in reversed(self.passages) if passage.message < before][:limit]
+        chosen, used = [], estimate_tokens(CONTEXT_HEADER)
+        for passage in hits:
+            if used + passage.tokens > max_tokens:
+                continue
+            chosen.append(passage)
+            used += passage.tokens
+        if not chosen:
+            return ""
+        chosen.sort(key=lambda passage: passage.number)
+        return CONTEXT_HEADER + "\n" + "\n".join(f"- {passage.label}: {passage.text}" for passage in chosen)
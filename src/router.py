@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+Health-aware routing of upstream LLM calls across Grok models.
+
+Replaces the old "try each model for 30 s in turn" loop with a shared
+router that learns between requests:
+- per-model latency (EWMA and recent percentiles) and error rate (EWMA)
+- a circuit breaker per model, so a dead model is skipped instead of
+  costing every turn its full timeout
+- an optional hedged second request once the primary is slower than its
+  usual latency percentile
+- one deadline per turn, split across the attempts made within it
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Models in order of preference
+GROK_MODELS = [m.strip() for m in os.getenv('GROK_MODELS', 'grok-2-1212,grok-2,grok-beta').split(',') if m.strip()]
+
+# Routing configuration (overridable through the environment)
+TURN_DEADLINE = float(os.getenv('GROK_TURN_DEADLINE', '60'))  # seconds for all attempts of one turn
+ATTEMPT_TIMEOUT = float(os.getenv('GROK_ATTEMPT_TIMEOUT', '30'))  # cap for a single attempt
+MIN_ATTEMPT_TIMEOUT = float(os.getenv('GROK_MIN_ATTEMPT_TIMEOUT', '5'))  # floor when splitting the deadline
+BREAKER_FAILURES = int(os.getenv('GROK_BREAKER_FAILURES', '3'))  # consecutive failures that open a breaker
+BREAKER_COOLDOWN = float(os.getenv('GROK_BREAKER_COOLDOWN', '30'))  # seconds before a half-open probe
+UNHEALTHY_ERROR_RATE = float(os.getenv('GROK_UNHEALTHY_ERROR_RATE', '0.5'))  # demote models above this
+EWMA_ALPHA = float(os.getenv('GROK_EWMA_ALPHA', '0.2'))
+HEDGE_ENABLED = os.getenv('GROK_HEDGE', 'false').lower() in ('1', 'true', 'yes')
+HEDGE_PERCENTILE = float(os.getenv('GROK_HEDGE_PERCENTILE', '95'))
+HEDGE_MIN_SAMPLES = int(os.getenv('GROK_HEDGE_MIN_SAMPLES', '20'))  # no hedging until latency is known
+HEDGE_WORKERS = int(os.getenv('GROK_HEDGE_WORKERS', '64'))
+
+LATENCY_WINDOW = 200  # recent latencies kept per model for percentiles
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class UpstreamError(Exception):
+    """Raised when no Grok model could produce a response."""
+
+
+class ModelHealth:
+    """Latency, error rate and circuit-breaker state for one model."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.ewma_latency: Optional[float] = None
+        self.ewma_error_rate = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.last_error: Optional[str] = None
+
+    def available(self, now: float) -> bool:
+        """Whether a request may be sent to this model right now."""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and now - self.opened_at >= BREAKER_COOLDOWN:
+            self.state = HALF_OPEN
+        return self.state == HALF_OPEN and not self.probe_in_flight
+
+    def record_success(self, latency: Optional[float]):
+        self.successes += 1
+        self.consecutive_failures = 0
+        if latency is not None:
+            self.latencies.append(latency)
+            self.ewma_latency = latency if self.ewma_latency is None else (EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.ewma_latency)
+        self.ewma_error_rate = (1 - EWMA_ALPHA) * self.ewma_error_rate
+        self.state = CLOSED
+        self.probe_in_flight = False
+
+    def record_failure(self, error: str, now: float):
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.ewma_error_rate = EWMA_ALPHA + (1 - EWMA_ALPHA) * self.ewma_error_rate
+        self.last_error = error[:200]
+        self.probe_in_flight = False
+        if self.state == HALF_OPEN or self.consecutive_failures >= BREAKER_FAILURES:
+            self.state = OPEN
+            self.opened_at = now
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Latency at percentile p over the recent window (None without data)."""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round((p / 100.0) * (len(ordered) - 1))))
+        return ordered[index]
+
+    def snapshot(self) -> Dict:
+        p50 = self.percentile(50)
+        p95 = self.percentile(95)
+        return {
+            "state": self.state,
+            "successes": self.successes,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "ewma_error_rate": round(self.ewma_error_rate, 4),
+            "ewma_latency_ms": round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None,
+            "p50_latency_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_latency_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "last_error": self.last_error,
+        }
+
+
+class ModelRouter:
+    """Chooses, times out, hedges and learns from upstream model attempts."""
+
+    def __init__(self, models: List[str] = None, deadline: float = TURN_DEADLINE, hedge: bool = HEDGE_ENABLED):
+        self.models = list(models or GROK_MODELS)
+        self.deadline = deadline
+        self.hedge = hedge
+        self._health = {model: ModelHealth(model) for model in self.models}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self.deadline_exceeded = 0
+
+    # --- health bookkeeping -------------------------------------------------
+
+    def candidates(self) -> List[str]:
+        """Models to try, best first: preference order, unhealthy ones last, open breakers skipped.
+
+        If every breaker is open the model whose breaker opened first is
+        still returned, so a turn never fails without trying anything.
+        """
+        now = time.monotonic()
+        with self._lock:
+            available = [m for m in self.models if self._health[m].available(now)]
+            if not available:
+                oldest = min(self.models, key=lambda m: self._health[m].opened_at)
+                return [oldest]
+            return sorted(available, key=lambda m: (self._health[m].ewma_error_rate >= UNHEALTHY_ERROR_RATE, self.models.index(m)))
+
+    def _claim(self, model: str):
+        """Mark a half-open model's single probe as taken."""
+        with self._lock:
+            health = self._health[model]
+            if health.state == HALF_OPEN:
+                health.probe_in_flight = True
+
+    def release(self, model: str):
+        """Give back a half-open probe slot for an attempt abandoned without an outcome."""
+        with self._lock:
+            self._health[model].probe_in_flight = False
+
+    def record_success(self, model: str, latency: Optional[float] = None):
+        """Record a successful attempt; latency is left out for streams, whose duration depends on length."""
+        with self._lock:
+            self._health[model].record_success(latency)
+
+    def record_failure(self, model: str, error: str):
+        with self._lock:
+            self._health[model].record_failure(error, time.monotonic())
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """How long to wait on model before hedging (None if hedging is off or latency unknown)."""
+        if not self.hedge:
+            return None
+        with self._lock:
+            health = self._health[model]
+            if len(health.latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            return health.percentile(HEDGE_PERCENTILE)
+
+    @staticmethod
+    def attempt_timeout(remaining: float, attempts_left: int) -> float:
+        """Split what is left of the turn deadline across the attempts still possible."""
+        share = remaining / max(1, attempts_left)
+        return max(0.0, min(ATTEMPT_TIMEOUT, remaining, max(share, MIN_ATTEMPT_TIMEOUT)))
+
+    def plan(self) -> Iterator[Tuple[str, float]]:
+        """Yield (model, timeout) for sequential attempts within one turn deadline."""
+        models = self.candidates()
+        deadline = time.monotonic() + self.deadline
+        for i, model in enumerate(models):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                with self._lock:
+                    self.deadline_exceeded += 1
+                return
+            self._claim(model)
+            yield model, self.attempt_timeout(remaining, len(models) - i)
+
+    # --- blocking path ------------------------------------------------------
+
+    def _run_attempt(self, attempt: Callable[[str, float], str], model: str, timeout: float) -> str:
+        start = time.monotonic()
+        try:
+            result = attempt(model, timeout)
+        except Exception as e:
+            self.record_failure(model, str(e) or type(e).__name__)
+            raise
+        self.record_success(model, time.monotonic() - start)
+        return result
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix='grok-hedge')
+        return self._executor
+
+    def complete(self, attempt: Callable[[str, float], str]) -> str:
+        """Run attempt(model, timeout) against the best models until one succeeds.
+
+        Raises UpstreamError with the last error if every attempt fails or the
+        turn deadline runs out.
+        """
+        if not self.hedge:
+            last_error = None
+            for model, timeout in self.plan():
+                try:
+                    return self._run_attempt(attempt, model, timeout)
+                except Exception as e:
+                    last_error = f"{model}: {str(e) or type(e).__name__}"
+            raise UpstreamError(last_error or "No models available")
+
+        return self._complete_hedged(attempt)
+
+    def _complete_hedged(self, attempt: Callable[[str, float], str]) -> str:
+        executor = self._get_executor()
+        models = self.candidates()
+        deadline = time.monotonic() + self.deadline
+        pending = {}
+        next_index = 0
+        hedged_futures = set()
+        last_error = None
+
+        def launch(hedged: bool = False) -> bool:
+            nonlocal next_index
+            remaining = deadline - time.monotonic()
+            if next_index >= len(models) or remaining <= 0:
+                return False
+            model = models[next_index]
+            self._claim(model)
+            timeout = self.attempt_timeout(remaining, len(models) - next_index)
+            future = executor.submit(self._run_attempt, attempt, model, timeout)
+            pending[future] = model
+            if hedged:
+                hedged_futures.add(future)
+                with self._lock:
+                    self.hedges_sent += 1
+            next_index += 1
+            return True
+
+        launch()
+        hedge_considered = False
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                with self._lock:
+                    self.deadline_exceeded += 1
+                break
+            # At most one hedge per turn, and only while the first attempt is still running
+            delay = self.hedge_delay(models[0]) if not hedge_considered and next_index == 1 else None
+            done, _ = wait(list(pending), timeout=min(remaining, delay) if delay is not None else remaining, return_when=FIRST_COMPLETED)
+            if not done:
+                if delay is not None:
+                    hedge_considered = True
+                    launch(hedged=True)
+                continue
+            for future in done:
+                model = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = f"{model}: {str(e) or type(e).__name__}"
+                    continue
+                if future in hedged_futures:
+                    with self._lock:
+                        self.hedges_won += 1
+                # Losers finish in the background; their outcome still feeds model health
+                return result
+            if not pending:
+                launch()
+
+        raise UpstreamError(last_error or "Turn deadline exceeded")
+
+    # --- asyncio path -------------------------------------------------------
+
+    async def _run_attempt_async(self, attempt: Callable[[str, float], Awaitable[str]], model: str, timeout: float) -> str:
+        start = time.monotonic()
+        try:
+            result = await attempt(model, timeout)
+        except asyncio.CancelledError:
+            # Lost a hedge race - says nothing about the model's health
+            self.release(model)
+            raise
+        except Exception as e:
+            self.record_failure(model, str(e) or type(e).__name__)
+            raise
+        self.record_success(model, time.monotonic() - start)
+        return result
+
+    async def complete_async(self, attempt: Callable[[str, float], Awaitable[str]]) -> str:
+        """Non-blocking version of complete(); losing hedged attempts are cancelled."""
+        models = self.candidates()
+        deadline = time.monotonic() + self.deadline
+        pending = {}
+        next_index = 0
+        hedged_tasks = set()
+        last_error = None
+
+        def launch(hedged: bool = False) -> bool:
+            nonlocal next_index
+            remaining = deadline - time.monotonic()
+            if next_index >= len(models) or remaining <= 0:
+                return False
+            model = models[next_index]
+            self._claim(model)
+            timeout = self.attempt_timeout(remaining, len(models) - next_index)
+            task = asyncio.ensure_future(self._run_attempt_async(attempt, model, timeout))
+            pending[task] = model
+            if hedged:
+                hedged_tasks.add(task)
+                with self._lock:
+                    self.hedges_sent += 1
+            next_index += 1
+            return True
+
+        launch()
+        hedge_considered = False
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    with self._lock:
+                        self.deadline_exceeded += 1
+                    break
+                delay = self.hedge_delay(models[0]) if not hedge_considered and next_index == 1 else None
+                done, _ = await asyncio.wait(list(pending), timeout=min(remaining, delay) if delay is not None else remaining, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if delay is not None:
+                        hedge_considered = True
+                        launch(hedged=True)
+                    continue
+                for task in done:
+                    model = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        last_error = f"{model}: {str(e) or type(e).__name__}"
+                        continue
+                    if task in hedged_tasks:
+                        with self._lock:
+                            self.hedges_won += 1
+                    return result
+                if not pending:
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise UpstreamError(last_error or "Turn deadline exceeded")
+
+    # --- reporting ----------------------------------------------------------
+
+    def stats(self) -> Dict:
+        """Per-model health plus hedging and deadline counters."""
+        with self._lock:
+            return {
+                "models": {model: self._health[model].snapshot() for model in self.models},
+                "hedging_enabled": self.hedge,
+                "hedges_sent": self.hedges_sent,
+                "hedges_won": self.hedges_won,
+                "deadline_exceeded": self.deadline_exceeded,
+                "turn_deadline_s": self.deadline,
+            }
+
+
+_router: Optional[ModelRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_model_router() -> ModelRouter:
+    """Return the process-wide model router, creating it on first use."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter()
+    return _router
+
+
+def _reset_after_fork():
+    """Forked workers start with fresh health state and no inherited locks or threads."""
+    global _router, _router_lock
+    _router = None
+    _router_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Step-11 rubric (SYSTEM_PROMPT) and parsing of the scorecard reply.
+
+The Sales Manager ends the interview with strengths, weaknesses and 1-5
+ratings. parse_scores() pulls the ratings out of that free-text reply so
+scorecards can be compared across interviews (tools/replay.py).
+"""
+
+import re
+from typing import Dict, Optional
+
+# (key, phrases identifying the rating line) in the order of SYSTEM_PROMPT step 11
+RUBRIC = (
+    ('email_quality', ('email quality', 'outbound email')),
+    ('personalization', ('personalization', 'personalisation')),
+    ('value_articulation', ('value articulation', 'claude value', 'product/ai')),
+    ('objection_handling', ('objection handling', 'objection')),
+    ('creativity', ('creativity', 'gtm instincts')),
+    ('values_alignment', ("anthropic's values", 'alignment with', 'values alignment')),
+)
+
+# Message that asks for the scorecard when a transcript ends before step 11
+SCORING_REQUEST = "Please score my performance now: strengths, weaknesses and 1-5 ratings for each area."
+
+# "4/5", "4 / 5", "4 out of 5", "3.5/5"; failing that a bare rating after a colon or dash ("Objection handling: 4")
+_RATING = re.compile(r'(\d(?:\.\d)?)\s*(?:/\s*5|out of 5)', re.IGNORECASE)
+_BARE_RATING = re.compile(r'[:\-–—]\s*\**\s*(\d(?:\.\d)?)\b')
+# Ratings come one per line or several per paragraph ("...quality: 4/5. Personalization: 3/5.")
+_SEGMENT = re.compile(r'\n|(?<=[.;])\s+')
+
+
+def _rating(line: str) -> Optional[float]:
+    match = _RATING.search(line) or _BARE_RATING.search(line)
+    if not match:
+        return None
+    value = float(match.group(1))
+    return value if 1 <= value <= 5 else None
+
+
+def parse_scores(text: str) -> Dict[str, float]:
+    """Ratings found in a scorecard reply, keyed by rubric item (missing items are left out)."""
+    scores: Dict[str, float] = {}
+    for line in _SEGMENT.split(text):
+        lower = line.lower()
+        for key, phrases in RUBRIC:
+            if key in scores or not any(phrase in lower for phrase in phrases):
+                continue
+            rating = _rating(line)
+            if rating is not None:
+                scores[key] = rating
+                break
+    return scores
+
+
+def is_complete(scores: Dict[str, float]) -> bool:
+    return len(scores) == len(RUBRIC)
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Production launcher: preforked workers with preloading and warmup.
+
+`python src/main.py` starts Werkzeug's development server: one process,
+with the reloader and debugger on. This launcher instead:
+- binds the listening socket and imports the app (agents, prompts,
+  templates, assets, serialized payloads) once in a master process, then
+  forks ACE_WORKERS workers that share all of it copy-on-write
+- serves each worker either as WSGI (Flask) on a pool of ACE_THREADS
+  request threads, or as ASGI on uvicorn's event loop (--asgi)
+- warms each worker's upstream connections before /readyz reports it
+  ready
+- on SIGTERM or SIGINT stops accepting connections and lets in-flight
+  chat turns finish, for up to ACE_GRACEFUL_TIMEOUT seconds, before the
+  workers exit (queued transcript messages are written on the way out)
+- restarts workers that die unexpectedly
+
+    python src/serve.py --workers 4 --threads 16
+    python src/serve.py --asgi --workers 4
+"""
+
+import argparse
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
+from typing import Dict
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, basedir)
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from lifecycle import preload, readiness, warm_connections
+from session_store import SESSION_STORE
+
+WORKERS = int(os.getenv('ACE_WORKERS', str(os.cpu_count() or 1)))
+THREADS = int(os.getenv('ACE_THREADS', '16'))  # request threads per WSGI worker
+HOST = os.getenv('ACE_HOST', '0.0.0.0')
+PORT = int(os.getenv('ACE_PORT', '8080'))
+GRACEFUL_TIMEOUT = float(os.getenv('ACE_GRACEFUL_TIMEOUT', '30'))  # seconds in-flight requests get at shutdown
+KEEPALIVE_TIMEOUT = float(os.getenv('ACE_KEEPALIVE_TIMEOUT', '5'))  # seconds an idle client connection is kept
+BACKLOG = 2048
+RESPAWN_DELAY = 1.0  # seconds before replacing a worker that died, so a crash loop cannot spin
+SHARED_SESSION_STORES = ('sqlite', 'redis')  # stores every worker sees; needed for more than one
+
+
+def log(message: str):
+    print(f"[serve {os.getpid()}] {message}", flush=True)
+
+
+class RequestHandler(WSGIRequestHandler):
+    timeout = KEEPALIVE_TIMEOUT  # an idle keep-alive connection must not hold a request thread forever
+
+    def log_request(self, code='-', size='-'):
+        # Per-request logging is left to /metrics; only errors are printed
+        pass
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug's WSGI server on an inherited socket, with a fixed pool of request threads."""
+
+    multithread = True
+
+    def __init__(self, sock: socket.socket, app, threads: int):
+        host, port = sock.getsockname()[:2]
+        super().__init__(host, port, app, handler=RequestHandler, fd=sock.fileno())
+        # Every worker wakes up for each connection on the shared socket; the
+        # ones that lose the race must not block in accept(), where they would
+        # miss the shutdown request (and SIGTERM) until the next connection
+        self.socket.setblocking(False)
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='ace-request')
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+
+    def get_request(self):
+        # BlockingIOError (another worker took the connection) is an OSError, which serve_forever() skips
+        request, client_address = self.socket.accept()
+        request.setblocking(True)
+        return request, client_address
+
+    def process_request(self, request, client_address):
+        future = self.executor.submit(self._process, request, client_address)
+        with self._pending_lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        with self._pending_lock:
+            self._pending.discard(future)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def drain(self, timeout: float) -> int:
+        """Wait for connections being served to finish; returns how many were still open at the timeout."""
+        with self._pending_lock:
+            pending = set(self._pending)
+        _, not_done = wait(pending, timeout=timeout)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        return len(not_done)
+
+
+def serve_wsgi(sock: socket.socket, threads: int):
+    """Worker body: serve the Flask app on sock until SIGTERM/SIGINT, then drain."""
+    from main import app
+
+    server = PooledWSGIServer(sock, app, threads)
+
+    def stop(signum, frame):
+        if readiness.state != 'draining':
+            readiness.mark_draining()
+            # shutdown() waits for serve_forever() to return, so it cannot run in this (the serving) thread
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    readiness.mark_ready(warm_connections())
+    log(f"WSGI worker ready ({threads} threads, {readiness.warm_connections} warm upstream connections)")
+    server.serve_forever()
+    left = server.drain(GRACEFUL_TIMEOUT)
+    if left:
+        log(f"{left} connections still open after {GRACEFUL_TIMEOUT:g}s; exiting anyway")
+
+
+def serve_asgi(sock: socket.socket):
+    """Worker body: serve the ASGI app on sock with uvicorn (which drains on SIGTERM/SIGINT)."""
+    import uvicorn
+    from asgi import app
+
+    config = uvicorn.Config(app, lifespan='on', timeout_keep_alive=int(KEEPALIVE_TIMEOUT),
+                            timeout_graceful_shutdown=int(GRACEFUL_TIMEOUT), access_log=False)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def bind(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(BACKLOG)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Master:
+    """Forks the workers, restarts any that die, and stops them all on SIGTERM/SIGINT."""
+
+    def __init__(self, sock: socket.socket, workers: int, body):
+        self.sock = sock
+        self.workers = workers
+        self.body = body
+        self.children: Dict[int, int] = {}  # pid -> worker number
+        self.stopping = False
+
+    def spawn(self, number: int):
+        pid = os.fork()
+        if pid == 0:
+            # Own process group: a terminal's Ctrl-C reaches the master, which stops the workers once
+            os.setpgid(0, 0)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                self.body(self.sock)
+            except Exception as e:
+                log(f"worker {number} failed: {e}")
+                code = 1
+            finally:
+                # Flush buffered output; atexit handlers (transcripts, usage log) run via sys.exit
+                sys.stdout.flush()
+            sys.exit(code)
+        self.children[pid] = number
+
+    def stop(self, signum, frame):
+        if not self.stopping:
+            self.stopping = True
+            log(f"stopping {len(self.children)} workers (up to {GRACEFUL_TIMEOUT:g}s to finish in-flight turns)")
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for number in range(self.workers):
+            self.spawn(number)
+        deadline = None
+        while self.children:
+            if self.stopping and deadline is None:
+                deadline = time.monotonic() + GRACEFUL_TIMEOUT + 5
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                if deadline is not None and time.monotonic() > deadline:
+                    for pid in list(self.children):
+                        log(f"worker {pid} did not exit in time; killing it")
+                        os.kill(pid, signal.SIGKILL)
+                    deadline = float('inf')
+                time.sleep(0.2)
+                continue
+            number = self.children.pop(pid, None)
+            if number is not None and not self.stopping:
+                log(f"worker {pid} exited with status {os.waitstatus_to_exitcode(status)}; restarting it")
+                time.sleep(RESPAWN_DELAY)
+                if not self.stopping:
+                    self.spawn(number)
+        log("all workers stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=WORKERS, help='worker processes (default: ACE_WORKERS or CPU count)')
+    parser.add_argument('--threads', type=int, default=THREADS, help='request threads per WSGI worker')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--asgi', action='store_true', help='serve the asyncio app with uvicorn in each worker')
+    args = parser.parse_args()
+
+    workers = max(1, args.workers)
+    if workers > 1 and SESSION_STORE not in SHARED_SESSION_STORES:
+        # Each worker would keep its own interviews, and a candidate's turns land on any of them
+        log(f"ACE_SESSION_STORE={SESSION_STORE} keeps interviews in one process; running 1 worker instead of "
+            f"{workers} (use sqlite or redis to run more)")
+        workers = 1
+
+    sock = bind(args.host, args.port)
+    started = time.perf_counter()
+    if args.asgi:
+        import asgi  # noqa: F401 (imports main as well)
+        body = serve_asgi
+    else:
+        body = partial(serve_wsgi, threads=max(1, args.threads))
+    from main import app
+    preload(app)
+    log(f"preloaded in {time.perf_counter() - started:.2f}s; listening on {args.host}:{args.port} "
+        f"with {workers} {'ASGI' if args.asgi else 'WSGI'} workers")
+    Master(sock, workers, body).run()
+
+
+if __name__ == "__main__":
+    main()
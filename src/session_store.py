@@ -0,0 +1,727 @@
+#!/usr/bin/env python3
+"""
+Session stores for interview agents.
+
+The Flask app used to keep every InterviewAgent in a module-level dict,
+which pinned each interview to one process. A store hides where agent
+state lives so the app can run under several gunicorn workers or nodes:
+- MemorySessionStore: live agents in this process, bounded by an LRU cap and
+  idle timeout, optionally spilling evicted sessions to disk
+- SQLiteSessionStore: JSON state in a shared SQLite file (WAL mode)
+- RedisSessionStore: JSON state in any server speaking the Redis protocol
+
+Agents are loaded at the start of a turn and saved at the end of it.
+Turns for one session are serialized (SessionLocks): in this process,
+and with the SQLite and Redis stores across every worker sharing them,
+through a lease kept in the store. A session's agent is created at most
+once even when several requests race to create it (SessionStore.add).
+"""
+
+import asyncio
+import functools
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List, Optional
+from urllib.parse import unquote, urlparse
+
+from agent import InterviewAgent
+from metrics import Histogram, registry, session_activity
+
+SESSION_STORE = os.getenv('ACE_SESSION_STORE', 'memory')  # memory | sqlite | redis
+SESSION_DB = os.getenv('ACE_SESSION_DB', 'sessions.db')
+REDIS_URL = os.getenv('ACE_REDIS_URL', 'redis://localhost:6379/0')
+SESSION_TTL = int(os.getenv('ACE_SESSION_TTL', str(7 * 24 * 3600)))  # seconds an idle interview is kept
+SESSION_CACHE_MAX = int(os.getenv('ACE_SESSION_CACHE_MAX', '1000'))  # live agents per process (0 = unbounded)
+SESSION_IDLE_TTL = float(os.getenv('ACE_SESSION_IDLE_TTL', '1800'))  # seconds before an idle agent is evicted (0 = never)
+SESSION_SPILL = os.getenv('ACE_SESSION_SPILL', '')  # SQLite file evicted in-memory sessions are spilled to
+SESSION_LOCK_TIMEOUT = float(os.getenv('ACE_SESSION_LOCK_TIMEOUT', '90'))  # seconds a turn waits for the previous one
+SESSION_LEASE_TTL = float(os.getenv('ACE_SESSION_LEASE_TTL', '300'))  # seconds a shared-store lock outlives a dead worker
+
+# Rough per-object overheads (CPython) used by estimate_agent_bytes()
+AGENT_OVERHEAD_BYTES = 2048
+MESSAGE_OVERHEAD_BYTES = 400
+
+
+def serialize_agent(agent: InterviewAgent) -> str:
+    """Encode agent state compactly for storage."""
+    return json.dumps(agent.to_dict(), separators=(',', ':'), ensure_ascii=False)
+
+
+def deserialize_agent(data: str) -> InterviewAgent:
+    """Rebuild an agent from serialize_agent() output."""
+    return InterviewAgent.from_dict(json.loads(data))
+
+
+def estimate_agent_bytes(agent: InterviewAgent) -> int:
+    """Estimate the memory held by an agent: message text plus fixed per-object overheads."""
+    total = AGENT_OVERHEAD_BYTES
+    for history in (agent.conversation_history, agent.solution_architect.conversation_history):
+        for msg in history:
+            total += MESSAGE_OVERHEAD_BYTES + len(msg.get("content", ""))
+    return total
+
+
+class SessionStore:
+    """Where interview agents live between turns."""
+
+    # Whether calls may block on I/O (the asyncio path runs those in a thread)
+    blocking = True
+    # Whether every worker sees the same state; shared stores also hold the
+    # session locks and idempotency records (the *_key methods)
+    shared = False
+
+    def get(self, session_id: str) -> Optional[InterviewAgent]:
+        """Load the agent for a session, or None if there is none."""
+        raise NotImplementedError
+
+    def save(self, session_id: str, agent: InterviewAgent):
+        """Persist the agent after a turn."""
+        raise NotImplementedError
+
+    def add(self, session_id: str, agent: InterviewAgent) -> InterviewAgent:
+        """Store a new agent unless the session already has one; returns the agent the session ends up with."""
+        self.save(session_id, agent)
+        return agent
+
+    def delete(self, session_id: str):
+        """Forget a session."""
+        raise NotImplementedError
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        """Size and usage counters for monitoring."""
+        return {"backend": type(self).__name__, "sessions": len(self)}
+
+    def claim_key(self, key: str, value: str, ttl: float) -> bool:
+        """Set key to value for ttl seconds unless it is already set; returns whether it was."""
+        raise NotImplementedError
+
+    def read_key(self, key: str) -> Optional[str]:
+        """The value of a key set by claim_key or write_key, or None if it is unset or expired."""
+        raise NotImplementedError
+
+    def write_key(self, key: str, value: str, ttl: float):
+        """Set key to value for ttl seconds."""
+        raise NotImplementedError
+
+    def release_key(self, key: str, value: str):
+        """Unset key if it still holds value (so only the claimant releases it)."""
+        raise NotImplementedError
+
+    def get_or_create(self, session_id: str, initialize: bool = False) -> InterviewAgent:
+        """Load the session's agent, creating (and saving) a new one if needed."""
+        session_activity.touch(session_id)
+        agent = self.get(session_id)
+        if agent is None:
+            agent = InterviewAgent(session_id)
+            if initialize:
+                agent.initialize()
+            # Another request may have created it meanwhile; everyone gets the same one
+            agent = self.add(session_id, agent)
+        return agent
+
+
+class MemorySessionStore(SessionStore):
+    """Live agents in this process, bounded by an LRU cap and an idle timeout.
+
+    Evicted sessions are dropped, or written to an optional spill store and
+    transparently rehydrated when the candidate comes back.
+    """
+
+    def __init__(self, max_sessions: Optional[int] = SESSION_CACHE_MAX, idle_ttl: Optional[float] = SESSION_IDLE_TTL,
+                 spill: Optional[SessionStore] = None):
+        self.max_sessions = max_sessions or None
+        self.idle_ttl = idle_ttl or None
+        self.spill = spill
+        self.blocking = spill is not None
+        # session_id -> [agent, last_access, estimated_bytes], least recently used first
+        self._agents: OrderedDict = OrderedDict()
+        self._lock = threading.RLock()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.rehydrations = 0
+        self.lru_evictions = 0
+        self.idle_evictions = 0
+        self.spills = 0
+
+    def get(self, session_id: str) -> Optional[InterviewAgent]:
+        now = time.monotonic()
+        with self._lock:
+            evicted = self._evict(now)
+            entry = self._agents.get(session_id)
+            if entry is not None:
+                self.hits += 1
+                entry[1] = now
+                self._agents.move_to_end(session_id)
+            else:
+                self.misses += 1
+        self._spill(evicted)
+        if entry is not None:
+            return entry[0]
+        if self.spill is None:
+            return None
+
+        agent = self.spill.get(session_id)
+        if agent is not None:
+            with self._lock:
+                self.rehydrations += 1
+                self._put(session_id, agent, time.monotonic())
+                evicted = self._evict(time.monotonic())
+            self.spill.delete(session_id)
+            self._spill(evicted)
+        return agent
+
+    def save(self, session_id: str, agent: InterviewAgent):
+        now = time.monotonic()
+        with self._lock:
+            self._put(session_id, agent, now)
+            evicted = self._evict(now)
+        self._spill(evicted)
+
+    def add(self, session_id: str, agent: InterviewAgent) -> InterviewAgent:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._agents.get(session_id)
+            if entry is not None:
+                entry[1] = now
+                self._agents.move_to_end(session_id)
+                return entry[0]
+            self._put(session_id, agent, now)
+            evicted = self._evict(now)
+        self._spill(evicted)
+        return agent
+
+    def delete(self, session_id: str):
+        with self._lock:
+            entry = self._agents.pop(session_id, None)
+            if entry is not None:
+                self._total_bytes -= entry[2]
+        if self.spill is not None:
+            self.spill.delete(session_id)
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            if session_id in self._agents:
+                return True
+        return self.spill is not None and session_id in self.spill
+
+    def __len__(self) -> int:
+        return len(self._agents)
+
+    def sweep(self):
+        """Evict idle sessions now (eviction otherwise happens on access)."""
+        with self._lock:
+            evicted = self._evict(time.monotonic())
+        self._spill(evicted)
+
+    def _put(self, session_id: str, agent: InterviewAgent, now: float):
+        size = estimate_agent_bytes(agent)
+        entry = self._agents.get(session_id)
+        if entry is not None:
+            self._total_bytes -= entry[2]
+        self._agents[session_id] = [agent, now, size]
+        self._agents.move_to_end(session_id)
+        self._total_bytes += size
+
+    def _evict(self, now: float) -> List:
+        """Drop idle sessions and trim to the LRU cap (caller holds the lock).
+
+        The least recently used entry is always at the front, so this only
+        looks at as many entries as it evicts. Returns the evicted
+        (session_id, agent) pairs for _spill().
+        """
+        evicted = []
+        while self._agents:
+            session_id, entry = next(iter(self._agents.items()))
+            if self.idle_ttl is not None and now - entry[1] > self.idle_ttl:
+                self.idle_evictions += 1
+            elif self.max_sessions is not None and len(self._agents) > self.max_sessions:
+                self.lru_evictions += 1
+            else:
+                break
+            self._agents.popitem(last=False)
+            self._total_bytes -= entry[2]
+            evicted.append((session_id, entry[0]))
+        return evicted
+
+    def _spill(self, evicted: List):
+        """Write evicted sessions to the spill store, outside the lock."""
+        if self.spill is None:
+            return
+        for session_id, agent in evicted:
+            self.spill.save(session_id, agent)
+            with self._lock:
+                self.spills += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "backend": "memory",
+                "sessions": len(self._agents),
+                "max_sessions": self.max_sessions,
+                "idle_ttl_s": self.idle_ttl,
+                "estimated_bytes": self._total_bytes,
+                "avg_bytes_per_session": (self._total_bytes // len(self._agents)) if self._agents else 0,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "lru_evictions": self.lru_evictions,
+                "idle_evictions": self.idle_evictions,
+                "spills": self.spills,
+                "rehydrations": self.rehydrations,
+            }
+        if self.spill is not None:
+            stats["spilled_sessions"] = len(self.spill)
+        return stats
+
+
+class SQLiteSessionStore(SessionStore):
+    """Agent state as JSON rows in a SQLite database shared by every worker on the host."""
+
+    shared = True
+
+    def __init__(self, path: str = SESSION_DB, ttl: int = SESSION_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+        # Session locks and idempotency records (claim_key and friends)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS shared_keys ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread; WAL lets readers and the writer proceed concurrently."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id: str) -> Optional[InterviewAgent]:
+        row = self._conn().execute(
+            "SELECT state FROM sessions WHERE session_id = ? AND updated_at >= ?",
+            (session_id, time.time() - self.ttl)
+        ).fetchone()
+        return deserialize_agent(row[0]) if row else None
+
+    def save(self, session_id: str, agent: InterviewAgent):
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO sessions (session_id, state, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+            (session_id, serialize_agent(agent), time.time())
+        )
+        conn.commit()
+
+    def add(self, session_id: str, agent: InterviewAgent) -> InterviewAgent:
+        conn = self._conn()
+        now = time.time()
+        # An expired row counts as absent, as it does for get()
+        cursor = conn.execute(
+            "INSERT INTO sessions (session_id, state, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at "
+            "WHERE sessions.updated_at < ?",
+            (session_id, serialize_agent(agent), now, now - self.ttl)
+        )
+        conn.commit()
+        if cursor.rowcount:
+            return agent
+        return self.get(session_id) or agent
+
+    def __contains__(self, session_id: str) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM sessions WHERE session_id = ? AND updated_at >= ?",
+            (session_id, time.time() - self.ttl)
+        ).fetchone()
+        return row is not None
+
+    def delete(self, session_id: str):
+        conn = self._conn()
+        conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        conn.commit()
+
+    def __len__(self) -> int:
+        row = self._conn().execute(
+            "SELECT COUNT(*) FROM sessions WHERE updated_at >= ?", (time.time() - self.ttl,)
+        ).fetchone()
+        return row[0]
+
+    def claim_key(self, key: str, value: str, ttl: float) -> bool:
+        conn = self._conn()
+        now = time.time()
+        # One statement, so two workers claiming at once cannot both win; an expired row counts as unset
+        cursor = conn.execute(
+            "INSERT INTO shared_keys (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+            "WHERE shared_keys.expires_at < ?",
+            (key, value, now + ttl, now)
+        )
+        conn.commit()
+        return cursor.rowcount == 1
+
+    def read_key(self, key: str) -> Optional[str]:
+        row = self._conn().execute(
+            "SELECT value FROM shared_keys WHERE key = ? AND expires_at >= ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def write_key(self, key: str, value: str, ttl: float):
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO shared_keys (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (key, value, time.time() + ttl)
+        )
+        conn.commit()
+
+    def release_key(self, key: str, value: str):
+        conn = self._conn()
+        conn.execute("DELETE FROM shared_keys WHERE key = ? AND value = ?", (key, value))
+        conn.commit()
+
+    def purge_expired(self) -> int:
+        """Delete sessions idle for longer than the TTL (and expired keys); returns how many sessions were removed."""
+        conn = self._conn()
+        now = time.time()
+        cursor = conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl,))
+        conn.execute("DELETE FROM shared_keys WHERE expires_at < ?", (now,))
+        conn.commit()
+        return cursor.rowcount
+
+
+class RedisError(Exception):
+    """Error reply from a Redis-protocol server."""
+
+
+class RedisClient:
+    """Minimal RESP2 client: enough for GET/SET/DEL/SCAN/EVAL, one connection per thread."""
+
+    def __init__(self, url: str = REDIS_URL, timeout: float = 5.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock = sock
+        self._local.reader = sock.makefile('rb')
+        if self.password:
+            self._roundtrip('AUTH', self.password)
+        if self.db:
+            self._roundtrip('SELECT', str(self.db))
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        self._local.sock = None
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
+
+    def _read_reply(self):
+        line = self._local.reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by Redis server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode('utf-8')
+        if kind == b'-':
+            raise RedisError(rest.decode('utf-8'))
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._local.reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            count = int(rest)
+            if count < 0:
+                return None
+            return [self._read_reply() for _ in range(count)]
+        raise ConnectionError(f"Unexpected reply from Redis server: {line[:50]!r}")
+
+    def _roundtrip(self, *args):
+        self._local.sock.sendall(self._encode(args))
+        return self._read_reply()
+
+    def execute(self, *args):
+        """Send one command and return its reply, reconnecting once on a dropped connection."""
+        for attempt in range(2):
+            if getattr(self._local, 'sock', None) is None:
+                self._connect()
+            try:
+                return self._roundtrip(*args)
+            except (ConnectionError, OSError):
+                self._close()
+                if attempt:
+                    raise
+
+
+# Delete a key only if it still holds the given value, atomically on the server
+RELEASE_SCRIPT = "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) else return 0 end"
+
+
+class RedisSessionStore(SessionStore):
+    """Agent state as JSON strings in Redis (or anything speaking its protocol), shared across nodes."""
+
+    shared = True
+
+    def __init__(self, url: str = REDIS_URL, ttl: int = SESSION_TTL, prefix: str = 'ace:session:',
+                 key_prefix: str = 'ace:'):
+        self.client = RedisClient(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.key_prefix = key_prefix  # for claim_key and friends
+
+    def _key(self, session_id: str) -> str:
+        return self.prefix + session_id
+
+    def get(self, session_id: str) -> Optional[InterviewAgent]:
+        data = self.client.execute('GET', self._key(session_id))
+        return deserialize_agent(data.decode('utf-8')) if data is not None else None
+
+    def save(self, session_id: str, agent: InterviewAgent):
+        # Every save refreshes the idle TTL
+        self.client.execute('SET', self._key(session_id), serialize_agent(agent), 'EX', str(self.ttl))
+
+    def add(self, session_id: str, agent: InterviewAgent) -> InterviewAgent:
+        created = self.client.execute('SET', self._key(session_id), serialize_agent(agent), 'NX', 'EX', str(self.ttl))
+        if created is not None:
+            return agent
+        return self.get(session_id) or agent
+
+    def delete(self, session_id: str):
+        self.client.execute('DEL', self._key(session_id))
+
+    def __contains__(self, session_id: str) -> bool:
+        return bool(self.client.execute('EXISTS', self._key(session_id)))
+
+    def claim_key(self, key: str, value: str, ttl: float) -> bool:
+        return self.client.execute('SET', self.key_prefix + key, value, 'NX', 'PX', str(max(1, int(ttl * 1000)))) is not None
+
+    def read_key(self, key: str) -> Optional[str]:
+        data = self.client.execute('GET', self.key_prefix + key)
+        return data.decode('utf-8') if data is not None else None
+
+    def write_key(self, key: str, value: str, ttl: float):
+        self.client.execute('SET', self.key_prefix + key, value, 'PX', str(max(1, int(ttl * 1000))))
+
+    def release_key(self, key: str, value: str):
+        self.client.execute('EVAL', RELEASE_SCRIPT, '1', self.key_prefix + key, value)
+
+    def __len__(self) -> int:
+        return len(self._keys())
+
+    def _keys(self) -> List[bytes]:
+        keys = []
+        cursor = '0'
+        while True:
+            cursor, batch = self.client.execute('SCAN', cursor, 'MATCH', self.prefix + '*', 'COUNT', '1000')
+            keys.extend(batch)
+            cursor = cursor.decode('ascii') if isinstance(cursor, bytes) else str(cursor)
+            if cursor == '0':
+                return keys
+
+
+session_lock_wait = registry.register(Histogram(
+    'ace_session_lock_wait_seconds', 'Time a chat turn waited for an earlier turn of the same interview.'))
+
+# Polling interval for asyncio waiters (a busy session is busy for a whole upstream call)
+_ASYNC_LOCK_POLL_SECONDS = 0.02
+# Polling interval for a lease held by another worker (each poll is a store round trip)
+_LEASE_POLL_SECONDS = 0.05
+
+
+class SessionBusy(Exception):
+    """An earlier turn of the same interview did not finish within the lock timeout."""
+
+
+class SessionLocks:
+    """One lock per interview so its turns run one at a time.
+
+    An agent's history and stage are mutated throughout a turn; two turns
+    at once (a double-clicked send, a retry) would interleave them and
+    both call upstream. Locks exist only while a turn holds or waits for
+    them. The asyncio path polls instead of blocking a thread, so a
+    cancelled waiter never ends up holding a lock.
+
+    With a shared store (share()), a turn also takes a lease on the
+    session in the store once it has the process lock, since its workers
+    share no memory and a duplicate can reach any of them. The lease
+    expires after lease_ttl seconds if its worker dies mid-turn.
+    """
+
+    def __init__(self, timeout: float = SESSION_LOCK_TIMEOUT, lease_ttl: float = SESSION_LEASE_TTL):
+        self.timeout = timeout
+        self.lease_ttl = lease_ttl
+        self.store: Optional[SessionStore] = None  # where leases are kept (None = this process only)
+        self._lock = threading.Lock()
+        self._locks: Dict[str, List] = {}  # session_id -> [lock, holders and waiters]
+
+    def share(self, store: SessionStore):
+        """Serialize turns across every worker using store, if it is shared."""
+        self.store = store if store.shared else None
+
+    def _checkout(self, session_id: str) -> threading.Lock:
+        with self._lock:
+            entry = self._locks.get(session_id)
+            if entry is None:
+                entry = self._locks[session_id] = [threading.Lock(), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def _checkin(self, session_id: str):
+        with self._lock:
+            entry = self._locks[session_id]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[session_id]
+
+    @staticmethod
+    def _busy() -> SessionBusy:
+        return SessionBusy("Another message for this interview is still being answered")
+
+    def _lease(self, session_id: str, started: float) -> Optional[str]:
+        """Take the session's lease in the shared store, waiting out the timeout; returns its token."""
+        if self.store is None:
+            return None
+        token = os.urandom(8).hex()
+        while not self.store.claim_key('lock:' + session_id, token, self.lease_ttl):
+            if time.perf_counter() - started > self.timeout:
+                raise self._busy()
+            time.sleep(_LEASE_POLL_SECONDS)
+        return token
+
+    async def _lease_async(self, session_id: str, started: float) -> Optional[str]:
+        if self.store is None:
+            return None
+        token = os.urandom(8).hex()
+        while True:
+            # Shielded: a claim that lands after its waiter is cancelled is released, not leaked
+            claim = asyncio.ensure_future(asyncio.to_thread(self.store.claim_key, 'lock:' + session_id, token, self.lease_ttl))
+            try:
+                claimed = await asyncio.shield(claim)
+            except asyncio.CancelledError:
+                claim.add_done_callback(functools.partial(self._release_if_claimed, session_id, token))
+                raise
+            if claimed:
+                return token
+            if time.perf_counter() - started > self.timeout:
+                raise self._busy()
+            await asyncio.sleep(_LEASE_POLL_SECONDS)
+
+    def _release_if_claimed(self, session_id: str, token: str, claim: asyncio.Future):
+        if not claim.cancelled() and claim.exception() is None and claim.result():
+            claim.get_loop().run_in_executor(None, self.store.release_key, 'lock:' + session_id, token)
+
+    @contextmanager
+    def hold(self, session_id: str):
+        """Run the block as the session's only turn (raises SessionBusy after the timeout)."""
+        lock = self._checkout(session_id)
+        started = time.perf_counter()
+        try:
+            if not lock.acquire(timeout=self.timeout):
+                raise self._busy()
+            try:
+                token = self._lease(session_id, started)
+                session_lock_wait.observe(time.perf_counter() - started)
+                try:
+                    yield
+                finally:
+                    if token is not None:
+                        self.store.release_key('lock:' + session_id, token)
+            finally:
+                lock.release()
+        finally:
+            self._checkin(session_id)
+
+    @asynccontextmanager
+    async def hold_async(self, session_id: str):
+        """Non-blocking version of hold for the asyncio serving path."""
+        lock = self._checkout(session_id)
+        started = time.perf_counter()
+        try:
+            while not lock.acquire(blocking=False):
+                if time.perf_counter() - started > self.timeout:
+                    raise self._busy()
+                await asyncio.sleep(_ASYNC_LOCK_POLL_SECONDS)
+            try:
+                token = await self._lease_async(session_id, started)
+                session_lock_wait.observe(time.perf_counter() - started)
+                try:
+                    yield
+                finally:
+                    if token is not None:
+                        await asyncio.shield(asyncio.to_thread(self.store.release_key, 'lock:' + session_id, token))
+            finally:
+                lock.release()
+        finally:
+            self._checkin(session_id)
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+session_locks = SessionLocks()
+
+
+def _reset_after_fork():
+    session_locks._lock = threading.Lock()
+    session_locks._locks = {}
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def create_session_store(kind: str = SESSION_STORE) -> SessionStore:
+    """Build the session store selected by ACE_SESSION_STORE."""
+    kind = kind.lower()
+    if kind == 'memory':
+        spill = SQLiteSessionStore(SESSION_SPILL) if SESSION_SPILL else None
+        return MemorySessionStore(spill=spill)
+    if kind == 'sqlite':
+        return SQLiteSessionStore()
+    if kind == 'redis':
+        return RedisSessionStore()
+    raise ValueError(f"Unknown session store '{kind}' (expected memory, sqlite or redis)")
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Speculative pre-generation of the next turn during candidate think time.
+
+Candidates take minutes to research or draft between messages, and the
+server used to sit idle all that time and only start on the reply once
+the message arrived. Many next messages are predictable, though: at
+each stage, candidates tend to send the same short messages ("Thanks,
+I'm ready to draft the email now.", "Could you score my performance
+now?"). With ACE_SPECULATION enabled, the engine:
+- learns which short candidate messages recur at each point of the
+  interview (stage, and turns into it), once sent at least
+  ACE_SPECULATION_MIN_COUNT times in this process
+- after every upstream turn, builds the exact upstream request the next
+  turn would send for the ACE_SPECULATION_PREDICTIONS most likely
+  messages (on a copy of the interview, which is left untouched) and
+  runs it on a background thread
+- serves the stored reply when a real turn sends a byte-for-byte
+  identical request, which also means the same history, stage and
+  generation settings. A real turn that arrives while the speculative
+  call is still running waits for it instead of starting a second one
+- discards speculations that the interview's next turn did not use, or
+  that are older than ACE_SPECULATION_TTL seconds, and counts their
+  tokens as wasted
+
+Speculation only runs with upstream capacity to spare: fewer than half
+of the admission slots in use, and within ACE_SPECULATION_BUDGET tokens
+per minute. Tokens of served speculations are accounted to the turn
+that used them; wasted ones are only counted here.
+"""
+
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter as Tally, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from admission import admission
+from compaction import estimate_tokens
+from metrics import Counter, registry
+
+SPECULATION = os.getenv('ACE_SPECULATION', 'false').lower() in ('1', 'true', 'yes')
+SPECULATION_BUDGET = int(os.getenv('ACE_SPECULATION_BUDGET', '20000'))  # tokens per minute spent on speculation
+SPECULATION_PREDICTIONS = int(os.getenv('ACE_SPECULATION_PREDICTIONS', '1'))  # next messages speculated on per turn
+SPECULATION_MIN_COUNT = int(os.getenv('ACE_SPECULATION_MIN_COUNT', '2'))  # times a message must recur to be predicted
+SPECULATION_TTL = float(os.getenv('ACE_SPECULATION_TTL', '900'))  # seconds an unused speculation is kept
+SPECULATION_WORKERS = int(os.getenv('ACE_SPECULATION_WORKERS', '4'))  # background threads running speculative calls
+MAX_MESSAGE_CHARS = 200  # longer messages (drafts, research) are candidate-specific and never predicted
+MAX_TRACKED_MESSAGES = 256  # distinct messages counted per stage
+MAX_ENTRIES = 4096  # speculations held per process
+BUDGET_WINDOW = 60.0  # seconds over which SPECULATION_BUDGET refills
+
+# Polling interval for asyncio waiters (a speculative call takes seconds)
+_ASYNC_POLL_SECONDS = 0.02
+
+speculations = registry.register(Counter(
+    'ace_speculations_total',
+    'Speculative next-turn generations, by outcome (started, hit, wasted, failed, skipped_budget, skipped_busy).',
+    ('outcome',)))
+speculation_tokens = registry.register(Counter(
+    'ace_speculation_tokens_total', 'Tokens spent on speculative generations, by outcome (served, wasted).', ('outcome',)))
+
+# Set while a speculative call runs, so its own request is not claimed by itself
+_speculating = contextvars.ContextVar('speculating', default=False)
+
+
+def request_key(messages, generation: Optional[Dict]) -> str:
+    """Fingerprint of an upstream request: its encoded messages and generation settings."""
+    encoded = messages.encoded() if hasattr(messages, 'encoded') else json.dumps(messages).encode('utf-8')
+    digest = hashlib.sha256(encoded)
+    digest.update(json.dumps(generation or {}, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class Speculation:
+    """One speculative call: pending until its reply (or failure) is in."""
+
+    __slots__ = ('session_id', 'key', 'event', 'text', 'meta', 'tokens', 'expires', 'discarded')
+
+    def __init__(self, session_id: str, key: str):
+        self.session_id = session_id
+        self.key = key
+        self.event = threading.Event()
+        self.text: Optional[str] = None  # stays None if the call failed
+        self.meta: Dict = {}
+        self.tokens = 0
+        self.expires = time.monotonic() + SPECULATION_TTL
+        self.discarded = False
+
+
+class Speculator:
+    """Predicts next messages, runs their turns ahead of time and hands the replies to matching turns."""
+
+    def __init__(self, enabled: bool = SPECULATION, budget: int = SPECULATION_BUDGET):
+        self.enabled = enabled
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, Speculation]' = OrderedDict()  # request key -> speculation, oldest first
+        self._by_session: Dict[str, List[Speculation]] = {}
+        self._messages: Dict[Tuple[str, int], Tally] = {}  # (stage, turns into it) -> candidate message counts
+        self._tokens = float(budget)  # token bucket, refilled over BUDGET_WINDOW
+        self._refilled = time.monotonic()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.counts = Tally()
+        self.served_tokens = 0
+        self.wasted_tokens = 0
+
+    # Learning
+
+    def observe(self, stages, user_message: str):
+        """Count a candidate message sent at the interview's current point (before it moves the stage on)."""
+        if not self.enabled or len(user_message) > MAX_MESSAGE_CHARS:
+            return
+        with self._lock:
+            tally = self._messages.setdefault((stages.stage, stages.turns), Tally())
+            tally[user_message] += 1
+            if len(tally) > MAX_TRACKED_MESSAGES:
+                # Forget the rarest half; recurring messages keep their counts
+                for message, _ in tally.most_common()[MAX_TRACKED_MESSAGES // 2:]:
+                    del tally[message]
+
+    def predict(self, stages) -> List[str]:
+        """The messages most likely to be sent next at the interview's current point."""
+        with self._lock:
+            tally = self._messages.get((stages.stage, stages.turns))
+            if not tally:
+                return []
+            return [message for message, count in tally.most_common(SPECULATION_PREDICTIONS) if count >= SPECULATION_MIN_COUNT]
+
+    # Speculating
+
+    def after_turn(self, agent):
+        """Discard the interview's unused speculations and start ones for its likely next messages.
+
+        Called with the interview's state as it is after a reply, under its
+        session lock; the copy taken here is what the requests are built from.
+        """
+        if not self.enabled or _speculating.get() or not agent.session_id or not agent.provider.available:
+            return
+        self._discard_session(agent.session_id)
+        predictions = self.predict(agent.stages)
+        if not predictions:
+            return
+        if admission.limit > 0 and admission.in_flight >= admission.limit // 2:
+            self._count('skipped_busy', len(predictions))
+            return
+        snapshot = type(agent).from_dict(agent.to_dict())
+        snapshot.session_id = agent.session_id
+        # A fresh context: no request profile or other per-request state in the background call
+        self._pool().submit(contextvars.Context().run, self._run, snapshot, predictions)
+
+    def _run(self, agent, predictions: List[str]):
+        _speculating.set(True)
+        for user_message in predictions:
+            role, messages, generation = agent.speculative_request(user_message)
+            key = request_key(messages, generation)
+            estimate = messages.tokens + (generation or {}).get('max_tokens', 0)
+            with self._lock:
+                if key in self._entries:
+                    continue
+                if not self._take_budget(estimate):
+                    self.counts['skipped_budget'] += 1
+                    speculations.labels('skipped_budget').inc()
+                    continue
+                speculation = Speculation(agent.session_id, key)
+                self._entries[key] = speculation
+                self._by_session.setdefault(agent.session_id, []).append(speculation)
+                self._evict()
+                self.counts['started'] += 1
+            speculations.labels('started').inc()
+            try:
+                speculation.text = agent.provider.complete(messages, speculation.meta, generation, role)
+            except Exception as e:
+                print(f"Speculative generation failed: {str(e)}")
+                self._count('failed')
+            usage = speculation.meta.get('usage') or {}
+            speculation.tokens = (usage.get('prompt_tokens') or messages.tokens) + \
+                (usage.get('completion_tokens') or estimate_tokens(speculation.text or ''))
+            with self._lock:
+                # Return what the estimate over-reserved
+                self._tokens = min(self.budget, self._tokens + estimate - speculation.tokens)
+                discarded = speculation.discarded or speculation.text is None
+                if speculation.text is None:
+                    self._remove(speculation)
+            speculation.event.set()
+            if discarded and speculation.text is not None:
+                self._waste(speculation)
+
+    def _take_budget(self, tokens: int) -> bool:
+        """Reserve tokens from the per-minute budget (caller holds the lock)."""
+        now = time.monotonic()
+        self._tokens = min(self.budget, self._tokens + (now - self._refilled) * self.budget / BUDGET_WINDOW)
+        self._refilled = now
+        if self._tokens < tokens:
+            return False
+        self._tokens -= tokens
+        return True
+
+    # Serving
+
+    def claim(self, messages, generation: Optional[Dict]) -> Optional[Speculation]:
+        """The finished speculation for this exact request, if any (waits for one still running)."""
+        speculation = self._lookup(messages, generation)
+        if speculation is None:
+            return None
+        speculation.event.wait(max(0.0, speculation.expires - time.monotonic()))
+        return self._settle(speculation)
+
+    async def claim_async(self, messages, generation: Optional[Dict]) -> Optional[Speculation]:
+        """Non-blocking version of claim for the asyncio serving path."""
+        import asyncio
+        speculation = self._lookup(messages, generation)
+        if speculation is None:
+            return None
+        while not speculation.event.is_set() and time.monotonic() < speculation.expires:
+            await asyncio.sleep(_ASYNC_POLL_SECONDS)
+        return self._settle(speculation)
+
+    def _lookup(self, messages, generation: Optional[Dict]) -> Optional[Speculation]:
+        if not self.enabled or not self._entries or _speculating.get():
+            return None
+        key = request_key(messages, generation)
+        with self._lock:
+            speculation = self._entries.get(key)
+            if speculation is None or speculation.discarded or speculation.expires < time.monotonic():
+                return None
+            self._remove(speculation)
+        return speculation
+
+    def _settle(self, speculation: Speculation) -> Optional[Speculation]:
+        if speculation.text is None:
+            return None
+        with self._lock:
+            self.counts['hit'] += 1
+            self.served_tokens += speculation.tokens
+        speculations.labels('hit').inc()
+        speculation_tokens.labels('served').inc(speculation.tokens)
+        return speculation
+
+    # Discarding
+
+    def _discard_session(self, session_id: str):
+        with self._lock:
+            entries = self._by_session.pop(session_id, [])
+            for speculation in entries:
+                speculation.discarded = True
+                self._entries.pop(speculation.key, None)
+        for speculation in entries:
+            # Ones still running are counted when they finish
+            if speculation.event.is_set() and speculation.text is not None:
+                self._waste(speculation)
+
+    def _remove(self, speculation: Speculation):
+        """Forget a speculation (caller holds the lock)."""
+        self._entries.pop(speculation.key, None)
+        entries = self._by_session.get(speculation.session_id)
+        if entries is not None:
+            if speculation in entries:
+                entries.remove(speculation)
+            if not entries:
+                del self._by_session[speculation.session_id]
+
+    def _evict(self):
+        """Drop expired speculations and the oldest beyond MAX_ENTRIES (caller holds the lock)."""
+        now = time.monotonic()
+        expired = []
+        while self._entries:
+            speculation = next(iter(self._entries.values()))
+            if speculation.expires >= now and len(self._entries) <= MAX_ENTRIES:
+                break
+            speculation.discarded = True
+            self._remove(speculation)
+            expired.append(speculation)
+        for speculation in expired:
+            if speculation.event.is_set() and speculation.text is not None:
+                self.counts['wasted'] += 1
+                self.wasted_tokens += speculation.tokens
+                speculations.labels('wasted').inc()
+                speculation_tokens.labels('wasted').inc(speculation.tokens)
+
+    def _waste(self, speculation: Speculation):
+        with self._lock:
+            self.counts['wasted'] += 1
+            self.wasted_tokens += speculation.tokens
+        speculations.labels('wasted').inc()
+        speculation_tokens.labels('wasted').inc(speculation.tokens)
+
+    def _count(self, outcome: str, amount: int = 1):
+        with self._lock:
+            self.counts[outcome] += amount
+        speculations.labels(outcome).inc(amount)
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(SPECULATION_WORKERS, thread_name_prefix='ace-speculation')
+        return self._executor
+
+    def stats(self) -> Dict:
+        with self._lock:
+            decided = self.counts['hit'] + self.counts['wasted']
+            return {
+                "enabled": self.enabled,
+                "budget_tokens_per_minute": self.budget,
+                "budget_remaining": int(self._tokens),
+                "pending": sum(1 for speculation in self._entries.values() if not speculation.event.is_set()),
+                "stored": len(self._entries),
+                "tracked_messages": sum(len(tally) for tally in self._messages.values()),
+                "counts": dict(self.counts),
+                "hit_rate": (self.counts['hit'] / decided) if decided else 0.0,
+                "served_tokens": self.served_tokens,
+                "wasted_tokens": self.wasted_tokens,
+            }
+
+
+speculator = Speculator()
+
+
+def _reset_after_fork():
+    speculator._lock = threading.Lock()
+    speculator._entries = OrderedDict()
+    speculator._by_session = {}
+    speculator._executor = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Interview stage state machine (steps 2-11 of the Sales Manager prompt).
+
+The stage used to be re-derived on every turn from the history length and
+by substring-matching whole responses, which misfired (any mention of a
+"solution architect" handed the conversation over) and never handed it
+back. Instead, each interview now carries an explicit stage with
+incrementally maintained counters:
+
+- a candidate message can move the interview on before it is answered
+  (an email draft, being ready to write after the Solution Architect
+  conversation, asking for the scorecard, or the stage's turn limit
+  being reached); an email sent
+  while still talking to the Solution Architect is taken as the draft
+  itself, so the interview goes straight on to feedback on it
+- a reply can move it on after it is sent, when it contains one of the
+  scripted hand-off phrases for the current stage
+
+Transitions only look at the current turn, so their cost does not grow
+with the interview. Each stage also carries its own generation settings
+(max_tokens, temperature), and time spent per stage is exported.
+"""
+
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+SA_MAX_EXCHANGES = int(os.getenv('ACE_SA_MAX_EXCHANGES', '3'))  # Solution Architect answers before the Sales Manager takes back over
+
+# Candidate messages shaped like an email (or long enough) are email drafts: a Subject: line, or a
+# salutation to Vijay on a line of its own followed by a body ("Vijay, what about..." is just a sentence)
+EMAIL_SUBJECT = re.compile(r'^\s*subject:\s*\S', re.IGNORECASE | re.MULTILINE)
+EMAIL_SALUTATION = re.compile(r'^\s*(?:(?:dear|hi|hello|hey)\s+)?vijay(?:\s+karunamurthy)?\s*[,:!]?\s*\n\s*\S',
+                              re.IGNORECASE | re.MULTILINE)
+EMAIL_MIN_CHARS = 400
+# Candidate messages containing these ask to move on from the Solution Architect to the email
+READY_TO_DRAFT_MARKERS = ('ready to draft', 'ready to write', 'draft the email', 'draft my email', 'write the email',
+                          'write my email', "that's all", 'that is all', 'no more questions')
+# Candidate messages containing these ask for the step-11 scorecard (scoring.SCORING_REQUEST is one)
+SCORING_REQUEST_MARKERS = ('score me', 'score my', 'my score', 'scorecard', 'score card', 'rate my performance',
+                           'how did i do', 'evaluate my performance', 'final feedback')
+# Replies containing these are the scorecard, when the Sales Manager sends it unasked
+SCORECARD_MARKERS = ('/5', 'out of 5', '1-5 rating', 'ratings')
+
+
+class Stage:
+    """One step of the simulation and how the interview leaves it."""
+
+    def __init__(self, name: str, step: int, label: str, max_tokens: int, temperature: float = 0.7,
+                 agent: str = 'sales_manager', max_turns: Optional[int] = None, next_stage: Optional[str] = None,
+                 message_markers: Tuple[str, ...] = (), message_min_chars: Optional[int] = None,
+                 email_stage: Optional[str] = None,
+                 message_transitions: Tuple[Tuple[Tuple[str, ...], str], ...] = (),
+                 reply_transitions: Tuple[Tuple[Tuple[str, ...], str], ...] = ()):
+        self.name = name
+        self.step = step  # step number in SYSTEM_PROMPT
+        self.label = label
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.agent = agent  # who answers the candidate in this stage
+        self.max_turns = max_turns  # candidate turns after which the next message moves on to next_stage
+        self.next_stage = next_stage
+        self.message_markers = message_markers  # a candidate message containing one moves on to next_stage
+        self.message_min_chars = message_min_chars  # ...as does one at least this long
+        self.email_stage = email_stage  # a candidate message that is an email draft moves on to this stage
+        self.message_transitions = message_transitions  # ((markers, stage), ...) checked against each candidate message
+        self.reply_transitions = reply_transitions  # ((markers, stage), ...) checked against each reply
+
+    def generation(self) -> Dict:
+        """Request settings for turns in this stage."""
+        return {"max_tokens": self.max_tokens, "temperature": self.temperature}
+
+
+STAGES: List[Stage] = [
+    Stage('objectives', 2, 'Research Objectives', max_tokens=2048,
+          reply_transitions=((('alex chen',), 'solution_architect'),
+                             (('where would you get', 'where would you find', 'how would you find out'), 'information_sources'))),
+    Stage('information_sources', 3, 'Show Weaknesses', max_tokens=2048,
+          reply_transitions=((('alex chen',), 'solution_architect'),)),
+    Stage('solution_architect', 4, 'Solution Architect', max_tokens=2048, agent='solution_architect',
+          max_turns=SA_MAX_EXCHANGES, next_stage='draft_email', message_markers=READY_TO_DRAFT_MARKERS,
+          email_stage='revise_email'),
+    Stage('draft_email', 5, 'Draft Email', max_tokens=2048, next_stage='revise_email',
+          message_min_chars=EMAIL_MIN_CHARS, email_stage='revise_email'),
+    Stage('revise_email', 6, 'Update Email', max_tokens=2048, next_stage='cto_follow_up',
+          message_min_chars=EMAIL_MIN_CHARS, email_stage='cto_follow_up'),
+    Stage('cto_follow_up', 7, 'Vijay Follow-up', max_tokens=2048, max_turns=3, next_stage='follow_ups',
+          message_transitions=((SCORING_REQUEST_MARKERS, 'scoring'),),
+          reply_transitions=((SCORECARD_MARKERS, 'scoring'),)),
+    Stage('follow_ups', 9, 'Follow-ups', max_tokens=2048,
+          message_transitions=((SCORING_REQUEST_MARKERS, 'scoring'),),
+          reply_transitions=((SCORECARD_MARKERS, 'scoring'),)),
+    Stage('scoring', 11, 'Scoring', max_tokens=2048, temperature=0.3),
+]
+
+STAGES_BY_NAME: Dict[str, Stage] = {stage.name: stage for stage in STAGES}
+FIRST_STAGE = STAGES[0].name
+
+
+def is_email(message: str) -> bool:
+    """Whether a candidate message is laid out like an email draft."""
+    return bool(EMAIL_SUBJECT.search(message) or EMAIL_SALUTATION.search(message))
+
+
+class StageStats:
+    """Process-wide time and turns spent per stage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: Dict[str, Dict] = {}
+
+    def _totals(self, stage: str) -> Dict:
+        return self.stages.setdefault(stage, {"entered": 0, "completed": 0, "seconds": 0.0, "turns": 0})
+
+    def record_entry(self, stage: str):
+        with self._lock:
+            self._totals(stage)["entered"] += 1
+
+    def record_exit(self, stage: str, seconds: float, turns: int):
+        with self._lock:
+            totals = self._totals(stage)
+            totals["completed"] += 1
+            totals["seconds"] += seconds
+            totals["turns"] += turns
+
+    def snapshot(self) -> Dict:
+        """Per stage: interviews that entered/completed it, and average time and turns spent there."""
+        with self._lock:
+            report = {}
+            for stage in STAGES:
+                totals = self.stages.get(stage.name)
+                if totals is None:
+                    continue
+                completed = totals["completed"]
+                report[stage.name] = {
+                    "step": stage.step,
+                    "entered": totals["entered"],
+                    "completed": completed,
+                    "avg_seconds": round(totals["seconds"] / completed, 1) if completed else 0.0,
+                    "avg_turns": round(totals["turns"] / completed, 2) if completed else 0.0,
+                }
+            return report
+
+
+stage_stats = StageStats()
+
+
+class StageMachine:
+    """Current stage of one interview, with per-stage counters and timings."""
+
+    def __init__(self, stage: str = FIRST_STAGE):
+        self.stage = stage
+        self.turns = 0  # candidate turns answered in the current stage
+        self.entered_at = time.time()
+        self.history: List[Dict] = []  # completed stages: name, entered_at, seconds, turns
+
+    @property
+    def current(self) -> Stage:
+        return STAGES_BY_NAME[self.stage]
+
+    def to_dict(self) -> Dict:
+        return {
+            "stage": self.stage,
+            "turns": self.turns,
+            "entered_at": self.entered_at,
+            "history": self.history
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'StageMachine':
+        machine = cls(data.get("stage", FIRST_STAGE) if data.get("stage") in STAGES_BY_NAME else FIRST_STAGE)
+        machine.turns = int(data.get("turns", 0))
+        machine.entered_at = float(data.get("entered_at", machine.entered_at))
+        machine.history = list(data.get("history", []))
+        return machine
+
+    def start(self):
+        """Count the interview as having entered its first stage."""
+        self.entered_at = time.time()
+        stage_stats.record_entry(self.stage)
+
+    def transition(self, stage: str):
+        """Move to another stage, closing the timing of the current one."""
+        if stage == self.stage or stage not in STAGES_BY_NAME:
+            return
+        now = time.time()
+        seconds = max(0.0, now - self.entered_at)
+        self.history.append({
+            "stage": self.stage,
+            "entered_at": round(self.entered_at, 3),
+            "seconds": round(seconds, 3),
+            "turns": self.turns
+        })
+        stage_stats.record_exit(self.stage, seconds, self.turns)
+        stage_stats.record_entry(stage)
+        self.stage = stage
+        self.turns = 0
+        self.entered_at = now
+
+    def _message_transition(self, user_message: str) -> Optional[str]:
+        """Stage a candidate message moves the interview on to, if any."""
+        stage = self.current
+        # An email sent to the Solution Architect is the draft: it skips being asked for one and gets feedback
+        if stage.email_stage and is_email(user_message):
+            return stage.email_stage
+        # Asking for the scorecard is answered with scoring's settings, whatever the turn count
+        if stage.message_transitions:
+            message_lower = user_message.lower()
+            for markers, next_stage in stage.message_transitions:
+                if any(marker in message_lower for marker in markers):
+                    return next_stage
+        if not stage.next_stage:
+            return None
+        if stage.max_turns is not None and self.turns >= stage.max_turns:
+            return stage.next_stage
+        if stage.message_min_chars is not None and len(user_message) >= stage.message_min_chars:
+            return stage.next_stage
+        if stage.message_markers:
+            message_lower = user_message.lower()
+            if any(marker in message_lower for marker in stage.message_markers):
+                return stage.next_stage
+        return None
+
+    def peek(self, user_message: str) -> Stage:
+        """The stage that would answer this message, without moving the interview on."""
+        next_stage = self._message_transition(user_message)
+        return STAGES_BY_NAME[next_stage] if next_stage else self.current
+
+    def on_message(self, user_message: str) -> Stage:
+        """Apply transitions triggered by a candidate message; return the stage that answers it."""
+        next_stage = self._message_transition(user_message)
+        if next_stage:
+            self.transition(next_stage)
+        self.turns += 1
+        return self.current
+
+    def on_reply(self, reply: str):
+        """Apply transitions triggered by the reply the candidate was just shown."""
+        transitions = self.current.reply_transitions
+        if not transitions:
+            return
+        reply_lower = reply.lower()
+        for markers, stage in transitions:
+            if any(marker in reply_lower for marker in markers):
+                self.transition(stage)
+                return
+
+    def summary(self) -> Dict:
+        """Current stage and time spent in each stage so far."""
+        stage = self.current
+        return {
+            "stage": stage.name,
+            "step": stage.step,
+            "label": stage.label,
+            "turns_in_stage": self.turns,
+            "seconds_in_stage": round(max(0.0, time.time() - self.entered_at), 3),
+            "completed_stages": self.history
+        }
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Durable interview transcripts through a write-behind queue.
+
+Transcripts used to live only in each agent's conversation_history and
+were lost on restart (or when a session expired). Every turn is now also
+appended to a SQLite database (WAL mode) that hiring teams can read back
+once an interview has reached the scoring step.
+
+Turns are never written on the request path: record_turn() appends to a
+bounded in-memory queue and returns. A single writer thread drains the
+queue every ACE_TRANSCRIPT_FLUSH_INTERVAL seconds (or as soon as
+ACE_TRANSCRIPT_BATCH entries are waiting) and commits the whole batch in
+one transaction, so the database pays one fsync per batch instead of one
+per turn. If the writer falls behind far enough to fill the queue
+(ACE_TRANSCRIPT_QUEUE_MAX entries), new entries are dropped and counted
+rather than letting memory grow or making a request wait on disk. The
+queue is flushed at shutdown.
+"""
+
+import atexit
+import hmac
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from metrics import Counter, register_gauge, registry
+
+TRANSCRIPT_DB = os.getenv('ACE_TRANSCRIPT_DB', 'transcripts.db')  # empty = transcripts are not persisted
+TRANSCRIPT_QUEUE_MAX = int(os.getenv('ACE_TRANSCRIPT_QUEUE_MAX', '10000'))  # entries waiting to be written
+TRANSCRIPT_BATCH = int(os.getenv('ACE_TRANSCRIPT_BATCH', '500'))  # entries that trigger a write before the interval
+TRANSCRIPT_FLUSH_INTERVAL = float(os.getenv('ACE_TRANSCRIPT_FLUSH_INTERVAL', '0.5'))  # seconds between writes
+TRANSCRIPT_TOKEN = os.getenv('ACE_TRANSCRIPT_TOKEN', '')  # bearer token required to read transcripts (unset = not readable over HTTP)
+
+# An interview is finished once the scorecard (step 11) has been sent
+FINISHED_STAGE = 'scoring'
+
+# (session_id, ts, role, speaker, stage, content)
+Entry = Tuple[str, float, str, Optional[str], Optional[str], str]
+
+transcript_drops = registry.register(Counter(
+    'ace_transcript_dropped_total', 'Transcript messages dropped because the write queue was full.'))
+
+
+class TranscriptLog:
+    """Append-only transcript store fed by a background writer thread."""
+
+    def __init__(self, path: str = TRANSCRIPT_DB, max_queue: int = TRANSCRIPT_QUEUE_MAX,
+                 batch_size: int = TRANSCRIPT_BATCH, flush_interval: float = TRANSCRIPT_FLUSH_INTERVAL):
+        self.path = path
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: deque = deque()
+        self._cond = threading.Condition()
+        self._writer: Optional[threading.Thread] = None
+        self._closing = False
+        self._flush_requested = False
+        self._in_flight = 0  # entries taken off the queue but not committed yet
+        self._local = threading.local()
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.write_errors = 0
+        self.last_batch_ms = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread (the writer's and each reader's); WAL keeps reads off the writer's lock."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Durable at each commit: with a batch per commit this is one fsync per batch
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS interviews ("
+                "session_id TEXT PRIMARY KEY, started_at REAL NOT NULL, updated_at REAL NOT NULL, "
+                "finished_at REAL, stage TEXT, messages INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, ts REAL NOT NULL, "
+                "role TEXT NOT NULL, speaker TEXT, stage TEXT, content TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS interviews_finished_at ON interviews (finished_at)")
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def record(self, session_id: str, role: str, content: str, stage: Optional[str] = None,
+               speaker: Optional[str] = None):
+        """Queue one message for writing (never blocks on disk)."""
+        if not self.enabled or not session_id:
+            return
+        entry: Entry = (session_id, time.time(), role, speaker, stage, content)
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                self.dropped += 1
+                transcript_drops.inc()
+                if self.dropped == 1:
+                    print(f"Transcript queue full ({self.max_queue} entries), dropping messages")
+                return
+            self._queue.append(entry)
+            self.enqueued += 1
+            if self._writer is None:
+                self._start_writer()
+            if len(self._queue) == 1 or len(self._queue) >= self.batch_size:
+                self._cond.notify_all()
+
+    def record_turn(self, session_id: str, user_message: str, reply: str, stage: Optional[str] = None,
+                    speaker: Optional[str] = None):
+        """Queue a candidate message and the reply it got."""
+        self.record(session_id, 'user', user_message, stage)
+        self.record(session_id, 'assistant', reply, stage, speaker)
+
+    def _start_writer(self):
+        """Start the writer thread (caller holds the condition)."""
+        self._closing = False
+        self._writer = threading.Thread(target=self._run, name='transcript-writer', daemon=True)
+        self._writer.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # Sleep until something is queued, then give the batch up to flush_interval to fill
+                deadline = None
+                while not (self._closing or self._flush_requested or len(self._queue) >= self.batch_size):
+                    if not self._queue:
+                        self._cond.wait()
+                        continue
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = list(self._queue)
+                self._queue.clear()
+                self._in_flight = len(batch)
+                self._flush_requested = False
+                closing = self._closing
+            if batch:
+                self._write(batch)
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+                if closing and not self._queue:
+                    self._writer = None
+                    return
+
+    def _write(self, batch: List[Entry]):
+        started = time.perf_counter()
+        sessions: Dict[str, List] = {}
+        for session_id, ts, role, _, stage, _ in batch:
+            summary = sessions.setdefault(session_id, [ts, ts, None, stage, 0])
+            summary[1] = ts
+            summary[3] = stage or summary[3]
+            summary[4] += 1
+            if role == 'assistant' and stage == FINISHED_STAGE and summary[2] is None:
+                summary[2] = ts
+        try:
+            conn = self._conn()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO messages (session_id, ts, role, speaker, stage, content) VALUES (?, ?, ?, ?, ?, ?)",
+                    batch
+                )
+                conn.executemany(
+                    "INSERT INTO interviews (session_id, started_at, updated_at, finished_at, stage, messages) "
+                    "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(session_id) DO UPDATE SET "
+                    "updated_at = excluded.updated_at, stage = COALESCE(excluded.stage, interviews.stage), "
+                    "finished_at = COALESCE(interviews.finished_at, excluded.finished_at), "
+                    "messages = interviews.messages + excluded.messages",
+                    [(session_id, *summary) for session_id, summary in sessions.items()]
+                )
+        except sqlite3.Error as e:
+            self.write_errors += 1
+            print(f"Transcript write error ({len(batch)} messages lost): {str(e)}")
+            return
+        self.written += len(batch)
+        self.batches += 1
+        self.last_batch_ms = round((time.perf_counter() - started) * 1000, 3)
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Wait until everything queued so far is written; False on timeout."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            while self._queue or self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._writer is None:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 10.0):
+        """Write what is queued and stop the writer thread."""
+        with self._cond:
+            writer = self._writer
+            if writer is None:
+                return
+            self._closing = True
+            self._cond.notify_all()
+        writer.join(timeout)
+        if writer.is_alive():
+            print(f"Transcript writer did not finish within {timeout:g}s; {len(self._queue)} messages not written")
+
+    def finished(self, limit: int = 50, offset: int = 0) -> List[Dict]:
+        """Finished interviews, most recently finished first."""
+        rows = self._conn().execute(
+            "SELECT session_id, started_at, finished_at, stage, messages FROM interviews "
+            "WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT ? OFFSET ?",
+            (limit, offset)
+        ).fetchall()
+        return [
+            {"session_id": row[0], "started_at": row[1], "finished_at": row[2], "stage": row[3], "messages": row[4]}
+            for row in rows
+        ]
+
+    def transcript(self, session_id: str) -> Optional[Dict]:
+        """An interview's messages in order (None if nothing was recorded for it)."""
+        conn = self._conn()
+        interview = conn.execute(
+            "SELECT started_at, updated_at, finished_at, stage FROM interviews WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if interview is None:
+            return None
+        rows = conn.execute(
+            "SELECT ts, role, speaker, stage, content FROM messages WHERE session_id = ? ORDER BY id", (session_id,)
+        ).fetchall()
+        return {
+            "session_id": session_id,
+            "started_at": interview[0],
+            "updated_at": interview[1],
+            "finished_at": interview[2],
+            "stage": interview[3],
+            "messages": [
+                {"ts": row[0], "role": row[1], "speaker": row[2], "stage": row[3], "content": row[4]} for row in rows
+            ],
+        }
+
+    def queue_depth(self) -> int:
+        return len(self._queue) + self._in_flight
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "path": self.path or None,
+                "queued": len(self._queue) + self._in_flight,
+                "max_queue": self.max_queue,
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "dropped": self.dropped,
+                "batches": self.batches,
+                "avg_batch_size": round(self.written / self.batches, 1) if self.batches else 0.0,
+                "last_batch_ms": self.last_batch_ms,
+                "write_errors": self.write_errors,
+            }
+
+
+def read_authorized(authorization: Optional[str]) -> bool:
+    """Whether an Authorization header may read transcripts (never while no ACE_TRANSCRIPT_TOKEN is set)."""
+    if not TRANSCRIPT_TOKEN:
+        return False
+    return hmac.compare_digest((authorization or '').encode('utf-8'), f"Bearer {TRANSCRIPT_TOKEN}".encode('utf-8'))
+
+
+transcript_log = TranscriptLog()
+register_gauge('ace_transcript_queue_depth', 'Transcript messages waiting to be written.', transcript_log.queue_depth)
+atexit.register(transcript_log.close)
+
+
+def _reset_after_fork():
+    """The writer thread does not survive a fork; each worker starts its own on first use."""
+    transcript_log._cond = threading.Condition()
+    transcript_log._queue = deque()
+    transcript_log._writer = None
+    transcript_log._closing = False
+    transcript_log._flush_requested = False
+    transcript_log._in_flight = 0
+    transcript_log._local = threading.local()
+    transcript_log.enqueued = 0
+    transcript_log.written = 0
+    transcript_log.dropped = 0
+    transcript_log.batches = 0
+    transcript_log.write_errors = 0
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Per-turn token and payload accounting for upstream LLM calls.
+
+Every turn that goes to the Grok API produces one record: which agent
+(Sales Manager or Solution Architect) asked in which interview stage,
+which model answered, how big the request body was, and the
+prompt/completion token counts. Token counts come from the response's
+`usage` block when the API reports it and fall back to an estimate
+otherwise.
+
+Records are folded into process-wide aggregates (GET /api/stats/usage),
+into the session's own totals (persisted with the agent, GET /api/usage),
+and optionally appended to a JSONL file (ACE_USAGE_LOG) for offline
+analysis. The file is written by a background thread, never on the
+request path: record() queues the line and returns, and a full queue
+(ACE_USAGE_QUEUE_MAX lines) drops records rather than making a turn
+wait on disk. The queue is flushed at shutdown.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from compaction import estimate_tokens, message_tokens
+from message_buffer import PreparedMessages
+
+USAGE_LOG = os.getenv('ACE_USAGE_LOG')  # JSONL file every turn record is appended to (unset = no log)
+USAGE_QUEUE_MAX = int(os.getenv('ACE_USAGE_QUEUE_MAX', '10000'))  # log lines waiting to be written
+
+SALES_MANAGER = 'sales_manager'
+SOLUTION_ARCHITECT = 'solution_architect'
+
+# Counters kept per session, per agent, per model and overall
+TOTAL_FIELDS = ('turns', 'fallbacks', 'prompt_tokens', 'completion_tokens', 'payload_bytes', 'response_chars', 'upstream_ms')
+
+
+def empty_totals() -> Dict:
+    return {field: 0 for field in TOTAL_FIELDS}
+
+
+def add_to_totals(totals: Dict, record: Dict):
+    """Fold one turn record into a totals dict (in place)."""
+    totals['turns'] = totals.get('turns', 0) + 1
+    if record.get('fallback'):
+        totals['fallbacks'] = totals.get('fallbacks', 0) + 1
+    for field in ('prompt_tokens', 'completion_tokens', 'payload_bytes', 'response_chars', 'upstream_ms'):
+        totals[field] = totals.get(field, 0) + record.get(field, 0)
+
+
+def summarize_totals(totals: Dict) -> Dict:
+    """Totals plus per-turn averages, for reporting."""
+    summary = dict(totals)
+    turns = totals.get('turns', 0)
+    summary['total_tokens'] = totals.get('prompt_tokens', 0) + totals.get('completion_tokens', 0)
+    for field in ('prompt_tokens', 'completion_tokens', 'payload_bytes', 'upstream_ms'):
+        summary[f'avg_{field}'] = round(totals.get(field, 0) / turns, 1) if turns else 0.0
+    return summary
+
+
+def turn_record(session_id: Optional[str], agent: str, messages: List[Dict], response_text: str,
+                meta: Dict, started: float, streamed: bool = False, stage: Optional[str] = None) -> Dict:
+    """Build the usage record for one upstream turn.
+
+    meta is filled in by the Grok call helpers: the model that answered,
+    the request body size and the API-reported `usage` (all missing if
+    every attempt failed and the turn fell back to a mock response).
+    """
+    usage = meta.get('usage') or {}
+    prompt_tokens = usage.get('prompt_tokens')
+    completion_tokens = usage.get('completion_tokens')
+    if isinstance(messages, PreparedMessages):
+        # Sizes were added up as the messages were encoded
+        prompt_chars, estimated_prompt_tokens = messages.chars, messages.tokens
+    else:
+        prompt_chars = sum(len(msg.get('content', '')) for msg in messages)
+        estimated_prompt_tokens = sum(message_tokens(msg) for msg in messages)
+    return {
+        'ts': round(time.time(), 3),
+        'session_id': session_id,
+        'agent': agent,
+        'stage': stage,
+        'model': meta.get('model'),
+        'streamed': streamed,
+        'fallback': 'model' not in meta,
+        'messages': len(messages),
+        'prompt_chars': prompt_chars,
+        'payload_bytes': meta.get('payload_bytes', 0),
+        'prompt_tokens': prompt_tokens if prompt_tokens is not None else estimated_prompt_tokens,
+        'completion_tokens': completion_tokens if completion_tokens is not None else estimate_tokens(response_text),
+        'usage_reported': prompt_tokens is not None and completion_tokens is not None,
+        'response_chars': len(response_text),
+        'upstream_ms': round((time.monotonic() - started) * 1000, 1),
+    }
+
+
+class UsageTracker:
+    """Process-wide usage aggregates and the optional JSONL sink."""
+
+    def __init__(self, log_path: Optional[str] = USAGE_LOG, max_queue: int = USAGE_QUEUE_MAX):
+        self._lock = threading.Lock()
+        self.log_path = log_path
+        self.max_queue = max_queue
+        self._log = None
+        self._queue: deque = deque()
+        self._cond = threading.Condition()
+        self._writer: Optional[threading.Thread] = None
+        self._closing = False
+        self.log_errors = 0
+        self.log_dropped = 0
+        self.totals = empty_totals()
+        self.by_agent: Dict[str, Dict] = {}
+        self.by_model: Dict[str, Dict] = {}
+        self.by_stage: Dict[str, Dict] = {}
+
+    def record(self, record: Dict):
+        """Add one turn record to the aggregates and queue it for the JSONL log."""
+        with self._lock:
+            add_to_totals(self.totals, record)
+            add_to_totals(self.by_agent.setdefault(record['agent'], empty_totals()), record)
+            add_to_totals(self.by_model.setdefault(record['model'] or 'fallback', empty_totals()), record)
+            if record.get('stage'):
+                add_to_totals(self.by_stage.setdefault(record['stage'], empty_totals()), record)
+        if self.log_path:
+            self._enqueue(json.dumps(record, separators=(',', ':')) + '\n')
+
+    def _enqueue(self, line: str):
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                self.log_dropped += 1
+                if self.log_dropped == 1:
+                    print(f"Usage log queue full ({self.max_queue} lines), dropping records")
+                return
+            self._queue.append(line)
+            if self._writer is None:
+                self._closing = False
+                self._writer = threading.Thread(target=self._run, name='usage-writer', daemon=True)
+                self._writer.start()
+            if len(self._queue) == 1:
+                self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not (self._queue or self._closing):
+                    self._cond.wait()
+                lines = list(self._queue)
+                self._queue.clear()
+                closing = self._closing
+            if lines:
+                self._write(''.join(lines))
+            if closing:
+                with self._cond:
+                    if not self._queue:
+                        self._writer = None
+                        if self._log is not None:
+                            self._log.close()
+                            self._log = None
+                        return
+
+    def _write(self, text: str):
+        """Append queued lines to the log (writer thread only)."""
+        try:
+            if self._log is None:
+                self._log = open(self.log_path, 'a', encoding='utf-8')
+            self._log.write(text)
+            self._log.flush()
+        except OSError as e:
+            self.log_errors += 1
+            if self.log_errors == 1:
+                print(f"Usage log error: {str(e)}")
+
+    def snapshot(self) -> Dict:
+        """Aggregate figures overall, per agent, per model and per interview stage."""
+        with self._lock:
+            return {
+                'log_path': self.log_path,
+                'log_errors': self.log_errors,
+                'log_dropped': self.log_dropped,
+                'log_queued': len(self._queue),
+                'total': summarize_totals(self.totals),
+                'by_agent': {name: summarize_totals(totals) for name, totals in self.by_agent.items()},
+                'by_model': {name: summarize_totals(totals) for name, totals in self.by_model.items()},
+                'by_stage': {name: summarize_totals(totals) for name, totals in self.by_stage.items()},
+            }
+
+    def close(self, timeout: float = 10.0):
+        """Write what is queued and stop the writer thread."""
+        with self._cond:
+            writer = self._writer
+            if writer is None:
+                return
+            self._closing = True
+            self._cond.notify_all()
+        writer.join(timeout)
+        if writer.is_alive():
+            print(f"Usage log writer did not finish within {timeout:g}s; {len(self._queue)} records not written")
+
+
+usage_tracker = UsageTracker()
+atexit.register(usage_tracker.close)
+
+
+def _reset_after_fork():
+    """Each worker counts its own turns and opens its own handle on the log."""
+    usage_tracker._lock = threading.Lock()
+    usage_tracker._log = None
+    usage_tracker._queue = deque()
+    usage_tracker._cond = threading.Condition()
+    usage_tracker._writer = None
+    usage_tracker._closing = False
+    usage_tracker.log_errors = 0
+    usage_tracker.log_dropped = 0
+    usage_tracker.totals = empty_totals()
+    usage_tracker.by_agent = {}
+    usage_tracker.by_model = {}
+    usage_tracker.by_stage = {}
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,481 @@
+const chatMessages = document.getElementById('chatMessages');
+const chatForm = document.getElementById('chatForm');
+const messageInput = document.getElementById('messageInput');
+const interviewStages = document.getElementById('interviewStages');
+let initialized = false;
+let currentStage = 1;
+let usingSolutionArchitect = false;
+
+// WebSocket transport (served by the ASGI app): one connection per interview
+// carries every turn, plus stage changes the server pushes. It resumes after
+// a reconnect; where it is unavailable, messages go over the POST API.
+const SOCKET_RECONNECT_DELAYS = [500, 1000, 2000, 4000];
+let socket = null;
+let socketReady = false;
+let socketFailed = !window.WebSocket;
+let socketOpened = false;
+let socketChannel = null;
+let socketLastSeq = null;
+let socketAttempts = 0;
+let socketHeartbeat = 20;
+let socketWatchdog = null;
+const socketTurns = new Map();
+
+// Server-side interview stages mapped onto the stage indicator above
+const STAGE_INDICATORS = {
+    objectives: 1,
+    information_sources: 2,
+    solution_architect: 3,
+    draft_email: 4,
+    revise_email: 5,
+    cto_follow_up: 6,
+    follow_ups: 6,
+    scoring: 6
+};
+
+// Initialize chat when page loads
+window.addEventListener('DOMContentLoaded', async () => {
+    if (!initialized) {
+        await initializeChat();
+    }
+    connectSocket();
+});
+
+function updateStage(stage) {
+    currentStage = stage;
+    const stages = interviewStages.querySelectorAll('.stage');
+    stages.forEach((s, index) => {
+        const stageNum = index + 1;
+        if (stageNum < stage) {
+            s.classList.add('completed');
+            s.classList.remove('active');
+        } else if (stageNum === stage) {
+            s.classList.add('active');
+            s.classList.remove('completed');
+        } else {
+            s.classList.remove('active', 'completed');
+        }
+    });
+}
+
+async function initializeChat() {
+    try {
+        const response = await fetch('/api/chat/init', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            }
+        });
+
+        const data = await response.json();
+        if (data.message) {
+            addMessage(data.message, 'assistant');
+            initialized = true;
+            updateStage(1); // Start at stage 1
+        } else if (data.error) {
+            addMessage('Error: ' + data.error, 'error');
+        }
+    } catch (error) {
+        console.error('Error initializing chat:', error);
+        addMessage('Error initializing interview. Please refresh the page.', 'error');
+    }
+}
+
+chatForm.addEventListener('submit', async (e) => {
+    e.preventDefault();
+
+    const message = messageInput.value.trim();
+    if (!message) return;
+
+    // Add user message to chat
+    addMessage(message, 'user');
+    messageInput.value = '';
+
+    // Disable input while waiting for response
+    messageInput.disabled = true;
+    chatForm.querySelector('button').disabled = true;
+
+    // Show loading indicator
+    const loadingId = addMessage('Thinking...', 'assistant', true);
+
+    // One key per submission: a retried or fallback request for the same
+    // message is answered once by the server
+    const idempotencyKey = newIdempotencyKey();
+
+    try {
+        let handled = false;
+        if (socketReady) {
+            handled = await sendMessageSocket(message, loadingId, idempotencyKey);
+        }
+        if (!handled) {
+            const streamed = await sendMessageStreaming(message, loadingId, idempotencyKey);
+            if (!streamed) {
+                await sendMessage(message, loadingId, idempotencyKey);
+            }
+        }
+    } catch (error) {
+        removeMessage(loadingId);
+        addMessage('Error sending message. Please try again.', 'error');
+    } finally {
+        // Re-enable input
+        messageInput.disabled = false;
+        chatForm.querySelector('button').disabled = false;
+        messageInput.focus();
+    }
+});
+
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+}
+
+function connectSocket() {
+    if (socketFailed) return;
+    const scheme = location.protocol === 'https:' ? 'wss:' : 'ws:';
+    let url = scheme + '//' + location.host + '/api/chat/ws';
+    if (socketChannel !== null && socketLastSeq !== null) {
+        url += '?channel=' + encodeURIComponent(socketChannel) + '&last_seq=' + socketLastSeq;
+    }
+    try {
+        socket = new WebSocket(url);
+    } catch (error) {
+        giveUpSocket();
+        return;
+    }
+    socket.onmessage = (event) => {
+        let frame;
+        try {
+            frame = JSON.parse(event.data);
+        } catch (error) {
+            return;
+        }
+        handleSocketFrame(frame);
+    };
+    socket.onclose = () => {
+        socketReady = false;
+        clearTimeout(socketWatchdog);
+        // Never connected (e.g. the WSGI server): use the POST API from now on
+        if (!socketOpened || socketAttempts >= SOCKET_RECONNECT_DELAYS.length) {
+            giveUpSocket();
+            return;
+        }
+        setTimeout(connectSocket, SOCKET_RECONNECT_DELAYS[socketAttempts++]);
+    };
+}
+
+// Turns still waiting on the socket are handed back to be sent over POST
+// with the same Idempotency-Key, so none of them runs twice
+function giveUpSocket() {
+    socketFailed = true;
+    socketReady = false;
+    socketTurns.forEach((turn) => {
+        if (turn.messageId) removeMessage(turn.messageId);
+        turn.resolve(false);
+    });
+    socketTurns.clear();
+}
+
+// A silent connection (no frame, not even a heartbeat ping) is dead: reconnect
+function armSocketWatchdog() {
+    clearTimeout(socketWatchdog);
+    socketWatchdog = setTimeout(() => socket.close(), socketHeartbeat * 2500);
+}
+
+function sendSocketTurn(id, turn) {
+    socket.send(JSON.stringify({ type: 'chat', id: id, message: turn.message }));
+}
+
+// Send a message over the WebSocket; resolves false if the socket is lost
+// for good before the reply arrives, so the caller can fall back to POST.
+function sendMessageSocket(message, loadingId, idempotencyKey) {
+    return new Promise((resolve) => {
+        const turn = { message: message, loadingId: loadingId, text: '', speaker: null, messageId: null, resolve: resolve };
+        socketTurns.set(idempotencyKey, turn);
+        sendSocketTurn(idempotencyKey, turn);
+    });
+}
+
+function handleSocketFrame(frame) {
+    armSocketWatchdog();
+    if (frame.seq) {
+        socketLastSeq = frame.seq;
+    }
+
+    if (frame.type === 'ready') {
+        socketChannel = frame.channel;
+        socketHeartbeat = frame.heartbeat || socketHeartbeat;
+        socketOpened = true;
+        socketAttempts = 0;
+        socketReady = true;
+        if (!frame.resumed) {
+            // Missed frames are gone: ask again for the replies still owed
+            socketLastSeq = frame.seq;
+            socketTurns.forEach((turn, id) => sendSocketTurn(id, turn));
+        }
+        return;
+    }
+    if (frame.type === 'ping') {
+        socket.send(JSON.stringify({ type: 'pong' }));
+        return;
+    }
+    if (frame.type === 'stage') {
+        handleStagePush(frame);
+        return;
+    }
+
+    // Turn frames; those of turns sent from another tab are not shown here
+    const turn = socketTurns.get(frame.turn);
+    if (!turn) return;
+    if (frame.type === 'start') {
+        turn.speaker = frame.speaker;
+        turn.text = '';
+    } else if (frame.type === 'delta') {
+        turn.text += frame.text;
+        if (!turn.messageId) {
+            removeMessage(turn.loadingId);
+            turn.messageId = addMessage(turn.text, 'assistant', false, turn.speaker);
+        } else {
+            setMessageText(turn.messageId, turn.text);
+        }
+    } else if (frame.type === 'done') {
+        socketTurns.delete(frame.turn);
+        removeMessage(turn.loadingId);
+        if (!turn.messageId) {
+            addMessage('Error sending message. Please try again.', 'error');
+        } else {
+            handleAssistantMessage(turn.text, turn.speaker, frame.stage);
+        }
+        turn.resolve(true);
+    } else if (frame.type === 'error') {
+        socketTurns.delete(frame.turn);
+        removeMessage(turn.loadingId);
+        addMessage('Error: ' + frame.error, 'error');
+        turn.resolve(true);
+    }
+}
+
+// Stage changes pushed by the server, including hand-offs between the interviewers
+function handleStagePush(frame) {
+    if (STAGE_INDICATORS[frame.stage]) {
+        usingSolutionArchitect = frame.agent === 'solution_architect';
+        updateStage(STAGE_INDICATORS[frame.stage]);
+    }
+    if (frame.handoff) {
+        addMessage(frame.agent === 'solution_architect'
+            ? 'Alex Chen (Solution Architect) joined the conversation'
+            : 'The Sales Manager took the conversation back', 'notice');
+    }
+}
+
+// Stream the reply token by token from /api/chat/stream (Server-Sent Events).
+// Returns false if streaming is unavailable so the caller can fall back to /api/chat.
+async function sendMessageStreaming(message, loadingId, idempotencyKey) {
+    if (!window.ReadableStream || !window.TextDecoder) {
+        return false;
+    }
+
+    const response = await fetch('/api/chat/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream',
+            'Idempotency-Key': idempotencyKey
+        },
+        body: JSON.stringify({ 
+            message: message,
+            use_solution_architect: usingSolutionArchitect
+        })
+    });
+
+    const contentType = response.headers.get('Content-Type') || '';
+    if (!response.ok || !response.body || !contentType.includes('text/event-stream')) {
+        if ([400, 409, 422, 429].includes(response.status)) {
+            const data = await response.json();
+            removeMessage(loadingId);
+            addMessage('Error: ' + data.error, 'error');
+            return true;
+        }
+        return false;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let text = '';
+    let speaker = null;
+    let stage = null;
+    let messageId = null;
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // SSE frames are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            const event = parseSseFrame(frame);
+            if (!event) continue;
+
+            if (event.type === 'start') {
+                speaker = event.data.speaker;
+            } else if (event.type === 'done') {
+                stage = event.data.stage;
+            } else if (event.type === 'delta') {
+                text += event.data.text;
+                if (!messageId) {
+                    removeMessage(loadingId);
+                    messageId = addMessage(text, 'assistant', false, speaker);
+                } else {
+                    setMessageText(messageId, text);
+                }
+            } else if (event.type === 'error') {
+                removeMessage(loadingId);
+                addMessage('Error: ' + event.data.error, 'error');
+                return true;
+            }
+        }
+    }
+
+    removeMessage(loadingId);
+    if (!messageId) {
+        addMessage('Error sending message. Please try again.', 'error');
+        return true;
+    }
+    handleAssistantMessage(text, speaker, stage);
+    return true;
+}
+
+async function sendMessage(message, loadingId, idempotencyKey) {
+    const response = await fetch('/api/chat', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Idempotency-Key': idempotencyKey
+        },
+        body: JSON.stringify({ 
+            message: message,
+            use_solution_architect: usingSolutionArchitect
+        })
+    });
+
+    const data = await response.json();
+
+    // Remove loading message
+    removeMessage(loadingId);
+
+    if (data.message) {
+        // Label replies from the Solution Architect
+        addMessage(data.message, 'assistant', false, data.speaker);
+        handleAssistantMessage(data.message, data.speaker, data.stage);
+    } else if (data.error) {
+        addMessage('Error: ' + data.error, 'error');
+    }
+}
+
+function parseSseFrame(frame) {
+    let type = 'message';
+    const dataLines = [];
+    frame.split('\n').forEach((line) => {
+        if (line.startsWith('event:')) {
+            type = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            dataLines.push(line.slice(5).trim());
+        }
+    });
+    if (!dataLines.length) return null;
+    try {
+        return { type: type, data: JSON.parse(dataLines.join('\n')) };
+    } catch (error) {
+        return null;
+    }
+}
+
+// Track Solution Architect hand-off and interview stage from a completed assistant message
+function handleAssistantMessage(text, speaker, stage) {
+    // The server tracks the stage; only guess from the text if it did not say
+    if (stage && STAGE_INDICATORS[stage]) {
+        usingSolutionArchitect = stage === 'solution_architect';
+        updateStage(STAGE_INDICATORS[stage]);
+        return;
+    }
+
+    if (speaker === 'solution_architect') {
+        usingSolutionArchitect = true;
+        return;
+    }
+
+    // Check if agent is connecting to Solution Architect
+    const messageLower = text.toLowerCase();
+    if (messageLower.includes('solution architect') || messageLower.includes('alex chen') || (messageLower.includes('connected') && messageLower.includes('architect'))) {
+        usingSolutionArchitect = true;
+    } else {
+        usingSolutionArchitect = false;
+    }
+
+    // Detect stage transitions based on message content
+    // New order: 1. Research Objectives, 2. Show Weaknesses, 3. Solution Architect, 4. Draft Email, 5. Update Email, 6. Vijay Follow-up
+    if (messageLower.includes('missing') || messageLower.includes('weakness') || messageLower.includes('where would you get') || messageLower.includes('what information') || messageLower.includes('what would be helpful')) {
+        updateStage(2);
+    } else if (messageLower.includes('solution architect') || messageLower.includes('alex chen')) {
+        updateStage(3);
+    } else if (messageLower.includes('draft') && messageLower.includes('email') && !messageLower.includes('update')) {
+        updateStage(4);
+    } else if (messageLower.includes('update') && messageLower.includes('email')) {
+        updateStage(5);
+    } else if (messageLower.includes('vijay') && (messageLower.includes('replies') || messageLower.includes('responds') || messageLower.includes('from: vijay') || messageLower.includes('follow-up') || messageLower.includes('vp'))) {
+        updateStage(6);
+    }
+}
+
+function removeMessage(messageId) {
+    const messageDiv = document.getElementById(messageId);
+    if (messageDiv) {
+        messageDiv.remove();
+    }
+}
+
+function setMessageText(messageId, text) {
+    const messageDiv = document.getElementById(messageId);
+    if (!messageDiv) return;
+    const textContent = messageDiv.querySelector('.message-text');
+    textContent.innerHTML = text.replace(/\n/g, '<br>');
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+}
+
+function addMessage(text, role, isLoading = false, speaker = null) {
+    const messageDiv = document.createElement('div');
+    const messageId = 'msg-' + Date.now() + '-' + Math.random().toString(36).substr(2, 9);
+    messageDiv.id = messageId;
+    messageDiv.className = `chat-message chat-message-${role}`;
+
+    const messageContent = document.createElement('div');
+    messageContent.className = 'chat-message-content';
+
+    // Add speaker label if provided
+    if (speaker) {
+        const speakerLabel = document.createElement('div');
+        speakerLabel.className = 'message-speaker';
+        speakerLabel.textContent = speaker;
+        messageContent.appendChild(speakerLabel);
+    }
+
+    const textContent = document.createElement('div');
+    textContent.className = 'message-text';
+    // Format text with line breaks
+    const formattedText = text.replace(/\n/g, '<br>');
+    textContent.innerHTML = formattedText;
+    messageContent.appendChild(textContent);
+
+    messageDiv.appendChild(messageContent);
+    chatMessages.appendChild(messageDiv);
+
+    // Scroll to bottom
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+
+    return messageId;
+}
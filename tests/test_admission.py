@@ -0,0 +1,164 @@
+"""Slot accounting in AdmissionControl, including waiters that are cancelled or time out."""
+
+import asyncio
+import threading
+
+import pytest
+
+from admission import AdmissionControl, Overloaded
+
+
+def test_slots_are_taken_and_given_back():
+    ac = AdmissionControl(limit=2, queue_max=0, wait=0.01)
+    with ac.slot():
+        with ac.slot():
+            assert ac.in_flight == 2
+            with pytest.raises(Overloaded) as refused:
+                with ac.slot():
+                    pass
+            assert refused.value.retry_after >= 1
+        assert ac.in_flight == 1
+    assert ac.in_flight == 0
+    assert ac.stats()['rejected'] == {'queue_full': 1}
+
+
+def test_slot_is_given_back_when_the_turn_raises():
+    ac = AdmissionControl(limit=1)
+    with pytest.raises(RuntimeError):
+        with ac.slot():
+            raise RuntimeError('upstream failed')
+    assert ac.in_flight == 0
+
+
+def test_finishing_turn_hands_its_slot_to_the_oldest_waiter():
+    ac = AdmissionControl(limit=1, queue_max=2, wait=5)
+    order = []
+    holder = ac.slot()
+    holder.__enter__()
+
+    def turn(name):
+        with ac.slot():
+            order.append(name)
+
+    first = threading.Thread(target=turn, args=('first',))
+    first.start()
+    while ac.queue_depth() < 1:
+        pass
+    second = threading.Thread(target=turn, args=('second',))
+    second.start()
+    while ac.queue_depth() < 2:
+        pass
+
+    holder.__exit__(None, None, None)
+    first.join()
+    second.join()
+    assert order == ['first', 'second']
+    assert ac.in_flight == 0
+    assert ac.queue_depth() == 0
+
+
+def test_timed_out_waiter_leaves_the_queue():
+    ac = AdmissionControl(limit=1, queue_max=1, wait=0.01)
+    with ac.slot():
+        with pytest.raises(Overloaded):
+            with ac.slot():
+                pass
+        assert ac.queue_depth() == 0
+        assert ac.in_flight == 1
+    assert ac.in_flight == 0
+    assert ac.stats()['rejected'] == {'timeout': 1}
+
+
+def test_new_interviews_wait_for_a_free_slot():
+    ac = AdmissionControl(limit=1)
+    ac.admit_interview()
+    with ac.slot():
+        with pytest.raises(Overloaded):
+            ac.admit_interview()
+
+
+def test_check_room_only_refuses_once_the_queue_is_full():
+    ac = AdmissionControl(limit=1, queue_max=0)
+    ac.check_room()
+    with ac.slot():
+        with pytest.raises(Overloaded):
+            ac.check_room()
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def run():
+        ac = AdmissionControl(limit=1, queue_max=2, wait=5)
+        async with ac.slot_async():
+            async def waiter():
+                async with ac.slot_async():
+                    pass
+
+            task = asyncio.create_task(waiter())
+            await asyncio.sleep(0.01)
+            assert ac.queue_depth() == 1
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert ac.queue_depth() == 0
+            assert ac.in_flight == 1
+        return ac
+
+    assert asyncio.run(run()).in_flight == 0
+
+
+def test_waiter_cancelled_after_the_handover_gives_the_slot_back():
+    async def run():
+        ac = AdmissionControl(limit=1, queue_max=2, wait=5)
+        holder = ac.slot()
+        holder.__enter__()
+
+        async def waiter():
+            async with ac.slot_async():
+                await asyncio.sleep(10)
+
+        task = asyncio.create_task(waiter())
+        await asyncio.sleep(0.01)
+        # The slot is handed to the waiter, which is cancelled before it wakes up to take it
+        holder.__exit__(None, None, None)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return ac
+
+    ac = asyncio.run(run())
+    assert ac.in_flight == 0
+    assert ac.queue_depth() == 0
+
+
+def test_turn_cancelled_while_holding_a_slot_gives_it_back():
+    async def run():
+        ac = AdmissionControl(limit=1)
+        started = asyncio.Event()
+
+        async def turn():
+            async with ac.slot_async():
+                started.set()
+                await asyncio.sleep(10)
+
+        task = asyncio.create_task(turn())
+        await started.wait()
+        assert ac.in_flight == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return ac
+
+    assert asyncio.run(run()).in_flight == 0
+
+
+def test_async_waiter_times_out():
+    async def run():
+        ac = AdmissionControl(limit=1, queue_max=1, wait=0.01)
+        async with ac.slot_async():
+            with pytest.raises(Overloaded):
+                async with ac.slot_async():
+                    pass
+            assert ac.queue_depth() == 0
+        return ac
+
+    assert asyncio.run(run()).in_flight == 0
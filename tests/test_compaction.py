@@ -0,0 +1,106 @@
+"""Where ConversationCompactor puts the boundary, and which messages it pins."""
+
+import compaction
+from compaction import ConversationCompactor, is_pinned, message_tokens
+
+PREFIX_TOKENS = 50
+
+
+def _history(turns: int, pinned_every: int = 0):
+    history = []
+    for turn in range(turns):
+        question = f"Question {turn}: " + "words " * 40
+        if pinned_every and turn % pinned_every == 0:
+            question = f"My objective {turn} is " + "growth " * 40
+        history.append({"role": "user", "content": question})
+        history.append({"role": "assistant", "content": f"Answer {turn}: " + "detail " * 60})
+    return history
+
+
+def _full_tokens(history):
+    return PREFIX_TOKENS + sum(message_tokens(msg) for msg in history)
+
+
+def _request_tokens(compactor: ConversationCompactor, history):
+    """Tokens of the request the compactor lays out (prefix, summary, pins, recent messages)."""
+    summary = compactor.summary_message()
+    return (PREFIX_TOKENS + (message_tokens(summary) if summary else 0)
+            + sum(message_tokens(history[index]) for index in compactor.pinned)
+            + sum(message_tokens(msg) for msg in history[compactor.boundary:]))
+
+
+def test_no_budget_sends_everything():
+    history = _history(20)
+    compactor = ConversationCompactor(budget=0)
+    assert not compactor.layout(PREFIX_TOKENS, history, _full_tokens(history))
+
+
+def test_history_within_the_budget_is_sent_as_is():
+    history = _history(2)
+    compactor = ConversationCompactor(budget=_full_tokens(history))
+    assert not compactor.layout(PREFIX_TOKENS, history, _full_tokens(history))
+    assert compactor.boundary == 0
+
+
+def test_boundary_moves_until_the_request_fits():
+    history = _history(12)
+    budget = _full_tokens(history) // 3
+    compactor = ConversationCompactor(budget=budget)
+    assert compactor.layout(PREFIX_TOKENS, history, _full_tokens(history))
+    assert compactor.boundary > 0
+    assert _request_tokens(compactor, history) <= budget
+    assert compactor.summary_message()["content"].startswith(compaction.SUMMARY_HEADER)
+
+
+def test_recent_messages_are_always_sent():
+    history = _history(12)
+    compactor = ConversationCompactor(budget=1)
+    compactor.layout(PREFIX_TOKENS, history, _full_tokens(history))
+    assert len(history) - compactor.boundary == compaction.MIN_RECENT_MESSAGES
+
+
+def test_boundary_only_moves_forward_as_history_grows():
+    history = _history(30)
+    compactor = ConversationCompactor(budget=_full_tokens(history[:24]) // 2)
+    boundaries = []
+    for length in range(4, len(history) + 1, 2):
+        compactor.layout(PREFIX_TOKENS, history[:length], _full_tokens(history[:length]))
+        boundaries.append(compactor.boundary)
+        assert _request_tokens(compactor, history[:length]) <= compactor.budget
+    assert boundaries == sorted(boundaries)
+    assert boundaries[-1] > 0
+
+
+def test_objectives_are_pinned_verbatim():
+    history = _history(12, pinned_every=4)
+    compactor = ConversationCompactor(budget=_full_tokens(history) // 2)
+    compactor.layout(PREFIX_TOKENS, history, _full_tokens(history))
+    assert compactor.pinned
+    assert all(is_pinned(history[index]) and index < compactor.boundary for index in compactor.pinned)
+    summary = compactor.summary_message()["content"]
+    for index in compactor.pinned:
+        assert history[index]["content"][:40] not in summary
+
+
+def test_pins_past_their_share_are_summarized_oldest_first():
+    history = _history(24, pinned_every=1)
+    budget = _full_tokens(history) // 4
+    compactor = ConversationCompactor(budget=budget)
+    compactor.layout(PREFIX_TOKENS, history, _full_tokens(history))
+    pinned_tokens = sum(message_tokens(history[index]) for index in compactor.pinned)
+    assert pinned_tokens <= budget * compaction.PINNED_SHARE or len(compactor.pinned) == 1
+    assert compactor.pinned == sorted(compactor.pinned)
+    assert compactor.pinned[0] > 0  # the first objective was summarized instead
+    assert compactor.summary_message() is not None
+
+
+def test_shorter_history_resets():
+    history = _history(12)
+    compactor = ConversationCompactor(budget=_full_tokens(history) // 3)
+    compactor.layout(PREFIX_TOKENS, history, _full_tokens(history))
+    assert compactor.boundary > 4
+
+    fresh = _history(1)
+    assert not compactor.layout(PREFIX_TOKENS, fresh, _full_tokens(fresh))
+    assert compactor.boundary == 0
+    assert compactor.summary_message() is None
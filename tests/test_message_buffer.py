@@ -0,0 +1,97 @@
+"""MessageBuffer requests encode to the same bytes as json.dumps of the plain message list."""
+
+import json
+
+from compaction import ConversationCompactor, message_tokens
+from message_buffer import MessageBuffer, Prefix
+from providers import _grok_body
+
+SYSTEM = {"role": "system", "content": "You are a Partner Solution Architect. Be \"precise\"."}
+START = "Hello, I'm starting the interview."
+
+
+def _history(turns: int):
+    history = []
+    for turn in range(turns):
+        history.append({"role": "user", "content": f"Question {turn}: latency — é, \"quotes\", \\ and\nnewlines"})
+        history.append({"role": "assistant", "content": f"Answer {turn} ✓ " + "detail " * 20})
+    return history
+
+
+def _plain(history, skip=None, before_last=None):
+    messages = [SYSTEM] + [{"role": m["role"], "content": m["content"]} for m in history if m["content"] != skip]
+    if before_last is not None:
+        messages.insert(len(messages) - 1 if len(messages) > 1 else len(messages), before_last)
+    return messages
+
+
+def _build(buffer, history, before_last=None):
+    return buffer.build(history, ConversationCompactor(budget=0), before_last)
+
+
+def test_encoded_matches_json_dumps():
+    history = _history(5)
+    prepared = _build(MessageBuffer(Prefix([SYSTEM])), history)
+    assert prepared.encoded() == json.dumps(_plain(history)).encode('utf-8')
+    assert list(prepared) == _plain(history)
+
+
+def test_request_body_matches_the_plain_list():
+    history = _history(3)
+    prepared = _build(MessageBuffer(Prefix([SYSTEM])), history)
+    for stream in (False, True):
+        generation = {"max_tokens": 2048, "temperature": 0.3}
+        assert _grok_body('grok-2', prepared, stream, generation) == _grok_body('grok-2', _plain(history), stream, generation)
+
+
+def test_appends_are_encoded_incrementally():
+    history = _history(2)
+    buffer = MessageBuffer(Prefix([SYSTEM]))
+    _build(buffer, history)
+    history.extend(_history(3)[4:])
+    assert not buffer.sync(history)
+    assert _build(buffer, history).encoded() == json.dumps(_plain(history)).encode('utf-8')
+
+
+def test_rewritten_history_is_encoded_again():
+    history = _history(3)
+    buffer = MessageBuffer(Prefix([SYSTEM]))
+    _build(buffer, history)
+
+    history[-1] = {"role": "assistant", "content": "A different answer"}
+    assert _build(buffer, history).encoded() == json.dumps(_plain(history)).encode('utf-8')
+    del history[:2]
+    assert _build(buffer, history).encoded() == json.dumps(_plain(history)).encode('utf-8')
+    replaced = _history(1)
+    assert buffer.sync(replaced)
+    assert _build(buffer, replaced).encoded() == json.dumps(_plain(replaced)).encode('utf-8')
+
+
+def test_skipped_messages_are_not_sent():
+    history = [{"role": "user", "content": START}] + _history(2)
+    prepared = _build(MessageBuffer(Prefix([SYSTEM]), skip=START), history)
+    assert prepared.encoded() == json.dumps(_plain(history, skip=START)).encode('utf-8')
+
+
+def test_context_goes_just_before_the_newest_message():
+    context = {"role": "user", "content": "Context: the candidate's objectives"}
+    history = _history(2)
+    prepared = _build(MessageBuffer(Prefix([SYSTEM])), history, context)
+    assert prepared.encoded() == json.dumps(_plain(history, before_last=context)).encode('utf-8')
+    empty = _build(MessageBuffer(Prefix([SYSTEM])), [], context)
+    assert list(empty) == [SYSTEM, context]
+
+
+def test_size_figures_match_the_messages_sent():
+    history = _history(20)
+    buffer = MessageBuffer(Prefix([SYSTEM]))
+    full = _build(buffer, history)
+    assert full.tokens == sum(message_tokens(msg) for msg in full)
+    assert full.chars == sum(len(msg["content"]) for msg in full)
+
+    compactor = ConversationCompactor(budget=full.tokens // 2)
+    compacted = buffer.build(history, compactor)
+    assert compacted.tokens < full.tokens
+    assert compacted.tokens == sum(message_tokens(msg) for msg in compacted)
+    assert compacted.chars == sum(len(msg["content"]) for msg in compacted)
+    assert compacted.encoded() == json.dumps(list(compacted)).encode('utf-8')
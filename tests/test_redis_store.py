@@ -0,0 +1,184 @@
+"""RedisClient and RedisSessionStore against an in-process stand-in speaking RESP2."""
+
+import fnmatch
+import socketserver
+import threading
+import time
+
+import pytest
+
+from agent import InterviewAgent
+from session_store import RELEASE_SCRIPT, RedisClient, RedisError, RedisSessionStore
+
+
+class FakeRedis(socketserver.ThreadingTCPServer):
+    """The commands the client sends, on one dict; anything else gets an error reply."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeRedisHandler)
+        self.data = {}
+        self.expires = {}
+        self.lock = threading.Lock()
+        self.commands = []
+        self.drop_next = False  # close the connection instead of answering the next command
+
+    @property
+    def url(self) -> str:
+        return 'redis://127.0.0.1:%d/0' % self.server_address[1]
+
+    def live(self, key: bytes):
+        if key in self.expires and self.expires[key] <= time.time():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return self.data.get(key)
+
+    def run(self, args):
+        command, args = args[0].upper().decode(), args[1:]
+        self.commands.append(command)
+        if command == 'GET':
+            return self.live(args[0])
+        if command == 'SET':
+            key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+            if b'NX' in options and self.live(key) is not None:
+                return None
+            self.data[key] = value
+            self.expires.pop(key, None)
+            for unit, scale in ((b'EX', 1.0), (b'PX', 0.001)):
+                if unit in options:
+                    self.expires[key] = time.time() + int(options[options.index(unit) + 1]) * scale
+            return 'OK'
+        if command == 'DEL':
+            return sum(self.data.pop(key, None) is not None for key in args)
+        if command == 'EXISTS':
+            return int(self.live(args[0]) is not None)
+        if command == 'SCAN':
+            pattern = args[args.index(b'MATCH') + 1].decode()
+            return [b'0', [key for key in list(self.data) if self.live(key) is not None and fnmatch.fnmatch(key.decode(), pattern)]]
+        if command == 'EVAL' and args[0].decode() == RELEASE_SCRIPT:
+            key, value = args[2], args[3]
+            if self.live(key) == value:
+                del self.data[key]
+                return 1
+            return 0
+        if command == 'LPUSH' and isinstance(self.live(args[0]), bytes):
+            return RedisError('WRONGTYPE Operation against a key holding the wrong kind of value')
+        return RedisError(f"ERR unknown command '{command}'")
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def encode(self, reply) -> bytes:
+        if reply is None:
+            return b'$-1\r\n'
+        if isinstance(reply, RedisError):
+            return b'-%s\r\n' % str(reply).encode()
+        if isinstance(reply, str):
+            return b'+%s\r\n' % reply.encode()
+        if isinstance(reply, int):
+            return b':%d\r\n' % reply
+        if isinstance(reply, bytes):
+            return b'$%d\r\n%s\r\n' % (len(reply), reply)
+        return b'*%d\r\n' % len(reply) + b''.join(self.encode(item) for item in reply)
+
+    def handle(self):
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            with self.server.lock:
+                if self.server.drop_next:
+                    self.server.drop_next = False
+                    return
+                reply = self.server.run(args)
+            self.wfile.write(self.encode(reply))
+
+
+@pytest.fixture
+def redis_server():
+    server = FakeRedis()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def store(redis_server):
+    return RedisSessionStore(redis_server.url, ttl=60)
+
+
+def _agent(session_id: str) -> InterviewAgent:
+    agent = InterviewAgent(session_id)
+    agent.initialize()
+    return agent
+
+
+def test_save_load_delete_len(store):
+    agent = _agent('s1')
+    store.save('s1', agent)
+    store.save('s2', _agent('s2'))
+
+    loaded = store.get('s1')
+    assert loaded.to_dict() == agent.to_dict()
+    assert 's1' in store
+    assert len(store) == 2
+
+    store.delete('s1')
+    assert store.get('s1') is None
+    assert 's1' not in store
+    assert len(store) == 1
+
+
+def test_add_keeps_the_first_agent(store):
+    first = _agent('s1')
+    assert store.add('s1', first) is first
+    second = InterviewAgent('s1')
+    assert store.add('s1', second).to_dict() == first.to_dict()
+
+
+def test_error_reply_raises_and_keeps_the_connection(redis_server, store):
+    with pytest.raises(RedisError, match='unknown command'):
+        store.client.execute('BOGUS')
+    store.save('s1', _agent('s1'))
+    with pytest.raises(RedisError, match='WRONGTYPE'):
+        store.client.execute('LPUSH', store._key('s1'), 'x')
+    # The error reply was read in full, so the next command gets its own reply
+    assert store.get('s1') is not None
+
+
+def test_reconnects_once_after_a_dropped_connection(redis_server):
+    client = RedisClient(redis_server.url)
+    assert client.execute('SET', 'k', 'v') == 'OK'
+    redis_server.drop_next = True
+    assert client.execute('GET', 'k') == b'v'
+
+
+def test_shared_keys(store):
+    assert store.claim_key('lock:s1', 'a', 60)
+    assert not store.claim_key('lock:s1', 'b', 60)
+    assert store.read_key('lock:s1') == 'a'
+
+    store.release_key('lock:s1', 'b')  # not the holder: nothing happens
+    assert store.read_key('lock:s1') == 'a'
+    store.release_key('lock:s1', 'a')
+    assert store.read_key('lock:s1') is None
+
+    store.write_key('idempotency:s1:k', 'done', 60)
+    assert store.read_key('idempotency:s1:k') == 'done'
+    assert store.claim_key('expiring', 'a', 0.01)
+    time.sleep(0.02)
+    assert store.claim_key('expiring', 'b', 60)
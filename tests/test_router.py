@@ -0,0 +1,144 @@
+"""Circuit breakers, fallback and hedging in ModelRouter."""
+
+import asyncio
+
+import pytest
+
+import router
+from router import CLOSED, HALF_OPEN, OPEN, ModelRouter, UpstreamError
+
+
+def _fail(router_: ModelRouter, model: str, times: int = router.BREAKER_FAILURES):
+    for _ in range(times):
+        router_.record_failure(model, 'boom')
+
+
+def test_breaker_opens_after_consecutive_failures():
+    r = ModelRouter(['a', 'b'])
+    _fail(r, 'a', router.BREAKER_FAILURES - 1)
+    assert r._health['a'].state == CLOSED
+    r.record_failure('a', 'boom')
+    assert r._health['a'].state == OPEN
+    assert r.candidates() == ['b']
+
+
+def test_success_resets_the_failure_count():
+    r = ModelRouter(['a'])
+    _fail(r, 'a', router.BREAKER_FAILURES - 1)
+    r.record_success('a', 0.1)
+    _fail(r, 'a', router.BREAKER_FAILURES - 1)
+    assert r._health['a'].state == CLOSED
+
+
+def test_half_open_allows_one_probe(monkeypatch):
+    monkeypatch.setattr(router, 'BREAKER_COOLDOWN', 0.0)
+    r = ModelRouter(['a', 'b'])
+    _fail(r, 'a')
+    assert r.candidates() == ['a', 'b']
+    assert r._health['a'].state == HALF_OPEN
+
+    r._claim('a')
+    assert r.candidates() == ['b']  # the probe is in flight
+    r.record_success('a', 0.1)
+    assert r._health['a'].state == CLOSED
+    assert r.candidates() == ['a', 'b']
+
+
+def test_failed_probe_reopens_the_breaker(monkeypatch):
+    monkeypatch.setattr(router, 'BREAKER_COOLDOWN', 0.0)
+    r = ModelRouter(['a', 'b'])
+    _fail(r, 'a')
+    r.candidates()
+    r._claim('a')
+    r.record_failure('a', 'still down')
+    health = r._health['a']
+    assert health.state == OPEN
+    assert not health.probe_in_flight
+
+
+def test_released_probe_can_be_retried(monkeypatch):
+    monkeypatch.setattr(router, 'BREAKER_COOLDOWN', 0.0)
+    r = ModelRouter(['a', 'b'])
+    _fail(r, 'a')
+    r.candidates()
+    r._claim('a')
+    r.release('a')
+    assert r.candidates() == ['a', 'b']
+
+
+def test_every_breaker_open_still_tries_the_oldest():
+    r = ModelRouter(['a', 'b'])
+    _fail(r, 'b')
+    _fail(r, 'a')
+    assert r.candidates() == ['b']
+
+
+def test_complete_falls_back_to_the_next_model():
+    r = ModelRouter(['a', 'b'], hedge=False)
+    calls = []
+
+    def attempt(model, timeout):
+        calls.append(model)
+        if model == 'a':
+            raise ConnectionError('refused')
+        return 'reply from ' + model
+
+    assert r.complete(attempt) == 'reply from b'
+    assert calls == ['a', 'b']
+    assert r._health['a'].failures == 1
+    assert r._health['b'].successes == 1
+
+
+def test_complete_raises_when_every_model_fails():
+    r = ModelRouter(['a', 'b'], hedge=False)
+
+    def attempt(model, timeout):
+        raise ConnectionError('refused')
+
+    with pytest.raises(UpstreamError, match='b: refused'):
+        r.complete(attempt)
+
+
+def _warm(r: ModelRouter, model: str, latency: float):
+    for _ in range(router.HEDGE_MIN_SAMPLES):
+        r.record_success(model, latency)
+
+
+def test_hedge_wins_and_the_slow_attempt_is_cancelled():
+    r = ModelRouter(['a', 'b'], hedge=True)
+    _warm(r, 'a', 0.01)
+    cancelled = []
+
+    async def attempt(model, timeout):
+        if model == 'a':
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(model)
+                raise
+        return 'reply from ' + model
+
+    async def run():
+        result = await r.complete_async(attempt)
+        await asyncio.sleep(0)  # let the cancellation reach the losing attempt
+        return result
+
+    assert asyncio.run(run()) == 'reply from b'
+    assert cancelled == ['a']
+    stats = r.stats()
+    assert stats['hedges_sent'] == 1
+    assert stats['hedges_won'] == 1
+    # Losing the race says nothing about the model's health
+    assert r._health['a'].failures == 0
+    assert not r._health['a'].probe_in_flight
+
+
+def test_no_hedge_without_latency_samples():
+    r = ModelRouter(['a', 'b'], hedge=True)
+
+    async def attempt(model, timeout):
+        await asyncio.sleep(0.05)
+        return 'reply from ' + model
+
+    assert asyncio.run(r.complete_async(attempt)) == 'reply from a'
+    assert r.stats()['hedges_sent'] == 0
@@ -0,0 +1,47 @@
+"""The usage log is written behind the request path and flushed on close."""
+
+import json
+
+from usage import SALES_MANAGER, UsageTracker
+
+
+def _record(turn: int):
+    return {'agent': SALES_MANAGER, 'model': 'grok-2', 'stage': 'discovery', 'turn': turn,
+            'prompt_tokens': 10, 'completion_tokens': 5, 'payload_bytes': 100}
+
+
+def test_records_reach_the_log_after_close(tmp_path):
+    path = tmp_path / 'usage.jsonl'
+    tracker = UsageTracker(str(path))
+    for turn in range(50):
+        tracker.record(_record(turn))
+    assert tracker.snapshot()['total']['turns'] == 50
+    tracker.close()
+    lines = path.read_text(encoding='utf-8').splitlines()
+    assert [json.loads(line)['turn'] for line in lines] == list(range(50))
+    assert tracker._writer is None
+
+
+def test_full_queue_drops_records(tmp_path):
+    tracker = UsageTracker(str(tmp_path / 'usage.jsonl'), max_queue=0)
+    tracker.record(_record(0))
+    snapshot = tracker.snapshot()
+    assert snapshot['log_dropped'] == 1
+    assert snapshot['total']['turns'] == 1
+
+
+def test_write_errors_are_counted(tmp_path):
+    tracker = UsageTracker(str(tmp_path / 'missing' / 'usage.jsonl'))
+    tracker.record(_record(0))
+    tracker.close()
+    assert tracker.snapshot()['log_errors'] == 1
+
+
+def test_logging_restarts_after_close(tmp_path):
+    path = tmp_path / 'usage.jsonl'
+    tracker = UsageTracker(str(path))
+    tracker.record(_record(0))
+    tracker.close()
+    tracker.record(_record(1))
+    tracker.close()
+    assert len(path.read_text(encoding='utf-8').splitlines()) == 2
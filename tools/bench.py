@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the per-turn hot paths of the agents.
+
+Covers the work done on every chat turn besides the upstream call itself:
+- InterviewAgent.get_response and PartnerSolutionArchitect.get_response in
+  mock mode (no API key), including delegation to the Solution Architect
+- message-list construction and JSON payload serialization at history
+  lengths from 5 to 500 turns (with and without compaction)
+- the Solution Architect context retrieved from the transcript in the
+  delegation branch
+- _get_mock_response keyword routing for both agents
+
+Each benchmark is timed with timeit (auto-ranged loop count, best and
+median of several repeats). Results are written as JSON and compared
+against a stored baseline; the run exits non-zero when a benchmark is
+slower than the baseline's by more than the tolerance. Each repeat is
+paired with a repeat of a fixed pure-Python calibration workload timed
+just before it, and benchmarks are compared by the median of those
+paired ratios, so a baseline recorded on one machine stays usable on
+another, and neither a uniformly slower host nor one that gets busier
+partway through a run reads as a regression. (A single calibration per
+run, and comparing best times, let microsecond benchmarks such as the
+Solution Architect context drift 30-50% between runs of unchanged code.)
+
+Examples:
+    python tools/bench.py                                   # compare with tools/bench_baseline.json
+    python tools/bench.py --filter build_messages --json results.json
+    python tools/bench.py --save-baseline                   # record a new baseline on this machine
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import timeit
+from typing import Callable, Dict, List, Optional, Tuple
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'src'))
+
+from agent import InterviewAgent, PartnerSolutionArchitect
+from compaction import ConversationCompactor
+from providers import Provider, _grok_body
+from stages import StageMachine
+
+DEFAULT_BASELINE = os.path.join(PROJECT_ROOT, 'tools', 'bench_baseline.json')
+HISTORY_TURNS = (5, 50, 500)
+COMPACTION_BUDGET = 4000  # tokens, for the compacted message-list variants
+MODEL = 'grok-2-1212'
+
+# Representative message sizes: short candidate turns, longer agent replies
+USER_TURN = ("For Figma I'd focus on their AI roadmap and Dev Mode adoption - how would Claude's latency and "
+             "reliability hold up for real-time design-to-code? ") * 2
+ASSISTANT_TURN = ("Good thinking. Vijay's team cares about latency, reliability and developer experience, so tie each "
+                  "claim to a concrete Figma workflow and back it with numbers where you can. ") * 6
+
+SA_QUESTIONS = [
+    "How does Claude's latency compare for real-time features?",
+    "How does Claude compare to GPT-4 for design-to-code?",
+    "What safety and data privacy guarantees can we offer?",
+    "Can Claude understand a design system?",
+    "What else should I know?",
+]
+# (stage, candidate message) pairs exercising each branch of the Sales Manager mock
+SM_MESSAGES: List[Tuple[str, str]] = [
+    ('objectives', "Figma's objectives are AI features and Dev Mode adoption."),
+    ('objectives', "Hi"),
+    ('information_sources', "I'd ask the solutions team."),
+    ('draft_email', "Subject: Claude for Figma\n\nHi Vijay, ..."),
+    ('revise_email', "Subject: Faster AI for Figma\n\nHi Vijay, ..."),
+    ('cto_follow_up', "I'd propose a pilot on design-to-code."),
+    ('follow_ups', "Could you score my performance now?"),
+    ('scoring', "Thanks!"),
+]
+
+
+def make_history(turns: int) -> List[Dict]:
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"{USER_TURN} ({i})"})
+        history.append({"role": "assistant", "content": f"{ASSISTANT_TURN} ({i})"})
+    return history
+
+
+def make_interview_agent(turns: int = 0, stage: str = 'objectives') -> InterviewAgent:
+    agent = InterviewAgent('bench')
+    agent.provider = agent.solution_architect.provider = Provider()  # mock replies
+    agent.initialized = True
+    agent.conversation_history = [{"role": "user", "content": "Start the interview simulation."}] + make_history(turns)
+    agent.stages = StageMachine(stage)
+    return agent
+
+
+def make_solution_architect(turns: int = 0) -> PartnerSolutionArchitect:
+    agent = PartnerSolutionArchitect('bench')
+    agent.provider = Provider()
+    agent.conversation_history = make_history(turns)
+    return agent
+
+
+def bench_interview_get_response() -> Callable[[], None]:
+    """One mock Sales Manager turn in the objectives stage (history and stage reset each call)."""
+    agent = make_interview_agent(5)
+    base = len(agent.conversation_history)
+    message = SM_MESSAGES[0][1]
+
+    def run():
+        del agent.conversation_history[base:]
+        agent.stages.stage, agent.stages.turns = 'objectives', 0
+        agent.get_response(message)
+    return run
+
+
+def bench_interview_get_response_delegated() -> Callable[[], None]:
+    """One mock turn answered by the Solution Architect (context building + SA mock)."""
+    agent = make_interview_agent(5, 'solution_architect')
+    base = len(agent.conversation_history)
+    message = SA_QUESTIONS[0]
+
+    def run():
+        del agent.conversation_history[base:]
+        del agent.solution_architect.conversation_history[:]
+        agent.stages.turns = 0
+        agent.get_response(message)
+    return run
+
+
+def bench_sa_get_response() -> Callable[[], None]:
+    """Mock Solution Architect answers, cycling through the keyword routes."""
+    agent = make_solution_architect()
+    questions = SA_QUESTIONS
+
+    def run():
+        del agent.conversation_history[:]
+        for question in questions:
+            agent.get_response(question)
+    return run
+
+
+def bench_build_messages(turns: int, budget: int = 0) -> Callable[[], None]:
+    agent = make_interview_agent(turns)
+    agent.compactor = ConversationCompactor(budget)
+    return agent._build_messages
+
+
+def bench_sa_build_messages(turns: int) -> Callable[[], None]:
+    agent = make_solution_architect(turns)
+    context = make_interview_agent(turns)._solution_architect_context(SA_QUESTIONS[0])
+    return lambda: agent._build_messages(context)
+
+
+def bench_serialize(turns: int) -> Callable[[], None]:
+    agent = make_interview_agent(turns)
+    messages = agent._build_messages()
+    generation = agent.stages.current.generation()
+    return lambda: _grok_body(MODEL, messages, generation=generation)
+
+
+def bench_sa_context(turns: int) -> Callable[[], None]:
+    """Transcript retrieval for a Solution Architect question (the index is built by the first call)."""
+    agent = make_interview_agent(turns, 'solution_architect')
+    return lambda: agent._solution_architect_context(SA_QUESTIONS[0])
+
+
+def bench_sm_mock_routing() -> Callable[[], None]:
+    """Sales Manager mock reply selection for every stage/branch (no stage transitions applied)."""
+    agent = make_interview_agent()
+    machines = [(StageMachine(stage), message) for stage, message in SM_MESSAGES]
+
+    def run():
+        for machine, message in machines:
+            agent.stages = machine
+            agent._mock_response_for_stage(message)
+    return run
+
+
+def bench_sa_mock_routing() -> Callable[[], None]:
+    agent = make_solution_architect()
+
+    def run():
+        for question in SA_QUESTIONS:
+            agent._get_mock_response(question)
+    return run
+
+
+def benchmarks() -> Dict[str, Callable[[], Callable[[], None]]]:
+    """Benchmark name -> factory returning the callable to time."""
+    suite = {
+        'interview.get_response[mock]': bench_interview_get_response,
+        'interview.get_response[mock,delegated]': bench_interview_get_response_delegated,
+        'solution_architect.get_response[mock,x5]': bench_sa_get_response,
+        'interview.mock_routing[x8]': bench_sm_mock_routing,
+        'solution_architect.mock_routing[x5]': bench_sa_mock_routing,
+    }
+    for turns in HISTORY_TURNS:
+        suite[f'interview.build_messages[turns={turns}]'] = lambda t=turns: bench_build_messages(t)
+        suite[f'interview.build_messages[turns={turns},budget={COMPACTION_BUDGET}]'] = \
+            lambda t=turns: bench_build_messages(t, COMPACTION_BUDGET)
+        suite[f'solution_architect.build_messages[turns={turns}]'] = lambda t=turns: bench_sa_build_messages(t)
+        suite[f'payload.serialize[turns={turns}]'] = lambda t=turns: bench_serialize(t)
+        suite[f'interview.sa_context[turns={turns}]'] = lambda t=turns: bench_sa_context(t)
+    return suite
+
+
+def calibration() -> Callable[[], None]:
+    """Fixed pure-Python workload (dict building, string ops, JSON) used to normalize results."""
+    words = ASSISTANT_TURN.split()
+
+    def run():
+        rows = [{"index": i, "word": word.lower(), "size": len(word)} for i, word in enumerate(words)]
+        json.dumps(rows)
+    return run
+
+
+def loop_count(timer: timeit.Timer, min_time: float) -> int:
+    """Loops per repeat for timer to take at least min_time seconds."""
+    number = 1
+    while True:
+        if timer.timeit(number) >= min_time:
+            return number
+        number *= 2 if number < 1000 else 10
+
+
+def run_benchmark(fn: Callable[[], None], repeat: int, min_time: float,
+                  reference: Optional[Callable[[], None]] = None) -> Dict:
+    """Time fn with an auto-ranged loop count; per-call times in microseconds.
+
+    With a reference workload, each repeat of fn is paired with a repeat of
+    the reference timed just before it, and calibrated is the median of the
+    paired ratios: a host that slows down or speeds up during the run then
+    shifts both sides of a pair, rather than only the benchmarks that
+    happened to run at the time, and one disturbed pair does not move it.
+    """
+    timer = timeit.Timer(fn)
+    number = loop_count(timer, min_time)
+    samples, reference_samples = [], []
+    if reference is not None:
+        reference_timer = timeit.Timer(reference)
+        reference_number = loop_count(reference_timer, min_time)
+    for _ in range(repeat):
+        if reference is not None:
+            reference_samples.append(reference_timer.timeit(reference_number) / reference_number * 1e6)
+        samples.append(timer.timeit(number) / number * 1e6)
+    result = {
+        "median_us": round(statistics.median(samples), 3),
+        "min_us": round(min(samples), 3),
+        "max_us": round(max(samples), 3),
+        "loops": number,
+        "repeat": repeat,
+    }
+    if reference_samples:
+        result["calibration_us"] = round(min(reference_samples), 3)
+        # Each repeat over the reference repeat just before it, as a number of calibration workloads
+        result["calibrated"] = round(statistics.median(t / r for t, r in zip(samples, reference_samples)), 5)
+    return result
+
+
+def compare(results: Dict, calibration_us: float, baseline: Dict) -> None:
+    """Add each benchmark's baseline time and calibration-normalized ratio to it (in place).
+
+    The ratio is that of the median paired (calibrated) times where both
+    runs have them; older baselines are compared by best time over the
+    run-wide calibration.
+    """
+    scale = baseline["meta"]["calibration_us"] / calibration_us if baseline["meta"].get("calibration_us") else 1.0
+    for name, result in results.items():
+        reference = baseline["results"].get(name)
+        if not reference or not reference.get("min_us"):
+            result["baseline_min_us"] = None
+            continue
+        if result.get("calibrated") and reference.get("calibrated"):
+            ratio = result["calibrated"] / reference["calibrated"]
+        else:
+            ratio = result["min_us"] * scale / reference["min_us"]
+        result["baseline_min_us"] = reference["min_us"]
+        result["ratio"] = round(ratio, 3)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for the agent hot paths.')
+    parser.add_argument('--filter', default=None, help='only run benchmarks whose name contains this')
+    parser.add_argument('--repeat', type=int, default=9, help='timing repeats per benchmark (default: 9)')
+    parser.add_argument('--min-time', type=float, default=0.05, help='minimum seconds per repeat (default: 0.05)')
+    parser.add_argument('--json', metavar='PATH', help='write results as JSON')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline JSON to compare with (default: %(default)s)')
+    parser.add_argument('--save-baseline', action='store_true', help='write the results to the baseline file instead of comparing')
+    parser.add_argument('--tolerance', type=float, default=0.4,
+                        help='allowed slowdown vs the baseline before failing (default: 0.4 = 40%%)')
+    args = parser.parse_args()
+
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    reference = calibration()
+    calibration_us = run_benchmark(reference, args.repeat, args.min_time)["min_us"]
+    results = {}
+    for name, factory in benchmarks().items():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = run_benchmark(factory(), args.repeat, args.min_time, reference)
+
+    if baseline:
+        compare(results, calibration_us, baseline)
+    regressions = [name for name, result in results.items() if result.get("ratio", 0) > 1 + args.tolerance]
+
+    print(f"{'benchmark':<58}{'median us':>12}{'min us':>12}{'base min':>12}{'ratio':>8}")
+    for name, result in results.items():
+        reference = result.get("baseline_min_us")
+        ratio = result.get("ratio")
+        flag = '  REGRESSION' if name in regressions else ''
+        print(f"{name:<58}{result['median_us']:>12.2f}{result['min_us']:>12.2f}"
+              f"{reference if reference is not None else '-':>12}{ratio if ratio is not None else '-':>8}{flag}")
+
+    report = {
+        "meta": {
+            "timestamp": round(time.time()),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "calibration_us": calibration_us,
+        },
+        "results": results,
+    }
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\nBaseline written to {args.baseline}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(dict(report, regressions=regressions, tolerance=args.tolerance), f, indent=2)
+
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) slower than the baseline by more than {args.tolerance:.0%}:")
+        for name in regressions:
+            print(f"  {name}: {results[name]['ratio']}x")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Grok chat/completions API, for offline load tests.
+
+Speaks enough of the protocol for the agents: JSON completions with a
+`usage` block, and Server-Sent Events streaming (with the usage chunk
+when `stream_options.include_usage` is set). Latency, error rate and
+reply size are configurable, so runs can reproduce a slow or flaky
+upstream without touching the network.
+
+Replies follow the simulation's scripted hand-offs (asking where the
+candidate would get information, connecting them with Alex Chen, giving
+ratings) when the candidate's message calls for them, so a load-test
+driver can walk interviews through every stage.
+
+Run with:
+    python tools/grok_stub.py --port 9100 --latency lognormal:0.8,0.5 --error-rate 0.01
+then start the app with GROK_API_URL=http://127.0.0.1:9100/v1/chat/completions
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'src'))
+
+from providers import parse_latency  # the same latency specs as ACE_REPLAY_LATENCY
+
+# Scripted replies keyed by words in the candidate's last message (first match wins)
+SCRIPTED_REPLIES: List[Tuple[Tuple[str, ...], str]] = [
+    (('objective',), "Solid research. To make the email land, you'll need specifics on latency and reliability. "
+                     "Where would you get that information if you were at Anthropic?"),
+    (('solutions team', 'solution architect', 'internal docs', "i'd ask", 'i would ask'),
+     "Good thinking! Let me connect you with Alex Chen, a Partner Solution Architect at Anthropic who can help you "
+     "get that information."),
+    (('score', 'scorecard', 'how did i do'),
+     "Here is your scorecard. Outbound email quality: 4/5. Personalization & research: 4/5. "
+     "Product/AI/Claude value articulation: 3/5. Objection handling: 4/5. Creativity & GTM instincts: 4/5. "
+     "Alignment with Anthropic's values: 5/5."),
+]
+FILLER = ("Thanks, that's helpful. Let's keep going and dig into what would matter most to Vijay and the Figma "
+          "engineering team, with attention to latency, reliability, safety and developer experience.")
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, (len(text) + 3) // 4)
+
+
+def pick_reply(messages: List[Dict], reply_words: int) -> str:
+    """Choose a reply for the last candidate message, padded to roughly reply_words words."""
+    last_user = next((msg.get('content', '') for msg in reversed(messages) if msg.get('role') == 'user'), '')
+    last_lower = last_user.lower()
+    reply = FILLER
+    for markers, scripted in SCRIPTED_REPLIES:
+        if any(marker in last_lower for marker in markers):
+            reply = scripted
+            break
+    words = reply.split(' ')
+    while len(words) < reply_words:
+        words.extend(FILLER.split(' '))
+    return ' '.join(words[:max(reply_words, len(reply.split(' ')))])
+
+
+class StubStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.streamed = 0
+        self.errors = 0
+
+    def record(self, streamed: bool, error: bool):
+        with self._lock:
+            self.requests += 1
+            self.streamed += 1 if streamed else 0
+            self.errors += 1 if error else 0
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {"requests": self.requests, "streamed": self.streamed, "errors": self.errors}
+
+
+class StubConfig:
+    def __init__(self, latency: Callable[[], float], error_rate: float = 0.0, error_status: int = 500,
+                 reply_words: int = 120, tokens_per_second: float = 80.0, chunk_words: int = 3):
+        self.latency = latency  # time to first byte
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.reply_words = reply_words
+        self.tokens_per_second = tokens_per_second  # streaming pace after the first byte
+        self.chunk_words = chunk_words
+        self.stats = StubStats()
+
+
+def make_handler(config: StubConfig):
+    class GrokStubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body go out in separate writes; without this, Nagle + delayed ACK add ~40 ms per reply
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            # Stub counters, handy when checking a load-test run
+            self._send_json(200, config.stats.snapshot())
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                request = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                return self._send_json(400, {"error": "invalid JSON"})
+
+            stream = bool(request.get('stream'))
+            time.sleep(config.latency())
+            if config.error_rate and random.random() < config.error_rate:
+                config.stats.record(stream, error=True)
+                return self._send_json(config.error_status, {"error": {"message": "stub: injected upstream error"}})
+
+            messages = request.get('messages', [])
+            reply = pick_reply(messages, config.reply_words)
+            usage = {
+                "prompt_tokens": sum(estimate_tokens(msg.get('content', '')) for msg in messages),
+                "completion_tokens": estimate_tokens(reply),
+            }
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            config.stats.record(stream, error=False)
+
+            if not stream:
+                return self._send_json(200, {
+                    "id": "stub-completion",
+                    "object": "chat.completion",
+                    "model": request.get('model'),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                    "usage": usage,
+                })
+            include_usage = bool((request.get('stream_options') or {}).get('include_usage'))
+            self._stream(request.get('model'), reply, usage if include_usage else None)
+
+        def _send_json(self, status: int, body: Dict):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _write_chunk(self, data: bytes):
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            self.wfile.flush()
+
+        def _stream(self, model: Optional[str], reply: str, usage: Optional[Dict]):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            words = reply.split(' ')
+            for i in range(0, len(words), config.chunk_words):
+                text = ' '.join(words[i:i + config.chunk_words])
+                if i + config.chunk_words < len(words):
+                    text += ' '
+                event = {"model": model, "choices": [{"index": 0, "delta": {"content": text}}]}
+                self._write_chunk(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+                if config.tokens_per_second > 0:
+                    time.sleep(estimate_tokens(text) / config.tokens_per_second)
+            if usage is not None:
+                self._write_chunk(f"data: {json.dumps({'model': model, 'choices': [], 'usage': usage})}\n\n".encode('utf-8'))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b'0\r\n\r\n')
+            self.wfile.flush()
+
+    return GrokStubHandler
+
+
+def create_server(host: str = '127.0.0.1', port: int = 9100, config: Optional[StubConfig] = None) -> ThreadingHTTPServer:
+    """Build (but do not start) a stub server; port 0 picks a free port."""
+    server = ThreadingHTTPServer((host, port), make_handler(config or StubConfig(parse_latency('fixed:0.5'))))
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    return server
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Stub options (shared with the load-test driver, which can start a stub itself)."""
+    parser.add_argument('--latency', default='lognormal:0.8,0.4',
+                        help='time to first byte: fixed:S, uniform:LOW,HIGH, normal:MEAN,SD, lognormal:MEDIAN,SIGMA '
+                             'or exponential:MEAN (default: %(default)s)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests failing (default: 0)')
+    parser.add_argument('--error-status', type=int, default=500, help='HTTP status of injected errors (default: 500)')
+    parser.add_argument('--reply-words', type=int, default=120, help='approximate words per reply (default: 120)')
+    parser.add_argument('--tokens-per-second', type=float, default=80.0,
+                        help='streaming pace after the first byte, 0 = no delay (default: 80)')
+
+
+def config_from_args(args) -> StubConfig:
+    return StubConfig(
+        latency=parse_latency(args.latency),
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        reply_words=args.reply_words,
+        tokens_per_second=args.tokens_per_second,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the Grok chat/completions API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port, config_from_args(args))
+    print(f"Grok stub listening on http://{args.host}:{server.server_address[1]}/v1/chat/completions")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Offline load test: N simulated candidates walk the full interview flow.
+
+Each candidate opens /interview, calls /api/chat/init and then sends a
+scripted conversation through /api/chat (or /api/chat/stream) that moves
+through every stage: objectives, information sources, the Solution
+Architect, draft, revision, the CTO follow-up and follow-ups. Latency is
+reported per stage (the stage the candidate was in when sending) with
+p50/p95/p99, along with overall throughput and errors.
+
+By default the driver starts everything it needs locally: a Grok stand-in
+(tools/grok_stub.py) and the app in a subprocess pointed at it, so the
+run needs no network access and no API key. Thresholds make it usable as
+a deploy gate (non-zero exit status when exceeded).
+
+Examples:
+    python tools/loadtest.py --candidates 50 --concurrency 50
+    python tools/loadtest.py --server asgi --stream --latency lognormal:1.2,0.5 --error-rate 0.02
+    python tools/loadtest.py --base-url http://127.0.0.1:8080 --no-stub   # an app that is already running
+    python tools/loadtest.py --max-p95 3 --max-error-rate 0.01 --json report.json
+"""
+
+import argparse
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(TOOLS_DIR)
+sys.path.insert(0, TOOLS_DIR)
+
+import grok_stub
+
+# The candidate's side of an interview, one message per turn
+SCRIPT: List[str] = [
+    "Figma's top 2 business objectives: 1) ship AI features across the design platform (Figma AI, Make) and "
+    "2) grow Dev Mode adoption with engineering teams. Sources: Config 2024 keynote, Figma engineering blog, "
+    "the Q3 shareholder letter. Both map to Claude's reliability and code quality.",
+    "I'd ask the solutions team and read internal docs on Claude's latency and enterprise deployments.",
+    "How does Claude's latency compare for real-time design features?",
+    "What safety and data privacy guarantees can we offer Figma?",
+    "How does Claude compare to GPT-4 for design-to-code?",
+    "Thanks, I'm ready to draft the email now.",
+    "Subject: Claude for Figma's AI roadmap\n\nHi Vijay, Figma is shipping AI across the design platform and "
+    "growing Dev Mode. Claude gives your team low-latency, reliable design-to-code and spec summarization with "
+    "zero data retention. Open to a 15-minute intro call next week?",
+    "Subject: Faster, safer AI for Figma\n\nHi Vijay, as Figma scales Figma AI and Dev Mode, Claude delivers "
+    "sub-second design-to-code and handoff summaries with enterprise-grade privacy. Teams like yours use it to "
+    "ship AI features faster. Worth a 15-minute call next week?",
+    "Happy to. I'd propose a 30-minute call with your VP of Engineering to walk through a design-to-code pilot.",
+    "For ROI: fewer handoff cycles and faster spec generation - I'd bring a benchmark on their own components.",
+    "On latency guarantees, we'd agree on targets in the pilot and share our reliability numbers.",
+    "Could you score my performance now?",
+]
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an unsorted sample list."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class Results:
+    """Latencies per stage and error counts, shared by all candidate threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.fallbacks = 0
+        self.completed = 0
+        self.failed = 0
+        self.final_stages: Dict[str, int] = {}
+
+    def record(self, stage: str, seconds: float, ok: bool, fallback: bool = False):
+        with self._lock:
+            self.latencies.setdefault(stage, []).append(seconds)
+            if not ok:
+                self.errors[stage] = self.errors.get(stage, 0) + 1
+            if fallback:
+                self.fallbacks += 1
+
+    def finish(self, ok: bool, stage: Optional[str]):
+        with self._lock:
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+            if stage:
+                self.final_stages[stage] = self.final_stages.get(stage, 0) + 1
+
+    def report(self, wall_seconds: float) -> Dict:
+        with self._lock:
+            requests_total = sum(len(v) for v in self.latencies.values())
+            errors_total = sum(self.errors.values())
+            stages = {}
+            for stage, samples in self.latencies.items():
+                stages[stage] = {
+                    "requests": len(samples),
+                    "errors": self.errors.get(stage, 0),
+                    "p50_ms": round(percentile(samples, 50) * 1000, 1),
+                    "p95_ms": round(percentile(samples, 95) * 1000, 1),
+                    "p99_ms": round(percentile(samples, 99) * 1000, 1),
+                    "max_ms": round(max(samples) * 1000, 1),
+                }
+            chat_samples = [s for stage, v in self.latencies.items() if stage not in ('interview_page', 'init') for s in v]
+            return {
+                "wall_seconds": round(wall_seconds, 3),
+                "candidates_completed": self.completed,
+                "candidates_failed": self.failed,
+                "requests": requests_total,
+                "errors": errors_total,
+                "error_rate": round(errors_total / requests_total, 4) if requests_total else 0.0,
+                "fallback_replies": self.fallbacks,
+                "throughput_rps": round(requests_total / wall_seconds, 2) if wall_seconds else 0.0,
+                "interviews_per_minute": round(self.completed / wall_seconds * 60, 2) if wall_seconds else 0.0,
+                "chat_p50_ms": round(percentile(chat_samples, 50) * 1000, 1),
+                "chat_p95_ms": round(percentile(chat_samples, 95) * 1000, 1),
+                "chat_p99_ms": round(percentile(chat_samples, 99) * 1000, 1),
+                "final_stages": dict(self.final_stages),
+                "stages": stages,
+            }
+
+
+def _post_chat(session: requests.Session, base_url: str, message: str, stream: bool, timeout: float) -> Tuple[bool, Dict]:
+    """Send one turn; returns (ok, body) where body has message/stage as /api/chat would."""
+    if not stream:
+        response = session.post(f"{base_url}/api/chat", json={'message': message}, timeout=timeout)
+        if response.status_code != 200:
+            return False, {}
+        return True, response.json()
+
+    body = {'message': ''}
+    with session.post(f"{base_url}/api/chat/stream", json={'message': message}, timeout=timeout, stream=True) as response:
+        if response.status_code != 200:
+            return False, {}
+        response.encoding = 'utf-8'
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith('event:'):
+                event = line[len('event:'):].strip()
+            elif line.startswith('data:'):
+                data = json.loads(line[len('data:'):])
+                if event == 'delta':
+                    body['message'] += data.get('text', '')
+                elif event == 'done':
+                    body.update(data)
+                elif event == 'error':
+                    return False, body
+    return 'stage' in body, body
+
+
+def run_candidate(index: int, args, results: Results):
+    """Walk one simulated candidate through the whole interview."""
+    base_url = args.base_url.rstrip('/')
+    session = requests.Session()
+    stage = None
+    try:
+        start = time.perf_counter()
+        response = session.post(f"{base_url}/interview", data={'name': f'Load Test {index}'}, timeout=args.timeout)
+        results.record('interview_page', time.perf_counter() - start, response.status_code == 200)
+        if response.status_code != 200:
+            return results.finish(False, stage)
+
+        start = time.perf_counter()
+        response = session.post(f"{base_url}/api/chat/init", json={}, timeout=args.timeout)
+        results.record('init', time.perf_counter() - start, response.status_code == 200)
+        if response.status_code != 200:
+            return results.finish(False, stage)
+        stage = response.json().get('stage', 'objectives')
+
+        for message in SCRIPT:
+            if args.think_time:
+                time.sleep(args.think_time)
+            start = time.perf_counter()
+            try:
+                ok, body = _post_chat(session, base_url, message, args.stream, args.timeout)
+            except (requests.RequestException, ValueError):
+                ok, body = False, {}
+            fallback = 'Using fallback response' in body.get('message', '')
+            results.record(stage, time.perf_counter() - start, ok, fallback)
+            if not ok:
+                return results.finish(False, stage)
+            stage = body.get('stage', stage)
+        results.finish(True, stage)
+    except requests.RequestException:
+        results.finish(False, stage)
+    finally:
+        session.close()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not come up within {timeout:.0f}s")
+
+
+def start_app(server: str, port: int, grok_url: str) -> subprocess.Popen:
+    """Start the app in a subprocess, pointed at the local Grok stand-in."""
+    env = dict(os.environ)
+    env.update({'GROK_API_URL': grok_url, 'GROK_API_KEY': env.get('LOADTEST_API_KEY', 'loadtest')})
+    if server == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--app-dir', 'src', '--host', '127.0.0.1',
+                   '--port', str(port), '--log-level', 'warning']
+    else:
+        # The threaded Werkzeug server main.py uses, without the debugger and reloader
+        command = [sys.executable, '-c',
+                   'import sys; sys.path.insert(0, "src"); '
+                   'from werkzeug.serving import run_simple; from main import app; '
+                   f'run_simple("127.0.0.1", {port}, app, threaded=True)']
+    return subprocess.Popen(command, cwd=PROJECT_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def print_report(report: Dict):
+    print(f"\nCandidates: {report['candidates_completed']} completed, {report['candidates_failed']} failed "
+          f"in {report['wall_seconds']:.1f}s")
+    print(f"Requests:   {report['requests']} ({report['throughput_rps']} req/s, "
+          f"{report['interviews_per_minute']} interviews/min), errors {report['errors']} "
+          f"({report['error_rate'] * 100:.2f}%), fallback replies {report['fallback_replies']}")
+    print(f"Chat turns: p50 {report['chat_p50_ms']} ms, p95 {report['chat_p95_ms']} ms, p99 {report['chat_p99_ms']} ms\n")
+    print(f"{'stage':<22}{'requests':>9}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage, stats in report['stages'].items():
+        print(f"{stage:<22}{stats['requests']:>9}{stats['errors']:>8}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+              f"{stats['p99_ms']:>10}{stats['max_ms']:>10}")
+    print(f"\nFinal stages: {report['final_stages']}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Run simulated candidates through the interview flow and report latency.')
+    parser.add_argument('--candidates', type=int, default=20, help='simulated candidates (default: 20)')
+    parser.add_argument('--concurrency', type=int, default=None, help='candidates in flight at once (default: all)')
+    parser.add_argument('--think-time', type=float, default=0.0, help='seconds between a reply and the next message')
+    parser.add_argument('--stream', action='store_true', help='use /api/chat/stream instead of /api/chat')
+    parser.add_argument('--timeout', type=float, default=120.0, help='per-request timeout in seconds')
+    parser.add_argument('--base-url', default=None, help='app to test (default: start one locally)')
+    parser.add_argument('--server', choices=('flask', 'asgi'), default='flask', help='app server to start locally')
+    parser.add_argument('--no-stub', action='store_true', help='do not start the Grok stand-in (app is already configured)')
+    parser.add_argument('--json', metavar='PATH', help='also write the report as JSON')
+    parser.add_argument('--max-p95', type=float, default=None, help='fail if chat p95 exceeds this many seconds')
+    parser.add_argument('--max-error-rate', type=float, default=None, help='fail if the error rate exceeds this fraction')
+    grok_stub.add_arguments(parser)
+    args = parser.parse_args()
+
+    stub = app = None
+    try:
+        if not args.no_stub:
+            stub = grok_stub.create_server('127.0.0.1', 0, grok_stub.config_from_args(args))
+            threading.Thread(target=stub.serve_forever, daemon=True).start()
+            grok_url = f"http://127.0.0.1:{stub.server_address[1]}/v1/chat/completions"
+            print(f"Grok stand-in at {grok_url} (latency {args.latency}, error rate {args.error_rate})")
+        if args.base_url is None:
+            if stub is None:
+                parser.error('--no-stub needs --base-url')
+            port = _free_port()
+            app = start_app(args.server, port, grok_url)
+            args.base_url = f"http://127.0.0.1:{port}"
+            _wait_for(args.base_url + '/')
+            print(f"App ({args.server}) at {args.base_url}")
+
+        results = Results()
+        concurrency = args.concurrency or args.candidates
+        print(f"Running {args.candidates} candidates, {concurrency} at a time...")
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for i in range(args.candidates):
+                executor.submit(run_candidate, i, args, results)
+        report = results.report(time.perf_counter() - start)
+    finally:
+        if app is not None:
+            app.terminate()
+            try:
+                app.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                app.kill()
+        if stub is not None:
+            stub.shutdown()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    failures = []
+    if args.max_p95 is not None and report['chat_p95_ms'] > args.max_p95 * 1000:
+        failures.append(f"chat p95 {report['chat_p95_ms']} ms > {args.max_p95 * 1000:.0f} ms")
+    if args.max_error_rate is not None and report['error_rate'] > args.max_error_rate:
+        failures.append(f"error rate {report['error_rate']} > {args.max_error_rate}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Replay a corpus of candidate transcripts and collect step-11 rubric scores.
+
+Each input line is one interview as JSON:
+    {"id": "cand-001", "messages": ["candidate message", ...]}
+where messages may also be {"role": ..., "content": ...} objects, of
+which only the candidate's ("user"/"candidate") turns are replayed. Every
+transcript gets a fresh InterviewAgent that answers the candidate's
+messages in order through the normal stage machine; if the interview has
+not produced a full scorecard by the end, the Sales Manager is moved to
+the scoring stage and asked for one. The ratings are parsed from the
+reply (scoring.parse_scores).
+
+Transcripts run concurrently on asyncio with at most --concurrency
+interviews (and so upstream calls) in flight. Each result is appended to
+the output JSONL as soon as it is done, so a run can be interrupted and
+resumed: transcripts already in the output are skipped (errors are
+retried with --retry-failed).
+
+Needs GROK_API_KEY (or GROK_API_URL pointing at tools/grok_stub.py), or
+ACE_PROVIDER=replay with a cassette recorded by an earlier
+ACE_PROVIDER=record run; the mock responses have no scorecard, so mock
+replays come out "unscored".
+
+Examples:
+    python tools/replay.py transcripts.jsonl -o scores.jsonl --concurrency 16
+    python tools/replay.py transcripts.jsonl -o scores.jsonl --retry-failed   # resume, redoing errors
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Dict, Iterator, List, Set, Tuple
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'src'))
+
+from dotenv import load_dotenv
+
+load_dotenv(os.path.join(PROJECT_ROOT, '.env'))
+
+from agent import InterviewAgent
+from http_client import close_async_http_client
+from scoring import RUBRIC, SCORING_REQUEST, is_complete, parse_scores
+
+CANDIDATE_ROLES = ('user', 'candidate')
+
+
+def read_transcripts(path: str) -> Iterator[Tuple[str, List[str]]]:
+    """Yield (id, candidate messages) for each line of a JSONL corpus."""
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError as e:
+                print(f"{path}:{line_number}: skipping invalid JSON ({str(e)})", file=sys.stderr)
+                continue
+            transcript_id = str(data.get('id') or data.get('session_id') or f"line-{line_number}")
+            messages = []
+            for message in data.get('messages', []):
+                if isinstance(message, str):
+                    messages.append(message)
+                elif isinstance(message, dict) and message.get('role') in CANDIDATE_ROLES and message.get('content'):
+                    messages.append(message['content'])
+            yield transcript_id, messages
+
+
+def completed_ids(path: str, retry_failed: bool) -> Set[str]:
+    """Transcripts that already have a result in the output file."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by an interrupted run
+            if retry_failed and result.get('status') == 'error':
+                continue
+            done.add(result.get('id'))
+    return done
+
+
+async def replay(transcript_id: str, messages: List[str], use_cache: bool) -> Dict:
+    """Run one transcript through a fresh interview and score it."""
+    started = time.monotonic()
+    agent = InterviewAgent(f"replay-{transcript_id}")
+    agent.initialize()
+    reply = ''
+    for message in messages:
+        reply = await agent.get_response_async(message, use_cache)
+
+    scores = parse_scores(reply) if agent.stages.stage == 'scoring' else {}
+    requested = False
+    if not is_complete(scores):
+        agent.stages.transition('scoring')
+        reply = await agent.get_response_async(SCORING_REQUEST, use_cache)
+        scores = parse_scores(reply)
+        requested = True
+
+    usage = agent.usage_summary()['total']
+    return {
+        'id': transcript_id,
+        'status': 'ok' if is_complete(scores) else 'unscored',
+        'scores': scores,
+        'average': round(statistics.mean(scores.values()), 2) if scores else None,
+        'candidate_turns': len(messages),
+        'scorecard_requested': requested,
+        'stages_completed': [entry['stage'] for entry in agent.stages.history],
+        'final_stage': agent.stages.stage,
+        'scorecard': reply,
+        'fallbacks': usage['fallbacks'],
+        'prompt_tokens': usage['prompt_tokens'],
+        'completion_tokens': usage['completion_tokens'],
+        'seconds': round(time.monotonic() - started, 2),
+    }
+
+
+class Summary:
+    """Running totals printed at the end of a run."""
+
+    def __init__(self):
+        self.statuses: Dict[str, int] = {}
+        self.scores: Dict[str, List[float]] = {key: [] for key, _ in RUBRIC}
+
+    def add(self, result: Dict):
+        self.statuses[result['status']] = self.statuses.get(result['status'], 0) + 1
+        for key, value in result.get('scores', {}).items():
+            self.scores[key].append(value)
+
+    def report(self) -> str:
+        lines = [f"Results: {', '.join(f'{status} {count}' for status, count in sorted(self.statuses.items()))}"]
+        for key, values in self.scores.items():
+            if values:
+                spread = statistics.pstdev(values) if len(values) > 1 else 0.0
+                lines.append(f"  {key:<20} mean {statistics.mean(values):.2f}  sd {spread:.2f}  n {len(values)}")
+        return '\n'.join(lines)
+
+
+async def run(args) -> Summary:
+    done = completed_ids(args.output, args.retry_failed)
+    pending = [(tid, messages) for tid, messages in read_transcripts(args.corpus) if tid not in done]
+    if args.limit:
+        pending = pending[:args.limit]
+    total = len(pending)
+    print(f"{len(done)} transcripts already scored, {total} to replay", file=sys.stderr)
+
+    summary = Summary()
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in pending:
+        queue.put_nowait(item)
+    finished = 0
+
+    with open(args.output, 'a', encoding='utf-8') as out:
+        async def worker():
+            nonlocal finished
+            while True:
+                try:
+                    transcript_id, messages = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    result = await replay(transcript_id, messages, args.use_cache)
+                except Exception as e:
+                    result = {'id': transcript_id, 'status': 'error', 'error': f"{type(e).__name__}: {str(e)}"}
+                # One line per transcript, flushed so an interrupted run loses nothing that finished
+                out.write(json.dumps(result, ensure_ascii=False) + '\n')
+                out.flush()
+                summary.add(result)
+                finished += 1
+                print(f"[{finished}/{total}] {transcript_id} {result['status']}"
+                      f"{' avg ' + str(result['average']) if result.get('average') is not None else ''}", file=sys.stderr)
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(max(1, args.concurrency))))
+        finally:
+            await close_async_http_client()
+    return summary
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Replay candidate transcripts and collect step-11 rubric scores.')
+    parser.add_argument('corpus', help='JSONL file with one transcript per line')
+    parser.add_argument('-o', '--output', default='scores.jsonl', help='JSONL results, appended to (default: %(default)s)')
+    parser.add_argument('--concurrency', type=int, default=8, help='interviews replayed at once (default: %(default)s)')
+    parser.add_argument('--retry-failed', action='store_true', help='replay transcripts whose earlier result was an error')
+    parser.add_argument('--limit', type=int, default=0, help='replay at most this many transcripts')
+    parser.add_argument('--use-cache', action='store_true', help='allow Solution Architect answers from the response cache')
+    args = parser.parse_args()
+
+    summary = asyncio.run(run(args))
+    print(summary.report(), file=sys.stderr)
+    return 1 if summary.statuses.get('error') else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())